@@ -0,0 +1,398 @@
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable
+
+import pytz
+
+from bank_registry import BankSource, load_banks
+from history_store import HistoryStore, HISTORY_DB_PATH
+from snapshot_writer import write_json_atomic
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+POLL_STATE_PATH = '.cache/poll_state.json'
+
+# How far back publish patterns are learned from
+HISTORY_WINDOW_DAYS = 28
+# With fewer changes than this a bank keeps the fixed schedule
+MIN_CHANGES_TO_LEARN = 3
+
+# Publish times are bucketed by Nepal time of day
+PUBLISH_BIN_MINUTES = 30
+BIN_SECONDS = PUBLISH_BIN_MINUTES * 60
+BINS_PER_DAY = 24 * 60 // PUBLISH_BIN_MINUTES
+# A bin plus its neighbours holding this share of a bank's changes is one
+# of its usual publish times, and is polled at the fastest rate
+USUAL_PUBLISH_SHARE = 0.25
+# Pseudo-count per bin, so a bank isn't assumed never to change at times
+# it simply hasn't yet
+BIN_PRIOR = 0.5
+
+MIN_POLL_SECONDS = 5 * 60
+# Same as FINGERPRINT_MAX_AGE_SECONDS, so quiet banks still get refreshed
+MAX_POLL_SECONDS = 6 * 60 * 60
+# Outside usual publish times, polls per expected change
+POLLS_PER_CHANGE = 6
+# Changes expected since the last poll times how long they'd stay unseen
+# if this poll were skipped; above this, poll anyway (e.g. before a bank's
+# quiet hours)
+MAX_STALE_CHANGE_SECONDS = 5 * 60
+
+# Page loads and Gemini extractions per Nepal day, across all banks
+DAILY_FETCH_BUDGET = 1500
+DAILY_LLM_BUDGET = 150
+# Weight of the latest extraction in a bank's share of Gemini extractions
+LLM_SHARE_SMOOTHING = 0.3
+
+
+def publish_bin(timestamp: float) -> int:
+    local = datetime.fromtimestamp(timestamp, NEPAL_TZ)
+    return (local.hour * 60 + local.minute) // PUBLISH_BIN_MINUTES
+
+
+def seconds_into_bin(timestamp: float) -> float:
+    local = datetime.fromtimestamp(timestamp, NEPAL_TZ)
+    return (local.minute % PUBLISH_BIN_MINUTES) * 60 + local.second + local.microsecond / 1e6
+
+
+def nepal_day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, NEPAL_TZ).strftime('%Y-%m-%d')
+
+
+def _bin_label(index: int) -> str:
+    minutes = index * PUBLISH_BIN_MINUTES
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class PublishProfile:
+    """
+    When one bank usually publishes new rates and how often, learned from
+    the times its rates changed in the history store.
+    """
+
+    def __init__(self, change_times: List[int], observed_seconds: float):
+        self.changes = len(change_times)
+        self.changes_per_day = self.changes / max(observed_seconds / 86400, 1)
+
+        counts = [0] * BINS_PER_DAY
+        for timestamp in change_times:
+            counts[publish_bin(timestamp)] += 1
+        total = self.changes + BIN_PRIOR * BINS_PER_DAY
+        self.bin_shares = [(count + BIN_PRIOR) / total for count in counts]
+        # A change is only seen at the next poll, so it may land a bin late
+        self.window_shares = [
+            (counts[index - 1] + counts[index] + counts[(index + 1) % BINS_PER_DAY]) / max(self.changes, 1)
+            for index in range(BINS_PER_DAY)
+        ]
+
+    def is_usual_publish_time(self, bin_index: int) -> bool:
+        return self.window_shares[bin_index] >= USUAL_PUBLISH_SHARE
+
+    def usual_publish_bins(self) -> List[int]:
+        return [index for index in range(BINS_PER_DAY) if self.is_usual_publish_time(index)]
+
+    def changes_per_second(self, bin_index: int) -> float:
+        return self.changes_per_day * self.bin_shares[bin_index] / BIN_SECONDS
+
+    def expected_changes(self, start: float, end: float) -> float:
+        """Changes expected between two times, going by the time of day."""
+        expected = 0.0
+        while start < end:
+            bin_end = min(end, start + BIN_SECONDS - seconds_into_bin(start))
+            expected += self.changes_per_second(publish_bin(start)) * (bin_end - start)
+            start = bin_end
+        return expected
+
+    def seconds_until_expected(self, start: float, changes: float, limit: float) -> float:
+        """Seconds from `start` until `changes` more changes are expected, at most `limit`."""
+        at = start
+        while changes > 0 and at - start < limit:
+            bin_end = at + BIN_SECONDS - seconds_into_bin(at)
+            rate = self.changes_per_second(publish_bin(at))
+            if rate * (bin_end - at) >= changes:
+                return min(limit, at + changes / rate - start)
+            changes -= rate * (bin_end - at)
+            at = bin_end
+        return min(limit, at - start)
+
+    def interval_seconds(self, bin_index: int) -> float:
+        """Typical seconds between polls in a bin, for projecting a day's polls."""
+        if self.is_usual_publish_time(bin_index):
+            return MIN_POLL_SECONDS
+        return min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, 1 / (self.changes_per_second(bin_index) * POLLS_PER_CHANGE)))
+
+
+def load_profiles(history_db_path: str = HISTORY_DB_PATH, now: Optional[float] = None) -> Dict[str, PublishProfile]:
+    """Profiles for every bank with at least MIN_CHANGES_TO_LEARN changes in the window."""
+    now = now or time.time()
+    start = int(now - HISTORY_WINDOW_DAYS * 86400)
+    with HistoryStore(history_db_path) as store:
+        change_times = store.change_times(start)
+        first_fetches = store.first_fetches()
+
+    profiles = {}
+    for bank_name, times in change_times.items():
+        if len(times) < MIN_CHANGES_TO_LEARN:
+            continue
+        observed_from = max(first_fetches.get(bank_name, start), start)
+        profiles[bank_name] = PublishProfile(times, now - observed_from)
+    return profiles
+
+
+class PollPlanner:
+    """
+    Decides which banks a scrape cycle should fetch. Banks are polled every
+    MIN_POLL_SECONDS around their usual publish times and less often the
+    rarer their changes are at that time of day; banks without enough
+    history fall back to `fallback_interval(now)`, the fixed schedule.
+
+    Page loads and Gemini extractions are counted per Nepal day. If the
+    rest of the day's polls would overrun either budget, intervals are
+    stretched to fit, Gemini-parsed banks more so (polling them less often
+    merges their changes into fewer extractions). Due banks are fetched
+    most overdue first. Poll times and counts are saved to `state_path`, so
+    one-shot runs from cron share the budget.
+    """
+
+    def __init__(
+        self,
+        profiles: Dict[str, PublishProfile],
+        state_path: str = POLL_STATE_PATH,
+        fetch_budget: int = DAILY_FETCH_BUDGET,
+        llm_budget: int = DAILY_LLM_BUDGET,
+        fallback_interval: Optional[Callable[[datetime], float]] = None,
+        history_db_path: Optional[str] = None,
+    ):
+        self.profiles = profiles
+        self.state_path = state_path
+        self.fetch_budget = fetch_budget
+        self.llm_budget = llm_budget
+        self.fallback_interval = fallback_interval or (lambda now: MIN_POLL_SECONDS)
+        self.history_db_path = history_db_path
+        self.state = self._load()
+        self._bank_names: List[str] = []
+
+    @classmethod
+    def from_history(cls, history_db_path: str = HISTORY_DB_PATH, **kwargs) -> 'PollPlanner':
+        """Learns profiles from `history_db_path`, and relearns them each new day."""
+        return cls(load_profiles(history_db_path), history_db_path=history_db_path, **kwargs)
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            state = None
+        if not isinstance(state, dict):
+            state = {}
+        state.setdefault('day', None)
+        state.setdefault('fetches', 0)
+        state.setdefault('llm_calls', 0)
+        state.setdefault('banks', {})
+        return state
+
+    def save(self):
+        write_json_atomic(self.state_path, self.state, indent=2, ensure_ascii=False)
+
+    def _roll_day(self, now: float):
+        day = nepal_day(now)
+        if self.state['day'] == day:
+            return
+        if self.state['day'] is not None and self.history_db_path:
+            self.profiles = load_profiles(self.history_db_path, now)
+            print(f"Relearned publish patterns for {len(self.profiles)} bank(s)")
+        self.state.update(day=day, fetches=0, llm_calls=0)
+
+    def _bank_state(self, bank_name: str) -> Dict[str, Any]:
+        return self.state['banks'].setdefault(bank_name, {'last_polled': None, 'failures': 0, 'llm_share': 0.0})
+
+    def base_interval(self, bank_name: str, at: float) -> float:
+        """Seconds between polls of `bank_name` at time `at`, before budget stretching."""
+        profile = self.profiles.get(bank_name)
+        if profile is None:
+            return self.fallback_interval(datetime.fromtimestamp(at, NEPAL_TZ))
+        return profile.interval_seconds(publish_bin(at))
+
+    def _rest_of_day(self, now: float) -> List[tuple]:
+        """(start, seconds) of each bin left today, the current one from `now`."""
+        midnight = datetime.fromtimestamp(now, NEPAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        spans = []
+        start = now
+        for index in range(publish_bin(now), BINS_PER_DAY):
+            end = midnight + (index + 1) * BIN_SECONDS
+            spans.append((start, end - start))
+            start = end
+        return spans
+
+    def stretch_factors(self, bank_names: List[str], now: float) -> Dict[str, float]:
+        """
+        How much each bank's interval is lengthened so the rest of today's
+        expected fetches and Gemini extractions fit what's left of the budgets.
+        """
+        spans = self._rest_of_day(now)
+        projected_fetches = 0.0
+        projected_llm = 0.0
+        for bank_name in bank_names:
+            projected_fetches += sum(seconds / self.base_interval(bank_name, start) for start, seconds in spans)
+            profile = self.profiles.get(bank_name)
+            if profile is None:
+                # Unknown banks are assumed to publish once a day
+                changes_left = 1.0
+            else:
+                changes_left = profile.changes_per_day * sum(profile.bin_shares[publish_bin(start)] * seconds / BIN_SECONDS for start, seconds in spans)
+            projected_llm += changes_left * self._bank_state(bank_name)['llm_share']
+
+        fetch_stretch = max(1.0, projected_fetches / max(self.fetch_budget - self.state['fetches'], 1))
+        llm_stretch = max(1.0, projected_llm / max(self.llm_budget - self.state['llm_calls'], 1))
+        return {
+            bank_name: fetch_stretch * (1 + (llm_stretch - 1) * self._bank_state(bank_name)['llm_share'])
+            for bank_name in bank_names
+        }
+
+    def _due_in(self, bank_name: str, now: float, stretch: float) -> float:
+        """
+        Seconds until the bank is due, zero or less if it already is. A
+        learned bank is due once 1/POLLS_PER_CHANGE changes are expected
+        since its last poll, or sooner if waiting for that would leave the
+        changes expected so far unseen for long.
+        """
+        bank_state = self._bank_state(bank_name)
+        last_polled = bank_state['last_polled']
+        if last_polled is None:
+            return 0
+        elapsed = now - last_polled
+        # Retry failures sooner, backing off to the normal schedule
+        retry_in = MIN_POLL_SECONDS * 2 ** (bank_state['failures'] - 1) - elapsed if bank_state['failures'] else MAX_POLL_SECONDS
+
+        profile = self.profiles.get(bank_name)
+        if profile is None:
+            due_in = self.fallback_interval(datetime.fromtimestamp(now, NEPAL_TZ)) * stretch - elapsed
+        elif elapsed < MIN_POLL_SECONDS * stretch or profile.is_usual_publish_time(publish_bin(now)):
+            due_in = MIN_POLL_SECONDS * stretch - elapsed
+        elif elapsed >= MAX_POLL_SECONDS * stretch:
+            due_in = 0
+        else:
+            unseen = profile.expected_changes(last_polled, now)
+            due_in = profile.seconds_until_expected(now, stretch / POLLS_PER_CHANGE - unseen, MAX_POLL_SECONDS * stretch - elapsed)
+            if unseen * due_in >= MAX_STALE_CHANGE_SECONDS * stretch:
+                due_in = 0
+        return min(due_in, retry_in)
+
+    def _llm_budget_used_up(self) -> bool:
+        return self.state['llm_calls'] >= self.llm_budget
+
+    def _pollable(self, bank_name: str) -> bool:
+        # Once the Gemini budget is gone, only banks the rule parser handles are polled
+        return not self._llm_budget_used_up() or self._bank_state(bank_name)['llm_share'] < 0.5
+
+    def plan(self, banks: List[BankSource], now: Optional[float] = None) -> List[BankSource]:
+        """The banks due this cycle, most overdue first, within the day's budgets."""
+        now = now or time.time()
+        self._roll_day(now)
+        self._bank_names = [bank.name for bank in banks]
+
+        fetches_left = self.fetch_budget - self.state['fetches']
+        if fetches_left <= 0:
+            print(f"Daily fetch budget of {self.fetch_budget} used up, waiting for tomorrow")
+            return []
+
+        stretch = self.stretch_factors(self._bank_names, now)
+        due = []
+        for bank in banks:
+            if not self._pollable(bank.name):
+                continue
+            due_in = self._due_in(bank.name, now, stretch[bank.name])
+            if due_in <= 0:
+                due.append((due_in, bank))
+        due.sort(key=lambda item: item[0])
+
+        planned = [bank for _, bank in due[:fetches_left]]
+        skipped = len(banks) - len(planned)
+        print(f"Polling {len(planned)} of {len(banks)} banks ({skipped} not due), "
+              f"{self.state['fetches']}/{self.fetch_budget} fetches and {self.state['llm_calls']}/{self.llm_budget} Gemini extractions used today")
+        if self._llm_budget_used_up():
+            print("Daily Gemini budget used up, only polling banks the rule parser handles")
+        return planned
+
+    def record(self, statuses: List[Dict[str, Any]], run_report=None, now: Optional[float] = None):
+        """
+        Counts a cycle's fetches against the budgets. With the cycle's
+        RunReport, banks that went to Gemini are counted too.
+        """
+        now = now or time.time()
+        self._roll_day(now)
+        for status in statuses:
+            bank_state = self._bank_state(status['bank'])
+            bank_state['last_polled'] = now
+            self.state['fetches'] += status['attempts']
+            if status['status'] == 'failed':
+                bank_state['failures'] += 1
+                continue
+            bank_state['failures'] = 0
+
+            trace = run_report.traces.get(status['bank']) if run_report is not None else None
+            if status['status'] != 'ok' or trace is None:
+                continue
+            # Banks the rule parser couldn't handle, unless Gemini's answer was cached
+            used_llm = bool(trace.values.get('llm_requested'))
+            self.state['llm_calls'] += used_llm
+            bank_state['llm_share'] = round(
+                (1 - LLM_SHARE_SMOOTHING) * bank_state['llm_share'] + LLM_SHARE_SMOOTHING * used_llm, 3
+            )
+
+    def next_wake_seconds(self, now: Optional[float] = None) -> float:
+        """
+        Seconds until the next bank is due, but no later than the next bin
+        boundary, where a usual publish time may start. With the fetch
+        budget used up, until it resets at midnight.
+        """
+        now = now or time.time()
+        self._roll_day(now)
+        rest_of_day = self._rest_of_day(now)
+        if self.state['fetches'] >= self.fetch_budget:
+            return max(1, sum(seconds for _, seconds in rest_of_day))
+
+        stretch = self.stretch_factors(self._bank_names, now)
+        until_bin = rest_of_day[0][1]
+        names = [name for name in self._bank_names if self._pollable(name)]
+        until_due = min((self._due_in(name, now, stretch[name]) for name in names), default=until_bin)
+        return max(1, min(until_due, until_bin))
+
+    def polls_per_day(self, bank_name: str, day_start: float) -> float:
+        """Polls a full day would take at the base interval, for comparing schedules."""
+        return sum(BIN_SECONDS / self.base_interval(bank_name, day_start + index * BIN_SECONDS) for index in range(BINS_PER_DAY))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show each bank's learned publish pattern and polling schedule")
+    parser.add_argument('--db', default=HISTORY_DB_PATH)
+    parser.add_argument('--banks', default="nepal_banks.json", help="Path to the bank config")
+    args = parser.parse_args()
+
+    banks = load_banks(args.banks) or []
+    planner = PollPlanner.from_history(args.db)
+    local = datetime.now(NEPAL_TZ)
+    day_start = local.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    adaptive_total = 0.0
+    learned = 0
+    for bank in banks:
+        profile = planner.profiles.get(bank.name)
+        polls = planner.polls_per_day(bank.name, day_start)
+        adaptive_total += polls
+        if profile is None:
+            print(f"  {bank.name}: not enough history, fixed schedule ({polls:.0f} polls/day)")
+            continue
+        learned += 1
+        usual = ', '.join(_bin_label(index) for index in profile.usual_publish_bins()) or 'none'
+        print(f"  {bank.name}: {profile.changes_per_day:.1f} changes/day, usually around {usual} ({polls:.0f} polls/day)")
+
+    fixed_total = len(banks) * 86400 / MIN_POLL_SECONDS
+    print(f"\n{learned} of {len(banks)} banks learned; about {adaptive_total:.0f} polls/day, "
+          f"against {fixed_total:.0f} polling every bank every {MIN_POLL_SECONDS // 60} minutes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import argparse
+import json
+import os
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urljoin, urlparse
+
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+
+from rule_parser import HTML_PARSER
+from run_report import span
+from scrape_scheduler import API_RESPONSE_TIMEOUT_MS
+
+# How a bank's data is fetched: call its JSON API directly, plain GET and
+# parse the HTML, or load the page in Playwright
+FETCH_API = 'api'
+FETCH_HTTP = 'http'
+FETCH_BROWSER = 'browser'
+FETCH_STRATEGIES = (FETCH_API, FETCH_HTTP, FETCH_BROWSER)
+
+DATE_PLACEHOLDER = 'yyyy-mm-dd'
+
+# Exactly one of these says where a bank's rates are
+TARGET_KEYS = ('table', 'query_selector', 'api', 'select_link')
+KNOWN_KEYS = frozenset(TARGET_KEYS + (
+    'name', 'class', 'forex_page', 'fetch', 'table_index', 'handle_date',
+    'anti_robot', 'parse_whole_page', 'allow_domains', 'allow_resource_types',
+))
+FLAG_KEYS = ('table', 'handle_date', 'anti_robot', 'parse_whole_page')
+
+
+class ElementNotFound(Exception):
+    """The configured table/selector isn't in the server-rendered HTML."""
+
+
+class BankConfigError(Exception):
+    """The bank config has problems; `issues` lists all of them."""
+
+    def __init__(self, issues: List[str]):
+        super().__init__(f"{len(issues)} problem(s) in the bank config")
+        self.issues = issues
+
+
+class SourceTarget:
+    """
+    Where a bank's rates are: read from a live page with Playwright, or
+    selected from server-rendered HTML.
+    """
+
+    __slots__ = ()
+
+    # What the date fallback waits for on each candidate date
+    probe_selector = 'css=table'
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    async def read(self, page) -> Tuple[Optional[str], Any]:
+        """(html, json_data) from a page that has been navigated to the forex page."""
+        raise NotImplementedError
+
+    async def wait_until_ready(self, page, timeout_ms: int):
+        """Waits for the rates to be on the page, e.g. once an anti-robot challenge has reloaded it."""
+        await page.locator(self.probe_selector).first.wait_for(state='attached', timeout=timeout_ms)
+
+    def select(self, html: str) -> str:
+        raise ElementNotFound(f"{self.describe()} can't be read from static HTML")
+
+    def find_link(self, html: str, base_url: str) -> Optional[str]:
+        """The page the rates are on, if they're one link away from the forex page."""
+        return None
+
+
+class TableTarget(SourceTarget):
+    __slots__ = ('index',)
+
+    def __init__(self, index: int = 0):
+        self.index = index
+
+    def describe(self) -> str:
+        return f"table[{self.index}]"
+
+    async def read(self, page):
+        # The locator waits for the table, then reads it
+        table = page.locator('css=table').nth(self.index)
+        with span('extract_html'):
+            return await table.evaluate('el => el.outerHTML'), None
+
+    def select(self, html: str) -> str:
+        # Only table subtrees are built, which roughly halves parsing on menu-heavy bank pages
+        tables = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer('table')).find_all('table')
+        if len(tables) <= self.index:
+            raise ElementNotFound(f"Found {len(tables)} table(s), expected index {self.index}")
+        return str(tables[self.index])
+
+
+class SelectorTarget(SourceTarget):
+    __slots__ = ('selector', 'compiled')
+
+    def __init__(self, selector: str):
+        self.selector = selector
+        self.compiled = soupsieve.compile(selector)
+
+    @property
+    def probe_selector(self) -> str:
+        return self.selector
+
+    def describe(self) -> str:
+        return self.selector
+
+    async def read(self, page):
+        with span('wait_for_selector'):
+            element = await page.wait_for_selector(self.selector, state='attached')
+        if not element:
+            raise Exception(f"Could not find {self.selector} in {page.url}")
+        with span('extract_html'):
+            return await element.evaluate('el => el.outerHTML'), None
+
+    def select(self, html: str) -> str:
+        element = self.compiled.select_one(BeautifulSoup(html, HTML_PARSER))
+        if element is None:
+            raise ElementNotFound(f"Could not find {self.selector}")
+        return str(element)
+
+
+class ApiTarget(SourceTarget):
+    __slots__ = ('url',)
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def describe(self) -> str:
+        return self.url
+
+    async def read(self, page):
+        # The page picks its own date and paging, so only match the URL up to the date
+        api = self.url.split(DATE_PLACEHOLDER, 1)[0]
+        with span('wait_for_response'):
+            response = await page.wait_for_event("response", lambda r: api in r.url, timeout=API_RESPONSE_TIMEOUT_MS)
+        with span('extract_json'):
+            return None, await response.json()
+
+    async def wait_until_ready(self, page, timeout_ms: int):
+        # read() waits for the API response itself
+        return
+
+
+class LinkTarget(SourceTarget):
+    """Rates on the page behind a link on the forex page, e.g. the latest of a list of dates."""
+
+    __slots__ = ('link_selector', 'compiled', 'table')
+
+    def __init__(self, link_selector: str, table_index: int = 0):
+        self.link_selector = link_selector
+        self.compiled = soupsieve.compile(link_selector)
+        self.table = TableTarget(table_index)
+
+    def describe(self) -> str:
+        return f"{self.link_selector} link, {self.table.describe()}"
+
+    async def read(self, page):
+        with span('wait_for_selector'):
+            link = await page.query_selector(self.link_selector)
+            if not link:
+                raise Exception('Could not find link')
+            await link.click()
+            await page.wait_for_load_state('domcontentloaded')
+        return await self.table.read(page)
+
+    def find_link(self, html: str, base_url: str) -> str:
+        link = self.compiled.select_one(BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer('a')))
+        if link is None or not link.get('href'):
+            raise ElementNotFound('Could not find link')
+        return urljoin(base_url, link['href'])
+
+    def select(self, html: str) -> str:
+        return self.table.select(html)
+
+
+class PageTarget(SourceTarget):
+    """The whole rendered page, for banks whose rates aren't in one element (parse_whole_page)."""
+
+    __slots__ = ()
+
+    probe_selector = 'css=body'
+
+    def describe(self) -> str:
+        return 'whole page'
+
+    async def read(self, page):
+        with span('extract_html'):
+            return await page.content(), None
+
+    def select(self, html: str) -> str:
+        return html
+
+
+class BankSource:
+    """One bank from the config, validated, with its fetch strategy and target resolved."""
+
+    __slots__ = (
+        'name', 'bank_class', 'forex_page', 'fetch', 'target', 'api',
+        'handle_date', 'anti_robot', 'parse_whole_page', 'allow_domains', 'allow_resource_types',
+    )
+
+    def __init__(self, config: Dict[str, Any], target: Optional[SourceTarget]):
+        self.name: str = config['name']
+        self.bank_class: Optional[str] = config.get('class')
+        self.forex_page: str = config['forex_page']
+        self.api: Optional[str] = config.get('api')
+        self.fetch: str = config.get('fetch') or (FETCH_API if self.api else FETCH_BROWSER)
+        self.target = target
+        self.handle_date: bool = config.get('handle_date', False)
+        self.anti_robot: bool = config.get('anti_robot', False)
+        self.parse_whole_page: bool = config.get('parse_whole_page', False)
+        self.allow_domains: Tuple[str, ...] = tuple(config.get('allow_domains', ()))
+        self.allow_resource_types: Tuple[str, ...] = tuple(config.get('allow_resource_types', ()))
+
+    def __repr__(self):
+        return f"BankSource({self.name!r}, fetch={self.fetch!r}, target={self.target.describe() if self.target else None!r})"
+
+
+def _is_url(value: Any) -> bool:
+    if not isinstance(value, str):
+        return False
+    parsed = urlparse(value)
+    return parsed.scheme in ('http', 'https') and bool(parsed.netloc)
+
+
+def _is_index(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _compile_selector(config: Dict[str, Any], key: str, issues: List[str]) -> bool:
+    value = config[key]
+    if not isinstance(value, str) or not value.strip():
+        issues.append(f'"{key}" must be a CSS selector')
+        return False
+    try:
+        soupsieve.compile(value)
+    except soupsieve.SelectorSyntaxError as e:
+        # It's used on static HTML too, so Playwright-only syntax won't do
+        issues.append(f'"{key}" {value!r} is not plain CSS: {str(e).splitlines()[0]}')
+        return False
+    return True
+
+
+def check_bank_config(config: Any) -> List[str]:
+    """Every problem with one bank's config entry; empty if it's valid."""
+    if not isinstance(config, dict):
+        return ['entry is not an object']
+
+    issues = []
+    for key in sorted(set(config) - KNOWN_KEYS):
+        issues.append(f'unknown key "{key}"')
+    if not isinstance(config.get('name'), str) or not config['name'].strip():
+        issues.append('"name" is missing')
+    if 'class' in config and not isinstance(config['class'], str):
+        issues.append('"class" must be a string')
+    if not _is_url(config.get('forex_page')):
+        issues.append('"forex_page" must be an http(s) URL')
+    if 'api' in config and not _is_url(config['api']):
+        issues.append('"api" must be an http(s) URL')
+    for key in FLAG_KEYS:
+        if key in config and not isinstance(config[key], bool):
+            issues.append(f'"{key}" must be true or false')
+    if config.get('table') is False:
+        issues.append('"table" must be true or left out')
+    for key in ('allow_domains', 'allow_resource_types'):
+        value = config.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            issues.append(f'"{key}" must be a list of strings')
+    for key in ('query_selector', 'select_link'):
+        if key in config:
+            _compile_selector(config, key, issues)
+
+    targets = [key for key in TARGET_KEYS if config.get(key) not in (None, False)]
+    if len(targets) > 1:
+        issues.append(f'only one of {", ".join(TARGET_KEYS)} may be set, found {", ".join(targets)}')
+    elif not targets and not config.get('parse_whole_page'):
+        issues.append(f'one of {", ".join(TARGET_KEYS)} must be set')
+    if 'table_index' in config:
+        if not _is_index(config['table_index']):
+            issues.append('"table_index" must be a non-negative integer')
+        if not config.get('table') and 'select_link' not in config:
+            issues.append('"table_index" only applies with "table" or "select_link"')
+
+    fetch = config.get('fetch')
+    if fetch is not None and fetch not in FETCH_STRATEGIES:
+        issues.append(f'"fetch" must be one of {", ".join(FETCH_STRATEGIES)}')
+    elif fetch == FETCH_API and 'api' not in config:
+        issues.append('"fetch": "api" needs an "api" URL')
+    elif fetch == FETCH_HTTP and 'api' in config:
+        issues.append('"fetch": "http" can\'t read an "api" target, use "api" or "browser"')
+    if config.get('handle_date') and DATE_PLACEHOLDER not in str(config.get('forex_page')):
+        issues.append(f'"handle_date" needs {DATE_PLACEHOLDER} in "forex_page"')
+    return issues
+
+
+def compile_target(config: Dict[str, Any]) -> Optional[SourceTarget]:
+    if config.get('table'):
+        return TableTarget(config.get('table_index', 0))
+    if 'query_selector' in config:
+        return SelectorTarget(config['query_selector'])
+    if 'api' in config:
+        return ApiTarget(config['api'])
+    if 'select_link' in config:
+        return LinkTarget(config['select_link'], config.get('table_index', 0))
+    if config.get('parse_whole_page'):
+        return PageTarget()
+    return None
+
+
+def compile_bank(config: Dict[str, Any]) -> BankSource:
+    """Validates and compiles one bank's config entry. Raises BankConfigError."""
+    issues = check_bank_config(config)
+    if issues:
+        name = config.get('name') if isinstance(config, dict) else None
+        raise BankConfigError([f"{name or 'bank'}: {issue}" for issue in issues])
+    return BankSource(config, compile_target(config))
+
+
+def compile_banks(configs: Any) -> List[BankSource]:
+    """
+    Validates and compiles every entry, collecting all problems (including
+    duplicate names) into one BankConfigError.
+    """
+    if not isinstance(configs, list) or not configs:
+        raise BankConfigError(['"banks" must be a non-empty list'])
+
+    banks = []
+    issues = []
+    seen = set()
+    for index, config in enumerate(configs):
+        name = config.get('name') if isinstance(config, dict) else None
+        label = f"banks[{index}] ({name})" if name else f"banks[{index}]"
+        entry_issues = check_bank_config(config)
+        if name in seen:
+            entry_issues.append('duplicate name')
+        seen.add(name)
+        if entry_issues:
+            issues.extend(f"{label}: {issue}" for issue in entry_issues)
+            continue
+        banks.append(BankSource(config, compile_target(config)))
+    if issues:
+        raise BankConfigError(issues)
+    return banks
+
+
+# Path -> (mtime, banks), so the daemon only recompiles the config after an edit
+_registry_cache: Dict[str, Tuple[float, List[BankSource]]] = {}
+
+
+def load_banks(json_file_path) -> Optional[List[BankSource]]:
+    """
+    Loads and compiles the bank list from nepal_banks.json. Returns None,
+    after printing every problem, if the file is missing or invalid.
+    """
+    try:
+        mtime = os.stat(json_file_path).st_mtime
+    except FileNotFoundError:
+        print(f"Error: File '{json_file_path}' not found.")
+        return None
+    cached = _registry_cache.get(json_file_path)
+    if cached is not None and cached[0] == mtime:
+        return list(cached[1])
+
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except json.JSONDecodeError:
+        print(f"Error: Invalid JSON in file '{json_file_path}'.")
+        return None
+
+    try:
+        banks = compile_banks(data.get('banks') if isinstance(data, dict) else None)
+    except BankConfigError as e:
+        print(f"Error: {e} '{json_file_path}':")
+        for issue in e.issues:
+            print(f"  - {issue}")
+        return None
+
+    _registry_cache[json_file_path] = (mtime, banks)
+    return list(banks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a bank config and list each bank's compiled source")
+    parser.add_argument('banks', nargs='?', default="nepal_banks.json", help="Path to the bank config")
+    args = parser.parse_args()
+
+    banks = load_banks(args.banks)
+    if banks is None:
+        raise SystemExit(1)
+    for bank in banks:
+        flags = [flag for flag in ('handle_date', 'anti_robot', 'parse_whole_page') if getattr(bank, flag)]
+        target = bank.target.describe() if bank.target else 'whole page'
+        print(f"  {bank.fetch:7} {bank.name}: {target}" + (f" ({', '.join(flags)})" if flags else ''))
+    print(f"{len(banks)} bank(s) OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+from urllib.parse import urlparse
+
+from bank_registry import BankSource
+from run_report import span
+from scrape_scheduler import NAVIGATION_TIMEOUT_MS, DATE_PROBE_TIMEOUT_MS, CHALLENGE_TIMEOUT_MS, DOMAIN_MIN_INTERVAL_SECONDS, queue_wait
+from snapshot_writer import write_json_atomic
+from http_fetcher import get_nepali_date, order_candidate_dates, remember_good_date, NO_RECORD_TEXT, RATE_TEXT_PATTERN
+
+# Several banks share a host (e.g. a CDN or a bank group's site)
+PAGES_PER_ORIGIN = 2
+
+# Cookies and local storage of warm sessions, one Playwright storage
+# state file per domain, shared by every tool and run
+BROWSER_STATE_DIR = '.cache/browser_state'
+
+
+class ChallengeNotPassed(Exception):
+    """An anti-robot page never got past its challenge to the rates."""
+
+
+def origin_of(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+
+def domain_of(url: str) -> str:
+    return (urlparse(url).hostname or '').lower()
+
+
+def _session_key(domain: str) -> str:
+    return f"session:{domain}"
+
+
+class DomainRateLimiter:
+    """
+    Spaces requests to one domain at least `min_interval` seconds apart.
+    Each caller reserves the next free time before sleeping, so waiters
+    queue in order without holding a lock, and other domains never wait.
+    """
+
+    def __init__(self, min_interval: float = DOMAIN_MIN_INTERVAL_SECONDS):
+        self.min_interval = min_interval
+        self._next_allowed: Dict[str, float] = {}
+
+    async def wait(self, domain: str) -> float:
+        """Waits for `domain`'s turn. Returns how long that took."""
+        now = time.monotonic()
+        start = max(now, self._next_allowed.get(domain, now))
+        self._next_allowed[domain] = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+        return start - now
+
+
+class BrowserPool:
+    """
+    One Playwright browser shared by all pages of a tool run (or, for the
+    daemon, of the whole process). The browser is launched the first time
+    a page is needed, contexts are created once per key and reused, and
+    page() hands out tabs with at most `per_origin` loading per origin and
+    `max_pages` overall. Warm sessions for anti-robot sites are kept in
+    `state_dir` across runs.
+    """
+
+    def __init__(
+        self,
+        headless=False,
+        browser_type='chromium',
+        launch_options: Optional[Dict[str, Any]] = None,
+        context_options: Optional[Dict[str, Any]] = None,
+        per_origin: int = PAGES_PER_ORIGIN,
+        max_pages: Optional[int] = None,
+        state_dir: Optional[str] = BROWSER_STATE_DIR,
+        min_domain_interval: float = DOMAIN_MIN_INTERVAL_SECONDS,
+    ):
+        self.headless = headless
+        self.browser_type = browser_type
+        self.launch_options = launch_options or {}
+        self.context_options = context_options or {}
+        self.per_origin = max(1, per_origin)
+        self._page_slots = asyncio.Semaphore(max_pages) if max_pages else None
+        self._origin_slots: Dict[str, asyncio.Semaphore] = {}
+        self.state_dir = state_dir
+        self._domain_limiter = DomainRateLimiter(min_domain_interval)
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._contexts: Dict[str, Any] = {}
+
+    @property
+    def launched(self):
+        return self._browser is not None
+
+    async def get_context(self, key='default', session_domain: Optional[str] = None):
+        async with self._lock:
+            if self._browser is not None and not self._browser.is_connected():
+                print("Browser disconnected, relaunching...")
+                await self._shutdown()
+            if self._browser is None:
+                print("Launching browser...")
+                # Imported on first launch, runs that stay on HTTP never load Playwright
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+                try:
+                    launcher = getattr(self._playwright, self.browser_type)
+                    self._browser = await launcher.launch(headless=self.headless, **self.launch_options)
+                except Exception:
+                    await self._shutdown()
+                    raise
+            if key not in self._contexts:
+                self._contexts[key] = await self._new_context(session_domain)
+            return self._contexts[key]
+
+    def _session_path(self, domain: str) -> Optional[str]:
+        return os.path.join(self.state_dir, f"{domain}.json") if self.state_dir else None
+
+    async def _new_context(self, session_domain: Optional[str]):
+        path = self._session_path(session_domain) if session_domain else None
+        if path and os.path.exists(path):
+            print(f"Reusing the saved browser session for {session_domain}")
+            try:
+                return await self._browser.new_context(storage_state=path, **self.context_options)
+            except Exception as e:
+                print(f"Could not restore the session for {session_domain} ({e}), starting a new one")
+                os.remove(path)
+        return await self._browser.new_context(**self.context_options)
+
+    async def save_session(self, domain: str):
+        """Saves a warm session's cookies and local storage for later runs."""
+        context = self._contexts.get(_session_key(domain))
+        path = self._session_path(domain)
+        if context is None or path is None:
+            return
+        state = await context.storage_state()
+        # A passed challenge's cookies are as good as a login: owner-only
+        write_json_atomic(path, state, mode=0o600)
+
+    async def forget_session(self, domain: str):
+        """Drops a session the site no longer accepts, so the next attempt starts clean."""
+        async with self._lock:
+            context = self._contexts.pop(_session_key(domain), None)
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        path = self._session_path(domain)
+        if path and os.path.exists(path):
+            os.remove(path)
+            print(f"Discarded the saved browser session for {domain}")
+
+    @asynccontextmanager
+    async def _slot(self, url: str):
+        origin = self._origin_slots.setdefault(origin_of(url), asyncio.Semaphore(self.per_origin))
+        if self._page_slots is None:
+            async with origin:
+                yield
+        else:
+            async with self._page_slots, origin:
+                yield
+
+    async def take_domain_turn(self, url: str):
+        """
+        Waits for the url's domain's turn to load a page. Callers that hold
+        their own slots (e.g. the scheduler's browser slot) take the turn
+        before them and pass `domain_turn_taken` to page().
+        """
+        domain = domain_of(url)
+        with queue_wait():
+            waited = await self._domain_limiter.wait(domain)
+        if waited:
+            print(f"Waited {waited:.1f}s for {domain}'s turn")
+
+    @asynccontextmanager
+    async def page(self, url: str, keep_open=False, context_key='default', warm_session=False, domain_turn_taken=False):
+        """
+        Yields a new tab for loading `url`, holding its origin's slot until
+        the block exits. The tab is closed then unless `keep_open` is set,
+        e.g. for tools that leave pages up for a person to look at.
+
+        With `warm_session` (anti-robot banks), the tab opens in the url's
+        domain's own context, started from the session an earlier run
+        saved. Unless `domain_turn_taken`, it first waits for the domain's
+        turn, before taking any slot, so the wait doesn't block other
+        banks. The session is saved again when the block succeeds, so a
+        challenge passed once isn't paid for on every poll, and dropped on
+        ChallengeNotPassed.
+        """
+        domain = domain_of(url)
+        if warm_session and not domain_turn_taken:
+            await self.take_domain_turn(url)
+        async with self._slot(url):
+            if warm_session:
+                context = await self.get_context(_session_key(domain), session_domain=domain)
+            else:
+                context = await self.get_context(context_key)
+            page = await context.new_page()
+            try:
+                yield page
+            except BaseException as e:
+                if not keep_open:
+                    await page.close()
+                if warm_session and isinstance(e, ChallengeNotPassed):
+                    await self.forget_session(domain)
+                raise
+            if warm_session:
+                await self.save_session(domain)
+            if not keep_open:
+                await page.close()
+
+    async def _shutdown(self):
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._playwright = None
+        self._browser = None
+        self._contexts = {}
+
+    async def close(self):
+        async with self._lock:
+            await self._shutdown()
+
+
+async def load_with_nepali_date(base_url, page, bank: Optional[BankSource] = None):
+    """
+    Loads the newest date that has rates. Each date is probed by racing
+    the rate table against the 'No record found.' marker, so a hit returns
+    as soon as the page renders instead of after a fixed wait.
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    bank_name = bank.name if bank else base_url
+    selector = bank.target.probe_selector if bank and bank.target else 'css=table'
+    dates = order_candidate_dates(bank_name, [get_nepali_date(i) for i in range(5)])
+
+    for nepali_date in dates:
+        url = re.sub(r"yyyy-mm-dd", nepali_date, base_url)
+        print(f"Trying URL: {url}")
+        await page.goto(url, wait_until='domcontentloaded', timeout=NAVIGATION_TIMEOUT_MS)
+
+        # An empty table can hold the marker, so only a table with rates in it counts
+        table = page.locator(selector).filter(has_text=RATE_TEXT_PATTERN)
+        no_record = page.get_by_text(NO_RECORD_TEXT)
+        try:
+            await table.or_(no_record).first.wait_for(state='attached', timeout=DATE_PROBE_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            # Neither showed up; let the extraction step report what's missing
+            print(f"Neither a table nor '{NO_RECORD_TEXT}' found for date {nepali_date}")
+            return
+
+        if await no_record.count() > 0:
+            print(f"❌ No table for date {nepali_date}, trying previous day...")
+            continue
+
+        print(f"✅ Table found for date {nepali_date}")
+        remember_good_date(bank_name, nepali_date)
+        return
+
+
+async def wait_past_challenge(bank: BankSource, page):
+    """
+    Anti-robot sites answer a new visitor with a challenge page that sets
+    a cookie and reloads into the real one. Waits for the bank's rates to
+    show up; in a warm session they're there straight away.
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    try:
+        with span('challenge'):
+            await bank.target.wait_until_ready(page, CHALLENGE_TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        raise ChallengeNotPassed(f"Still on the anti-robot challenge after {CHALLENGE_TIMEOUT_MS / 1000:.0f}s") from None
+
+
+async def fetch_bank_content(bank: BankSource, page):
+    """Navigate to a bank's forex page and pull out its table HTML or API JSON"""
+    # Navigate to the forex page
+    forex_page = bank.forex_page
+    print(f"Opening {bank.name} - {forex_page}")
+    with span('navigate'):
+        if bank.handle_date:
+            await load_with_nepali_date(forex_page, page, bank)
+        else:
+            await page.goto(forex_page, wait_until='domcontentloaded', timeout=NAVIGATION_TIMEOUT_MS)
+
+    if bank.anti_robot:
+        await wait_past_challenge(bank, page)
+
+    # Where the rates are, and how to read them, was resolved when the config was loaded
+    return await bank.target.read(page)
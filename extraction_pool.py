@@ -0,0 +1,85 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, Callable
+
+from rule_parser import extract_rates, RULE_PARSER_MIN_CONFIDENCE
+from html_compactor import compact_html, compact_json, payload_report
+
+
+def default_worker_count() -> int:
+    return min(4, os.cpu_count() or 1)
+
+
+def extract_payload(html: Optional[str] = None, json_data: Any = None) -> Dict[str, Any]:
+    """
+    The CPU-bound part of scraping one bank: rule parsing and, if that isn't
+    confident enough, building the compact LLM payload. Runs in a worker
+    process, so it takes and returns plain picklable data and reports its
+    own stage timings.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    output, confidence = extract_rates(html=html, json_data=json_data)
+    timings['rule_parse'] = time.perf_counter() - started
+
+    result = {'output': output, 'confidence': confidence, 'bank_data': None, 'payload': None, 'timings': timings}
+    if output is not None and confidence >= RULE_PARSER_MIN_CONFIDENCE:
+        return result
+
+    started = time.perf_counter()
+    if html is not None:
+        raw_data = html
+        bank_data = compact_html(html)
+    else:
+        raw_data = json.dumps(json_data, indent=2)
+        bank_data = compact_json(json_data)
+    timings['clean'] = time.perf_counter() - started
+
+    result['output'] = None
+    result['bank_data'] = bank_data
+    result['payload'] = payload_report(raw_data, bank_data)
+    return result
+
+
+class ExtractionPool:
+    """
+    Runs extract_payload() on a pool of worker processes so parsing never
+    blocks the event loop that drives the browser and HTTP fetches.
+
+    At most `max_pending` payloads are in flight; further submissions wait,
+    so a burst of fetched pages can't pile up unbounded in memory. With
+    `workers=0` extraction runs in a thread of this process instead.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = default_worker_count() if workers is None else max(0, workers)
+        self.max_pending = max_pending or max(1, self.workers) * 2
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if self.workers:
+            # spawn: forking a process that runs an event loop and browser threads isn't safe
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def extract(self, html: Optional[str] = None, json_data: Any = None) -> Dict[str, Any]:
+        return await self.run(extract_payload, html, json_data)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs any other parse in the pool, e.g. selecting a bank's table from
+        a whole server-rendered page. `func` and `args` must be picklable.
+        """
+        async with self._slots:
+            if self._executor is None:
+                return await asyncio.to_thread(func, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+from snapshot_writer import write_json_atomic
+
+FINGERPRINT_PATH = '.cache/fingerprints.json'
+
+# Re-extract unchanged banks every so often anyway, so their
+# fetch_datetime_utc in current_rate.json doesn't go stale forever
+FINGERPRINT_MAX_AGE_SECONDS = 6 * 60 * 60
+
+
+def fingerprint_content(html: Optional[str] = None, json_data: Any = None) -> str:
+    """sha256 of the raw table outerHTML, or of the API JSON with sorted keys."""
+    if html is not None:
+        payload = html
+    else:
+        payload = json.dumps(json_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def format_timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class SourceFingerprints:
+    """
+    Remembers what each bank's source looked like the last time it was
+    extracted successfully: a content hash, plus the ETag/Last-Modified
+    validators for API banks. Kept in memory for the daemon and saved to
+    disk so one-shot runs benefit too.
+    """
+
+    def __init__(self, path: str = FINGERPRINT_PATH, max_age_seconds: float = FINGERPRINT_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self):
+        write_json_atomic(self.path, self._entries)
+
+    def _fresh_entry(self, bank_name: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(bank_name)
+        if entry is None:
+            return None
+        if time.time() - entry.get('extracted_at', 0) > self.max_age_seconds:
+            return None
+        return entry
+
+    def validators(self, bank_name: str, url: str) -> Dict[str, str]:
+        """Conditional request headers for `url`, if we have a fresh response for it."""
+        entry = self._fresh_entry(bank_name)
+        if entry is None or entry.get('url') != url:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def unchanged_since(self, bank_name: str, fingerprint: Optional[str] = None) -> Optional[str]:
+        """
+        Returns when the bank's source was first seen in its current state,
+        or None if it changed (or is due a refresh). Without a fingerprint
+        the caller already knows it's unchanged (HTTP 304).
+        """
+        entry = self._fresh_entry(bank_name)
+        if entry is None:
+            return None
+        if fingerprint is not None and entry.get('fingerprint') != fingerprint:
+            return None
+        return format_timestamp(entry['unchanged_since'])
+
+    def unchanged_page_since(self, bank_name: str, page_hash: str) -> Optional[str]:
+        """
+        Like unchanged_since(), but for the whole fetched page, so a
+        byte-identical page can be skipped before it's even parsed.
+        """
+        entry = self._fresh_entry(bank_name)
+        if entry is None or entry.get('page_hash') != page_hash:
+            return None
+        return format_timestamp(entry['unchanged_since'])
+
+    def update(self, bank_name: str, fingerprint: str, url: Optional[str] = None, etag: Optional[str] = None, last_modified: Optional[str] = None, page_hash: Optional[str] = None):
+        """Records a successful extraction of `fingerprint`."""
+        now = time.time()
+        previous = self._entries.get(bank_name) or {}
+        unchanged_since = previous.get('unchanged_since', now) if previous.get('fingerprint') == fingerprint else now
+        self._entries[bank_name] = {
+            'fingerprint': fingerprint,
+            'unchanged_since': unchanged_since,
+            'extracted_at': now,
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'page_hash': page_hash,
+        }
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import importlib
+import os
+import subprocess
+import sys
+
+# Subcommand -> (module whose main() it runs, arguments put in front of the
+# user's, help). Modules are only imported once their command is chosen, so
+# `check` never loads the scraper and `export` never loads aiohttp.
+COMMANDS = {
+    'scrape': ('send_to_llm', ['--headless', '--non-interactive'], "Scrape every bank once (headless, no prompts)"),
+    'daemon': ('forex_daemon', [], "Scrape on a schedule until stopped"),
+    'check': ('forex_link_checker', ['--health'], "Health-check every bank's page, API and target, exit 1 on failures"),
+    'replay': ('replay_bench', [], "Record fixtures and benchmark the pipeline offline"),
+    'export': ('rate_index', [], "Rebuild the UI's per-currency files from current_rate.json"),
+    'serve': ('rate_server', [], "Serve the latest rates over HTTP with ETags and compression"),
+    'analyse': ('rate_analytics', [], "Best rates, spreads, outliers and conversions across banks"),
+}
+
+# Cold-start import time each command may take, in seconds. A run where
+# every bank is unchanged is mostly import time, so this is what keeps
+# cron runs well under a second.
+IMPORT_BUDGET_SECONDS = {
+    'scrape': 0.5,
+    'daemon': 0.5,
+    'check': 0.5,
+    'replay': 0.5,
+    'export': 0.15,
+    'serve': 0.5,
+    'analyse': 0.3,
+}
+
+_MEASURE_IMPORT = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def measure_import_seconds(module: str) -> float:
+    """Imports `module` in a fresh interpreter and returns how long it took."""
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE_IMPORT.format(module=module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def check_import_budget(repeat: int = 3) -> int:
+    """Prints each command's best import time of `repeat` against its budget. Returns the exit code."""
+    over = 0
+    for command, (module, _, _) in COMMANDS.items():
+        seconds = min(measure_import_seconds(module) for _ in range(repeat))
+        budget = IMPORT_BUDGET_SECONDS[command]
+        within = seconds <= budget
+        over += not within
+        print(f"  {command:8} {module:20} {seconds * 1000:6.0f} ms  (budget {budget * 1000:.0f} ms) {'ok' if within else 'OVER'}")
+    return 1 if over else 0
+
+
+def run_command(command: str, args) -> int:
+    module_name, default_args, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+
+    # The tools parse sys.argv themselves
+    sys.argv = [f"forex_cli.py {command}", *default_args, *args]
+    result = module.main()
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result if isinstance(result, int) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Forex Nepal command line",
+        epilog="Run '%(prog)s <command> --help' for a command's own options.",
+    )
+    parser.add_argument('--import-budget', action='store_true', help="Measure each command's startup import time against its budget and exit")
+    parser.add_argument('command', nargs='?', choices=COMMANDS, metavar='command',
+                        help='; '.join(f"{name}: {help_text}" for name, (_, _, help_text) in COMMANDS.items()))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Passed on to the command")
+    args = parser.parse_args()
+
+    if args.import_budget:
+        sys.exit(check_import_budget())
+    if args.command is None:
+        parser.print_help()
+        sys.exit(2)
+
+    try:
+        sys.exit(run_command(args.command, args.args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import asyncio
+import argparse
+import signal
+from datetime import datetime, timedelta
+
+import pytz
+
+from adaptive_poll import PollPlanner, DAILY_FETCH_BUDGET, DAILY_LLM_BUDGET
+from send_to_llm import (
+    ExtractionPool,
+    LLMResponseCache,
+    RunReport,
+    RUN_REPORT_PATH,
+    ScrapeScheduler,
+    SourceFingerprints,
+    create_browser_pool,
+    create_http_session,
+    live_validator,
+    load_banks,
+    scrape_banks,
+    write_snapshot,
+)
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+# Banks in Nepal are open Sunday to Friday; rates are published from ~10 AM
+BANKING_DAYS = {6, 0, 1, 2, 3, 4}  # datetime.weekday(): Monday is 0, Sunday is 6
+BANKING_HOURS = (9, 18)
+
+BUSY_INTERVAL_SECONDS = 5 * 60
+QUIET_INTERVAL_SECONDS = 60 * 60
+
+
+def is_banking_hours(now=None) -> bool:
+    now = now or datetime.now(NEPAL_TZ)
+    start, end = BANKING_HOURS
+    return now.weekday() in BANKING_DAYS and start <= now.hour < end
+
+
+def next_interval_seconds(busy_interval, quiet_interval, now=None) -> float:
+    """
+    Polls every `busy_interval` during Nepal banking hours and every
+    `quiet_interval` otherwise, but never sleeps past the next opening.
+    """
+    now = now or datetime.now(NEPAL_TZ)
+    if is_banking_hours(now):
+        return busy_interval
+
+    start, _ = BANKING_HOURS
+    opening = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opening <= now:
+        opening = NEPAL_TZ.normalize(opening + timedelta(days=1))
+    until_opening = (opening - now).total_seconds()
+    return max(1, min(quiet_interval, until_opening))
+
+
+class ForexDaemon:
+    """
+    Re-scrapes banks on a schedule. One browser, HTTP session, LLM cache,
+    extraction pool and set of source fingerprints are kept warm for the
+    lifetime of the process, so banks whose source hasn't changed are
+    skipped. With `adaptive`, each cycle only fetches the banks a
+    PollPlanner says are due. Banks it has no history for, or all banks
+    without `adaptive`, follow the busy/quiet intervals.
+    """
+
+    def __init__(self, json_file_path, busy_interval=BUSY_INTERVAL_SECONDS, quiet_interval=QUIET_INTERVAL_SECONDS, workers=8, report_path=RUN_REPORT_PATH, metrics_path=None, extract_workers=None, adaptive=True, fetch_budget=DAILY_FETCH_BUDGET, llm_budget=DAILY_LLM_BUDGET):
+        self.json_file_path = json_file_path
+        self.busy_interval = busy_interval
+        self.quiet_interval = quiet_interval
+        self.workers = workers
+        self.report_path = report_path
+        self.metrics_path = metrics_path
+        self.extract_workers = extract_workers
+        self.planner = None
+        if adaptive:
+            self.planner = PollPlanner.from_history(
+                fetch_budget=fetch_budget,
+                llm_budget=llm_budget,
+                fallback_interval=lambda now: next_interval_seconds(self.busy_interval, self.quiet_interval, now),
+            )
+            print(f"Learned publish patterns for {len(self.planner.profiles)} bank(s)")
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        print("Shutdown requested, finishing up...")
+        self._stop.set()
+
+    async def run_cycle(self, browser, http_session, llm_cache, fingerprints, extraction_pool):
+        # Re-read the config every cycle so edits don't need a restart
+        banks = load_banks(self.json_file_path)
+        if not banks:
+            return
+        if self.planner is not None:
+            banks = self.planner.plan(banks)
+            if not banks:
+                self.planner.save()
+                return
+
+        scheduler = ScrapeScheduler(workers=self.workers)
+        run_report = RunReport(self.report_path, self.metrics_path)
+        print(f"[{datetime.now(NEPAL_TZ):%Y-%m-%d %H:%M:%S %Z}] Scraping {len(banks)} banks")
+        statuses = await scrape_banks(
+            banks,
+            browser,
+            http_session,
+            scheduler,
+            llm_cache,
+            fingerprints=fingerprints,
+            run_report=run_report,
+            extraction_pool=extraction_pool,
+            validator=live_validator(),
+        )
+        write_snapshot([status['output'] for status in statuses])
+        print(f"LLM cache: {llm_cache.stats()}")
+        if self.planner is not None:
+            self.planner.record(statuses, run_report)
+            self.planner.save()
+
+    async def run(self, once=False):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        browser = create_browser_pool(headless=True)
+        http_session = create_http_session()
+        llm_cache = LLMResponseCache()
+        fingerprints = SourceFingerprints()
+        extraction_pool = ExtractionPool(workers=self.extract_workers)
+
+        try:
+            while not self._stop.is_set():
+                cycle = asyncio.create_task(self.run_cycle(browser, http_session, llm_cache, fingerprints, extraction_pool))
+                stop_wait = asyncio.create_task(self._stop.wait())
+                await asyncio.wait({cycle, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+                stop_wait.cancel()
+
+                if not cycle.done():
+                    # Signalled mid-cycle: abandon the remaining banks
+                    cycle.cancel()
+                    await asyncio.gather(cycle, return_exceptions=True)
+                    break
+                if cycle.exception():
+                    print(f"Scrape cycle failed: {cycle.exception()}")
+
+                if once:
+                    break
+
+                if self.planner is not None:
+                    interval = self.planner.next_wake_seconds()
+                else:
+                    interval = next_interval_seconds(self.busy_interval, self.quiet_interval)
+                print(f"Next scrape in {interval / 60:.1f} minutes")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            extraction_pool.close()
+            await http_session.close()
+            await browser.close()
+            print("Daemon stopped.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless forex scraping daemon")
+    parser.add_argument('--banks', default="nepal_banks.json", help="Path to the bank config")
+    parser.add_argument('--busy-interval', type=int, default=BUSY_INTERVAL_SECONDS,
+                        help="Seconds between scrapes during Nepal banking hours")
+    parser.add_argument('--quiet-interval', type=int, default=QUIET_INTERVAL_SECONDS,
+                        help="Seconds between scrapes outside banking hours")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--once', action='store_true', help="Run a single cycle and exit")
+    parser.add_argument('--report', default=RUN_REPORT_PATH, help="JSON-lines file the per-bank stage timings are appended to")
+    parser.add_argument('--metrics', help="Prometheus textfile to rewrite after every cycle")
+    parser.add_argument('--extract-workers', type=int, help="Processes for parsing and cleaning pages (default: up to 4, 0 runs them in-process)")
+    parser.add_argument('--fixed-schedule', action='store_true',
+                        help="Scrape every bank each cycle instead of polling each one by its publish history")
+    parser.add_argument('--fetch-budget', type=int, default=DAILY_FETCH_BUDGET, help="Bank page loads allowed per day")
+    parser.add_argument('--llm-budget', type=int, default=DAILY_LLM_BUDGET, help="Gemini extractions allowed per day")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    daemon = ForexDaemon(
+        args.banks,
+        busy_interval=args.busy_interval,
+        quiet_interval=args.quiet_interval,
+        workers=args.workers,
+        report_path=args.report,
+        metrics_path=args.metrics,
+        extract_workers=args.extract_workers,
+        adaptive=not args.fixed_schedule,
+        fetch_budget=args.fetch_budget,
+        llm_budget=args.llm_budget,
+    )
+    await daemon.run(once=args.once)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
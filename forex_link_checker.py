@@ -1,133 +1,245 @@
-import json
 import asyncio
-from playwright.async_api import async_playwright
+import argparse
+import contextlib
+import json
+import sys
 import time
-
-async def check_forex_links(json_file_path):
+from datetime import datetime, timezone
+
+import aiohttp
+
+from bank_registry import load_banks, FETCH_API, FETCH_BROWSER
+from browser_pool import BrowserPool, fetch_bank_content
+from http_fetcher import (
+    create_http_session,
+    get_nepali_date,
+    fetch_api_json,
+    fetch_html_content,
+    fetch_text,
+    ElementNotFound,
+    RATE_TEXT_PATTERN,
+)
+from page_profile import apply_scraping_profile, SCRAPING_LAUNCH_ARGS, SCRAPING_CONTEXT_OPTIONS
+
+# How long a page gets to reach DOMContentLoaded
+LOAD_TIMEOUT_MS = 30_000
+
+# Health check mode
+HEALTH_REPORT_PATH = 'link_health.json'
+HEALTH_CONCURRENCY = 16
+HEALTH_BROWSER_PAGES = 4
+HEALTH_HTTP_TIMEOUT_MS = 20_000
+# Whole check for one bank, including a browser fallback
+HEALTH_BANK_TIMEOUT_SECONDS = 60
+
+def describe_target(bank):
+    """The element or response the scraper reads for this bank, as configured."""
+    return bank.target.describe()
+
+async def check_over_http(bank, http_session):
     """
-    Opens all forex links from the JSON file in Firefox browser tabs
+    Fetches the forex page, and the API if there is one, without a browser
+    and checks the configured target is there. Raises if it isn't.
+    """
+    dates = [get_nepali_date(i) for i in range(5)]
+    if bank.fetch == FETCH_API:
+        page, api = await asyncio.gather(
+            fetch_text(http_session, bank.forex_page),
+            fetch_api_json(http_session, bank, dates[0]),
+        )
+        if not api['data']:
+            raise ElementNotFound('API returned no data')
+        return {'has_rates': bool(RATE_TEXT_PATTERN.search(json.dumps(api['data'])))}
+
+    html = await fetch_html_content(http_session, bank, dates)
+    return {'has_rates': bool(RATE_TEXT_PATTERN.search(html))}
+
+async def check_in_browser(bank, pool):
+    async with pool.page(bank.forex_page, warm_session=bank.anti_robot) as page:
+        await apply_scraping_profile(page, bank)
+        html, json_data = await fetch_bank_content(bank, page)
+    if html is None and json_data is None:
+        raise ElementNotFound('Neither html nor json found')
+    content = html if html is not None else json.dumps(json_data)
+    return {'has_rates': bool(RATE_TEXT_PATTERN.search(content))}
+
+async def check_bank_health(bank, http_session, pool, use_browser=True):
     """
+    Checks one bank's forex page and API over plain HTTP first, and in the
+    browser if that fails (pages rendered by JS, APIs that only answer the
+    site itself). Returns a report entry; never raises.
+    """
+    entry = {
+        'bank': bank.name,
+        'url': bank.forex_page,
+        'api': bank.api,
+        'target': describe_target(bank),
+        'status': 'failed',
+        'method': None,
+    }
+    started = time.perf_counter()
 
-    # Load the JSON file
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-    except FileNotFoundError:
-        print(f"Error: JSON file '{json_file_path}' not found.")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: Invalid JSON format in '{json_file_path}'.")
-        return
+        if bank.fetch != FETCH_BROWSER:
+            try:
+                entry['method'] = 'http'
+                entry.update(await check_over_http(bank, http_session))
+                entry['status'] = 'ok'
+            except (ElementNotFound, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                entry['http_error'] = str(e) or type(e).__name__
+                if not use_browser:
+                    raise
+        if entry['status'] != 'ok' and use_browser:
+            entry['method'] = 'browser'
+            entry.update(await check_in_browser(bank, pool))
+            entry['status'] = 'ok'
+    except Exception as e:
+        entry['reason'] = str(e) or type(e).__name__
 
-    banks = data.get('banks', [])
+    entry['seconds'] = round(time.perf_counter() - started, 2)
+    return entry
+
+async def check_link_health(banks, concurrency=HEALTH_CONCURRENCY, use_browser=True):
+    """
+    Health-checks every bank concurrently, at most `concurrency` at a time,
+    and returns a JSON-serialisable report. Chromium is only launched if a
+    bank needs it.
+    """
+    started = time.perf_counter()
+    http_session = create_http_session(timeout_ms=HEALTH_HTTP_TIMEOUT_MS)
+    pool = BrowserPool(
+        headless=True,
+        launch_options={'args': SCRAPING_LAUNCH_ARGS},
+        context_options=SCRAPING_CONTEXT_OPTIONS,
+        max_pages=HEALTH_BROWSER_PAGES,
+    )
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def check(bank):
+        async with slots:
+            try:
+                return await asyncio.wait_for(
+                    check_bank_health(bank, http_session, pool, use_browser),
+                    timeout=HEALTH_BANK_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                return {
+                    'bank': bank.name,
+                    'url': bank.forex_page,
+                    'api': bank.api,
+                    'target': describe_target(bank),
+                    'status': 'failed',
+                    'reason': f'Timed out after {HEALTH_BANK_TIMEOUT_SECONDS}s',
+                    'seconds': HEALTH_BANK_TIMEOUT_SECONDS,
+                }
+
+    try:
+        entries = await asyncio.gather(*(check(bank) for bank in banks))
+    finally:
+        await http_session.close()
+        await pool.close()
+
+    counts = {}
+    for entry in entries:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    return {
+        'checked_utc': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'duration_seconds': round(time.perf_counter() - started, 2),
+        'banks': len(entries),
+        'statuses': counts,
+        'results': entries,
+    }
+
+async def run_health_check(json_file_path, report_path=HEALTH_REPORT_PATH, concurrency=HEALTH_CONCURRENCY, use_browser=True):
+    """
+    Headless, unattended check for cron. Writes the JSON report to
+    `report_path` ('-' for stdout) and returns the exit code: 0 if every
+    bank is ok, 1 if any failed, 2 if the config can't be read.
+    """
+    banks = load_banks(json_file_path)
+    if not banks:
+        return 2
+
+    # The fetchers print progress; keep stdout clean when the report goes there
+    progress = sys.stderr if report_path == '-' else sys.stdout
+    with contextlib.redirect_stdout(progress):
+        report = await check_link_health(banks, concurrency, use_browser)
+        for entry in report['results']:
+            if entry['status'] != 'ok':
+                print(f"  {entry['status']:7} {entry['bank']} - {entry.get('reason')}")
+        print(f"{report['statuses'].get('ok', 0)}/{report['banks']} banks healthy in {report['duration_seconds']}s")
+
+    if report_path == '-':
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Report written to {report_path}")
+    return 1 if report['statuses'].get('failed') else 0
+
+async def check_forex_links(json_file_path, headless=False, interactive=True):
+    """
+    Opens all forex links from the JSON file in Firefox browser tabs
+    """
 
+    banks = load_banks(json_file_path)
     if not banks:
-        print("No banks found in the JSON file.")
         return
 
     print(f"Found {len(banks)} banks in the JSON file.")
     print("Starting Firefox browser...")
 
-    async with async_playwright() as p:
-        # Launch Firefox browser
-        browser = await p.firefox.launch(
-            headless=False,  # Keep browser visible
-            slow_mo=1000,    # Add slight delay for better visibility
-        )
-
-        # Create a new browser context
-        context = await browser.new_context()
-
-        # Create the first page to act as our main tab
-        main_page = await context.new_page()
-
-        # Track successful and failed links
-        successful_links = []
-        failed_links = []
+    pool = BrowserPool(
+        headless=headless,  # Visible unless running unattended
+        browser_type='firefox',
+        launch_options={'slow_mo': 0 if headless else 1000},  # Add slight delay for better visibility
+    )
 
-        print("\nOpening all forex links concurrently...")
-        print("=" * 50)
-
-        # Function to open a single bank's forex page
-        async def open_bank_forex(bank, index):
-            bank_name = bank.get('name', 'Unknown Bank')
-            bank_class = bank.get('class', 'Unknown')
-            forex_url = bank.get('forex_page', '')
-
-            if not forex_url:
-                print(f"{index:2d}. {bank_name} ({bank_class}) - No forex URL provided")
-                return {'bank': bank_name, 'class': bank_class, 'reason': 'No URL', 'status': 'failed'}
-
-            try:
-                print(f"{index:2d}. Opening: {bank_name} ({bank_class})")
-                print(f"    URL: {forex_url}")
+    # Track successful and failed links
+    successful_links = []
+    failed_links = []
 
-                # Open link in new tab using JavaScript
-                await main_page.evaluate(f"window.open('{forex_url}', '_blank')")
+    print("\nOpening all forex links concurrently...")
+    print("=" * 50)
 
-                # Wait a moment for tab creation
-                await asyncio.sleep(0.5)
+    # Function to open a single bank's forex page
+    async def open_bank_forex(bank, index):
+        bank_name = bank.name
+        bank_class = bank.bank_class or 'Unknown'
+        forex_url = bank.forex_page
 
-                return {'bank': bank_name, 'class': bank_class, 'url': forex_url, 'status': 'opened'}
+        try:
+            print(f"{index:2d}. Opening: {bank_name} ({bank_class})")
+            print(f"    URL: {forex_url}")
 
-            except Exception as e:
-                print(f"    Status: ✗ Error - {str(e)}")
-                return {'bank': bank_name, 'class': bank_class, 'url': forex_url, 'reason': str(e), 'status': 'failed'}
+            # Tabs stay open for manual checking; goto returns once the page has loaded
+            async with pool.page(forex_url, keep_open=interactive) as page:
+                response = await page.goto(forex_url, wait_until='domcontentloaded', timeout=LOAD_TIMEOUT_MS)
 
-        # Open all links concurrently
-        tasks = []
-        for i, bank in enumerate(banks, 1):
-            task = open_bank_forex(bank, i)
-            tasks.append(task)
+            if response is not None and not response.ok:
+                print(f"    {bank_name}: ✗ HTTP {response.status}")
+                return {'bank': bank_name, 'class': bank_class, 'url': forex_url, 'reason': f'HTTP {response.status}', 'status': 'failed'}
 
-        # Execute all tasks concurrently
-        print(f"\nStarting concurrent opening of {len(tasks)} forex pages...")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+            print(f"    {bank_name}: ✓ Loaded - {page.url}")
+            return {'bank': bank_name, 'class': bank_class, 'url': forex_url, 'status': 'opened'}
 
-        # Wait for all tabs to be created
-        print("\nWaiting for all tabs to be created...")
-        await asyncio.sleep(3)
+        except Exception as e:
+            print(f"    {bank_name}: ✗ Error - {str(e)}")
+            return {'bank': bank_name, 'class': bank_class, 'url': forex_url, 'reason': str(e), 'status': 'failed'}
 
-        # Get all pages and try to validate them
-        all_pages = context.pages
-        print(f"\nFound {len(all_pages)} total tabs (including main page)")
+    try:
+        # Open all links concurrently, a couple of tabs per site at a time
+        print(f"\nStarting concurrent opening of {len(banks)} forex pages...")
+        results = await asyncio.gather(*(open_bank_forex(bank, i) for i, bank in enumerate(banks, 1)))
 
         # Process results
         for result in results:
-            if isinstance(result, Exception):
-                failed_links.append({'bank': 'Unknown', 'class': 'Unknown', 'reason': str(result), 'url': 'Unknown'})
-            elif result['status'] == 'failed':
+            if result['status'] == 'failed':
                 failed_links.append(result)
             elif result['status'] == 'opened':
                 successful_links.append(result)
 
-        # Optional: Try to validate pages that were opened
-        print("\nValidating opened pages...")
-        validated_successful = []
-        validated_failed = []
-
-        # Skip the main page (index 0) and check the rest
-        for i, page in enumerate(all_pages[1:], 1):
-            try:
-                # Wait for page to load with a shorter timeout for concurrent loading
-                await page.wait_for_load_state('domcontentloaded', timeout=5000)
-                current_url = page.url
-
-                if current_url and not current_url.startswith('about:blank'):
-                    print(f"    Tab {i}: ✓ Loaded - {current_url}")
-                    validated_successful.append({'tab': i, 'url': current_url})
-                else:
-                    print(f"    Tab {i}: ✗ Failed to load properly")
-                    validated_failed.append({'tab': i, 'reason': 'Blank or failed to load'})
-
-            except Exception as e:
-                print(f"    Tab {i}: ✗ Error - {str(e)}")
-                validated_failed.append({'tab': i, 'reason': str(e)})
-
-        print(f"\nValidation complete:")
-        print(f"  Successfully loaded tabs: {len(validated_successful)}")
-        print(f"  Failed to load tabs: {len(validated_failed)}")
-
         # Print summary
         print("\n" + "=" * 50)
         print("SUMMARY")
@@ -141,44 +253,73 @@ async def check_forex_links(json_file_path):
             for failed in failed_links:
                 print(f"  - {failed['bank']} ({failed['class']}): {failed['reason']}")
 
-        print(f"\nAll {len(successful_links)} working links are now open in Firefox tabs.")
-        print("You can now manually verify each forex page.")
-        print("Press Enter to close all tabs and exit...")
+        if interactive:
+            print(f"\nAll {len(successful_links)} working links are now open in Firefox tabs.")
+            print("You can now manually verify each forex page.")
+            print("Press Enter to close all tabs and exit...")
 
-        # Wait for user input before closing
-        input()
+            # Wait for user input before closing
+            input()
 
+    finally:
         # Close browser
-        await browser.close()
+        await pool.close()
         print("Browser closed. Goodbye!")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Open every bank's forex link in Firefox")
+    parser.add_argument('--banks', default="nepal_banks.json", help="Path to the bank config")
+    parser.add_argument('--headless', action='store_true', help="Run the browser without a window")
+    parser.add_argument('--non-interactive', action='store_true', help="Don't wait for Enter before closing")
+    parser.add_argument('--health', action='store_true',
+                        help="Check every page, API and configured target headlessly, write a JSON report and exit non-zero on failures")
+    parser.add_argument('--report', default=HEALTH_REPORT_PATH, help="Where --health writes its JSON report, '-' for stdout")
+    parser.add_argument('--concurrency', type=int, default=HEALTH_CONCURRENCY, help="Banks checked at once in --health mode")
+    parser.add_argument('--no-browser', action='store_true', help="In --health mode, only use plain HTTP")
+    return parser.parse_args()
+
 async def main():
     """
     Main function to run the forex link checker
     """
+    args = parse_args()
+
+    if args.health:
+        return await run_health_check(
+            args.banks,
+            report_path=args.report,
+            concurrency=args.concurrency,
+            use_browser=not args.no_browser,
+        )
+
     # You can change this path to wherever you save the JSON file
-    json_file_path = "nepal_banks.json"
+    json_file_path = args.banks
 
     print("Nepal Banks Forex Link Checker")
     print("=" * 40)
     print(f"Looking for JSON file: {json_file_path}")
 
     # Check if custom path is needed
-    custom_path = input(f"Press Enter to use '{json_file_path}' or type a different path: ").strip()
-    if custom_path:
-        json_file_path = custom_path
+    if not args.non_interactive:
+        custom_path = input(f"Press Enter to use '{json_file_path}' or type a different path: ").strip()
+        if custom_path:
+            json_file_path = custom_path
 
-    await check_forex_links(json_file_path)
+    await check_forex_links(json_file_path, headless=args.headless, interactive=not args.non_interactive)
+    return 0
 
 if __name__ == "__main__":
-    print("Installing required packages...")
-    print("Make sure you have installed: pip install playwright")
-    print("And run: playwright install firefox")
-    print()
+    if '--health' not in sys.argv:
+        print("Installing required packages...")
+        print("Make sure you have installed: pip install playwright")
+        print("And run: playwright install firefox")
+        print()
 
     try:
-        asyncio.run(main())
+        sys.exit(asyncio.run(main()))
     except KeyboardInterrupt:
         print("\nScript interrupted by user.")
+        sys.exit(130)
     except Exception as e:
         print(f"An error occurred: {e}")
+        sys.exit(2)
@@ -0,0 +1,324 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+HISTORY_DB_PATH = 'rate_history.sqlite3'
+
+RATE_FIELDS = ('buy_cash', 'buy_non_cash', 'sell')
+# (unit, buy_cash, buy_non_cash, sell) of a currency the bank no longer quotes
+TOMBSTONE = (None, None, None, None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS currencies (
+    id INTEGER PRIMARY KEY,
+    iso_code TEXT NOT NULL UNIQUE,
+    name TEXT
+);
+-- One row per (bank, fetch): lets us say "unchanged since T" without
+-- repeating every rate on every poll
+CREATE TABLE IF NOT EXISTS fetches (
+    bank_id INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    published_date TEXT,
+    PRIMARY KEY (bank_id, fetched_at)
+) WITHOUT ROWID;
+-- Rates are only appended when they differ from the bank's previous value.
+-- A row with every value NULL marks a currency the bank stopped quoting
+CREATE TABLE IF NOT EXISTS rates (
+    bank_id INTEGER NOT NULL,
+    currency_id INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    unit INTEGER,
+    buy_cash REAL,
+    buy_non_cash REAL,
+    sell REAL,
+    PRIMARY KEY (bank_id, currency_id, fetched_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rates_by_currency ON rates (currency_id, fetched_at);
+"""
+
+
+def parse_utc_timestamp(value: str) -> Optional[int]:
+    """'2025-07-10T17:46:13.428573Z' -> unix seconds"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def format_utc_timestamp(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class HistoryStore:
+    """
+    Append-only SQLite store of every bank's rates over time, indexed by
+    (bank, currency, timestamp).
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self._bank_ids: Dict[str, int] = {}
+        self._currency_ids: Dict[str, int] = {}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _bank_id(self, name: str) -> int:
+        if name not in self._bank_ids:
+            self.conn.execute('INSERT OR IGNORE INTO banks (name) VALUES (?)', (name,))
+            row = self.conn.execute('SELECT id FROM banks WHERE name = ?', (name,)).fetchone()
+            self._bank_ids[name] = row[0]
+        return self._bank_ids[name]
+
+    def _currency_id(self, iso_code: str, name: Optional[str] = None) -> int:
+        if iso_code not in self._currency_ids:
+            self.conn.execute('INSERT OR IGNORE INTO currencies (iso_code, name) VALUES (?, ?)', (iso_code, name))
+            row = self.conn.execute('SELECT id FROM currencies WHERE iso_code = ?', (iso_code,)).fetchone()
+            self._currency_ids[iso_code] = row[0]
+        return self._currency_ids[iso_code]
+
+    def _latest_values(self, bank_id: int, currency_id: int, before: int):
+        return self.conn.execute(
+            'SELECT unit, buy_cash, buy_non_cash, sell FROM rates '
+            'WHERE bank_id = ? AND currency_id = ? AND fetched_at <= ? '
+            'ORDER BY fetched_at DESC LIMIT 1',
+            (bank_id, currency_id, before),
+        ).fetchone()
+
+    def _quoted_currencies(self, bank_id: int, before: int) -> List[int]:
+        """Currencies whose latest row for the bank at or before `before` isn't a tombstone."""
+        rows = self.conn.execute(
+            'SELECT currency_id, unit, buy_cash, buy_non_cash, sell, MAX(fetched_at) FROM rates '
+            'WHERE bank_id = ? AND fetched_at <= ? GROUP BY currency_id',
+            (bank_id, before),
+        )
+        return [currency_id for currency_id, *values, _ in rows if tuple(values) != TOMBSTONE]
+
+    def _record_bank(self, output: Dict[str, Any], fallback_time: Optional[int]) -> int:
+        fetched_at = parse_utc_timestamp(output.get('fetch_datetime_utc')) or fallback_time
+        if fetched_at is None:
+            return 0
+
+        bank_id = self._bank_id(output['bank_name'])
+        self.conn.execute(
+            'INSERT OR REPLACE INTO fetches (bank_id, fetched_at, published_date) VALUES (?, ?, ?)',
+            (bank_id, fetched_at, output.get('published_date')),
+        )
+
+        written = 0
+        seen = set()
+        for entry in output.get('rates') or []:
+            currency = entry.get('currency') or {}
+            rates = entry.get('rates') or {}
+            iso_code = currency.get('iso_code')
+            # Only the first row per currency counts (e.g. "Australian Dollar Cash" rows)
+            if not iso_code or iso_code in seen:
+                continue
+            seen.add(iso_code)
+
+            currency_id = self._currency_id(iso_code, currency.get('name'))
+            values = (currency.get('unit'),) + tuple(rates.get(field) for field in RATE_FIELDS)
+            if self._latest_values(bank_id, currency_id, fetched_at) == values:
+                continue
+
+            self.conn.execute(
+                'INSERT OR REPLACE INTO rates (bank_id, currency_id, fetched_at, unit, buy_cash, buy_non_cash, sell) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (bank_id, currency_id, fetched_at) + values,
+            )
+            written += 1
+
+        # An empty output is more likely a failed parse than a bank dropping every currency
+        if seen:
+            seen_ids = {self._currency_ids[iso_code] for iso_code in seen}
+            for currency_id in self._quoted_currencies(bank_id, fetched_at):
+                if currency_id not in seen_ids:
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO rates (bank_id, currency_id, fetched_at, unit, buy_cash, buy_non_cash, sell) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (bank_id, currency_id, fetched_at) + TOMBSTONE,
+                    )
+                    written += 1
+        return written
+
+    def record_outputs(self, outputs: Iterable[Optional[Dict[str, Any]]], fallback_time: Optional[int] = None) -> int:
+        """
+        Appends one run's bank outputs. Returns how many rate rows changed.
+        """
+        written = 0
+        with self.conn:
+            for output in outputs:
+                if output and output.get('bank_name'):
+                    written += self._record_bank(output, fallback_time)
+        return written
+
+    def import_snapshot_files(self, paths: Iterable[str]) -> Dict[str, int]:
+        """Imports existing rate_<utc>.json snapshot files, oldest first."""
+        stats = {'files': 0, 'rows': 0}
+        for path in sorted(paths):
+            match = re.search(r'rate_(.+)\.json$', os.path.basename(path))
+            fallback_time = parse_utc_timestamp(match.group(1)) if match else None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+
+            stats['rows'] += self.record_outputs(data.get('all_banks', []), fallback_time)
+            stats['files'] += 1
+        return stats
+
+    def get_series(self, bank_name: str, iso_code: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the rate changes for one bank/currency, oldest first. Each
+        point holds until the next one; a point with every value None means
+        the bank stopped quoting the currency then.
+        """
+        query = (
+            'SELECT r.fetched_at, r.unit, r.buy_cash, r.buy_non_cash, r.sell FROM rates r '
+            'JOIN banks b ON b.id = r.bank_id JOIN currencies c ON c.id = r.currency_id '
+            'WHERE b.name = ? AND c.iso_code = ?'
+        )
+        params: List[Any] = [bank_name, iso_code.upper()]
+        if start:
+            query += ' AND r.fetched_at >= ?'
+            params.append(parse_utc_timestamp(start))
+        if end:
+            query += ' AND r.fetched_at <= ?'
+            params.append(parse_utc_timestamp(end))
+        query += ' ORDER BY r.fetched_at'
+
+        return [
+            {
+                'fetched_at': format_utc_timestamp(fetched_at),
+                'unit': unit,
+                'buy_cash': buy_cash,
+                'buy_non_cash': buy_non_cash,
+                'sell': sell,
+            }
+            for fetched_at, unit, buy_cash, buy_non_cash, sell in self.conn.execute(query, params)
+        ]
+
+    def get_currency_series(self, iso_code: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Returns get_series() for every bank that quotes `iso_code`."""
+        rows = self.conn.execute(
+            'SELECT DISTINCT b.name FROM rates r JOIN banks b ON b.id = r.bank_id '
+            'JOIN currencies c ON c.id = r.currency_id WHERE c.iso_code = ?',
+            (iso_code.upper(),),
+        ).fetchall()
+        return {name: self.get_series(name, iso_code, start, end) for (name,) in rows}
+
+    def change_times(self, start: Optional[int] = None) -> Dict[str, List[int]]:
+        """
+        When each bank's rates changed, in unix seconds, oldest first. A
+        bank's first fetch only starts its history, so it isn't a change.
+        """
+        rows = self.conn.execute(
+            'SELECT b.name, r.fetched_at FROM rates r JOIN banks b ON b.id = r.bank_id '
+            'WHERE r.fetched_at >= ? '
+            'AND r.fetched_at > (SELECT MIN(f.fetched_at) FROM fetches f WHERE f.bank_id = r.bank_id) '
+            'GROUP BY r.bank_id, r.fetched_at ORDER BY r.fetched_at',
+            (start or 0,),
+        )
+        times: Dict[str, List[int]] = {}
+        for name, fetched_at in rows:
+            times.setdefault(name, []).append(fetched_at)
+        return times
+
+    def first_fetches(self) -> Dict[str, int]:
+        """Earliest fetch time per bank, in unix seconds."""
+        rows = self.conn.execute(
+            'SELECT b.name, MIN(f.fetched_at) FROM fetches f JOIN banks b ON b.id = f.bank_id GROUP BY b.name'
+        )
+        return dict(rows.fetchall())
+
+    def ids(self) -> Tuple[Dict[int, str], Dict[int, str]]:
+        """Bank names and currency ISO codes by their ids."""
+        return (
+            dict(self.conn.execute('SELECT id, name FROM banks').fetchall()),
+            dict(self.conn.execute('SELECT id, iso_code FROM currencies').fetchall()),
+        )
+
+    def rate_changes(self, end: Optional[int] = None) -> List[tuple]:
+        """
+        Every stored rate change up to `end` (unix seconds) as (bank_id,
+        currency_id, fetched_at, unit, buy_cash, buy_non_cash, sell). Ids
+        rather than names keep bulk reads fast; see ids(). Rows with every
+        value None are tombstones: the currency is not quoted from then on.
+        """
+        return self.conn.execute(
+            'SELECT bank_id, currency_id, fetched_at, unit, buy_cash, buy_non_cash, sell FROM rates WHERE fetched_at <= ?',
+            (end if end is not None else 2 ** 62,),
+        ).fetchall()
+
+    def last_fetch_by_step(self, end: int, step_seconds: int, steps: int) -> List[tuple]:
+        """
+        Each bank's last fetch in every `step_seconds` window counting back
+        from `end`, as (bank_id, windows back, fetched_at). Older fetches
+        are folded into window `steps - 1`. Grouping in SQLite keeps this
+        one row per bank and window however often banks are polled.
+        """
+        return self.conn.execute(
+            'SELECT bank_id, MIN((? - fetched_at) / ?, ?) AS step, MAX(fetched_at) FROM fetches '
+            'WHERE fetched_at <= ? GROUP BY bank_id, step',
+            (end, step_seconds, steps - 1, end),
+        ).fetchall()
+
+    def last_fetches(self) -> Dict[str, str]:
+        """Latest fetch time per bank."""
+        rows = self.conn.execute(
+            'SELECT b.name, MAX(f.fetched_at) FROM fetches f JOIN banks b ON b.id = f.bank_id GROUP BY b.name'
+        )
+        return {name: format_utc_timestamp(fetched_at) for name, fetched_at in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forex rate history store")
+    parser.add_argument('--db', default=HISTORY_DB_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="Import rate_*.json snapshot files")
+    import_parser.add_argument('paths', nargs='*', help="Defaults to rate_*.json in the current directory")
+
+    series_parser = subparsers.add_parser('series', help="Print a bank's rate history for a currency")
+    series_parser.add_argument('bank')
+    series_parser.add_argument('iso_code')
+    series_parser.add_argument('--start')
+    series_parser.add_argument('--end')
+
+    args = parser.parse_args()
+    with HistoryStore(args.db) as store:
+        if args.command == 'import':
+            stats = store.import_snapshot_files(args.paths or glob.glob('rate_*.json'))
+            print(f"Imported {stats['files']} file(s), {stats['rows']} changed rate row(s)")
+        elif args.command == 'series':
+            print(json.dumps(store.get_series(args.bank, args.iso_code, args.start, args.end), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import re
+from typing import Optional, Dict, Any, List
+
+from bs4 import BeautifulSoup
+
+from rule_parser import expand_table_grid, parse_rate, HTML_PARSER
+from llm_batcher import estimate_tokens
+
+# Attributes worth keeping when a payload can't be flattened into a grid
+ATTRIBUTES_TO_KEEP = ['href', 'src', 'colspan', 'rowspan']
+
+CELL_SEPARATOR = ' | '
+
+# Rows that may carry the published date, e.g. "Rates as on 2025-07-10"
+DATE_HINT_PATTERN = re.compile(r'\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\bdate\b|updated|as on|effective', re.IGNORECASE)
+
+
+def _has_rate(row: List[str]) -> bool:
+    return any(parse_rate(cell) is not None for cell in row)
+
+
+def _keep_row(row: List[str]) -> bool:
+    return _has_rate(row) or any(DATE_HINT_PATTERN.search(cell) for cell in row)
+
+
+def compact_table_text(html_content: str) -> Optional[str]:
+    """
+    Flattens a forex table into one line of '|' separated cells per row.
+    Cells spanning several rows/columns are repeated so every row lines up
+    with its headers. The caption, header rows (everything before the first
+    row with a rate in it), rate rows and rows mentioning a date are kept,
+    while empty rows, section titles and other footnotes are dropped.
+    Returns None if there's no grid to flatten.
+    """
+    grid = [row for row in expand_table_grid(html_content) if any(row)]
+    first_data = next((i for i, row in enumerate(grid) if _has_rate(row)), None)
+    if first_data is None:
+        return None
+
+    lines = []
+    caption = BeautifulSoup(html_content, HTML_PARSER).find('caption')
+    if caption is not None and caption.get_text(strip=True):
+        lines.append(re.sub(r'\s+', ' ', caption.get_text(' ', strip=True)))
+
+    rows = grid[:first_data] + [row for row in grid[first_data:] if _keep_row(row)]
+    lines.extend(CELL_SEPARATOR.join(row) for row in rows)
+    return '\n'.join(lines)
+
+
+def minify_html(html_content: str) -> str:
+    """Strips every attribute but ATTRIBUTES_TO_KEEP and the whitespace between tags."""
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    for tag in soup.find_all(True):
+        tag.attrs = {attr: value for attr, value in tag.attrs.items() if attr in ATTRIBUTES_TO_KEEP}
+    for tag in soup.find_all(['script', 'style']):
+        tag.decompose()
+
+    # lxml wraps fragments in <html><body>
+    root = soup.body or soup
+    html = root.decode_contents() if root is soup.body else str(root)
+    html = re.sub(r'>\s+<', '><', html)
+    return re.sub(r'\s+', ' ', html).strip()
+
+
+def compact_html(html_content: str) -> str:
+    """The smallest faithful prompt payload for a bank's table/element HTML."""
+    return compact_table_text(html_content) or minify_html(html_content)
+
+
+def compact_json(json_data: Any) -> str:
+    return json.dumps(json_data, separators=(',', ':'), ensure_ascii=False)
+
+
+def payload_report(raw: str, compact: str) -> Dict[str, Any]:
+    raw_bytes = len(raw.encode('utf-8'))
+    compact_bytes = len(compact.encode('utf-8'))
+    return {
+        'raw_bytes': raw_bytes,
+        'compact_bytes': compact_bytes,
+        'raw_tokens': estimate_tokens(raw),
+        'compact_tokens': estimate_tokens(compact),
+        'saved_percent': round(100 * (1 - compact_bytes / raw_bytes), 1) if raw_bytes else 0.0,
+    }
+
+
+def format_payload_report(report: Dict[str, Any]) -> str:
+    return (
+        f"{report['raw_bytes']:,} -> {report['compact_bytes']:,} bytes, "
+        f"~{report['raw_tokens']:,} -> ~{report['compact_tokens']:,} tokens "
+        f"({report['saved_percent']}% smaller)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how much each saved table/JSON payload shrinks before it goes to the LLM")
+    parser.add_argument('paths', nargs='+', help="Files holding a table's outerHTML or an API's JSON")
+    parser.add_argument('--show', action='store_true', help="Print the compacted payload too")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = f.read()
+        try:
+            compact = compact_json(json.loads(raw))
+        except json.JSONDecodeError:
+            compact = compact_html(raw)
+        print(f"{path}: {format_payload_report(payload_report(raw, compact))}")
+        if args.show:
+            print(compact)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Callable
+
+import aiohttp
+import pytz
+
+from bank_registry import BankSource, LinkTarget, ElementNotFound, DATE_PLACEHOLDER
+
+# Some bank sites reject requests without a browser-like user agent
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+NO_RECORD_TEXT = 'No record found.'
+# A rendered rate table has at least one decimal rate in it
+RATE_TEXT_PATTERN = re.compile(r'\d+\.\d{1,4}')
+
+# Bank name -> the last date that had rates, so date fallbacks start there
+_last_good_dates: Dict[str, str] = {}
+
+
+def get_nepali_date(offset_days=0):
+    nepal_tz = pytz.timezone('Asia/Kathmandu')
+    today = datetime.now(nepal_tz) - timedelta(days=offset_days)
+    return today.strftime('%Y-%m-%d')
+
+
+def substitute_date(url: str, date: str) -> str:
+    return url.replace(DATE_PLACEHOLDER, date)
+
+
+def order_candidate_dates(bank_name: str, dates: List[str]) -> List[str]:
+    """
+    Puts the newest date first, then the date that last had rates for this
+    bank, then the remaining dates newest first.
+    """
+    last_good = _last_good_dates.get(bank_name)
+    if not dates or last_good not in dates[1:]:
+        return list(dates)
+    return [dates[0], last_good] + [date for date in dates[1:] if date != last_good]
+
+
+def remember_good_date(bank_name: str, date: str):
+    _last_good_dates[bank_name] = date
+
+
+def create_http_session(limit: int = 32, limit_per_host: int = 4, timeout_ms: int = 60_000) -> aiohttp.ClientSession:
+    """
+    A pooled keep-alive session shared by every bank in a run, so repeated
+    requests to the same host reuse connections.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=30,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=DEFAULT_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=timeout_ms / 1000),
+    )
+
+
+async def fetch_api_json(session: aiohttp.ClientSession, bank: BankSource, date: str, validators: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Calls a bank's rate API directly with the date filled in. `validators`
+    are conditional headers (If-None-Match/If-Modified-Since); on a 304 the
+    result has 'not_modified' set and no data.
+    """
+    url = substitute_date(bank.api, date)
+    print(f"Fetching API {url}")
+    headers = {'Accept': 'application/json', **(validators or {})}
+    async with session.get(url, headers=headers) as response:
+        result = {
+            'url': url,
+            'not_modified': response.status == 304,
+            'data': None,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if result['not_modified']:
+            return result
+        response.raise_for_status()
+        # Some APIs reply with text/html content types
+        result['data'] = await response.json(content_type=None)
+        return result
+
+
+async def fetch_text(session: aiohttp.ClientSession, url: str) -> str:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.text()
+
+
+async def _parse(extraction_pool, func: Callable[..., Any], *args: Any) -> Any:
+    """Runs a BeautifulSoup parse in the extraction pool, or inline without one (e.g. the link checker)."""
+    if extraction_pool is None:
+        return func(*args)
+    return await extraction_pool.run(func, *args)
+
+
+async def fetch_html_content(session: aiohttp.ClientSession, bank: BankSource, dates: List[str], on_page: Optional[Callable[[str], None]] = None, extraction_pool=None) -> str:
+    """
+    GETs a server-rendered forex page and selects the bank's target from it.
+    For `handle_date` banks each date in `dates` is tried in order.
+    `on_page` sees the raw page before it's parsed and may raise to skip it.
+    With an ExtractionPool, parsing the whole page runs in its workers, so
+    only the I/O happens on the event loop.
+    """
+    forex_page = bank.forex_page
+
+    if bank.handle_date:
+        # Today and the last good date are fetched together, the rest only if neither has rates
+        ordered = order_candidate_dates(bank.name, dates)
+        error = None
+        for candidates in (ordered[:2], ordered[2:]):
+            pages = await asyncio.gather(
+                *(fetch_text(session, substitute_date(forex_page, date)) for date in candidates),
+                return_exceptions=True,
+            )
+            # Newest date with records wins; dates are yyyy-mm-dd so they sort as strings
+            for date, html in sorted(zip(candidates, pages), reverse=True):
+                if isinstance(html, BaseException):
+                    if not isinstance(html, Exception):
+                        raise html
+                    # e.g. today's page 404s before publication; an older date may still have rates
+                    print(f"❌ Fetching date {date} failed: {html}")
+                    error = error or html
+                    continue
+                if NO_RECORD_TEXT in html:
+                    print(f"❌ No table for date {date}")
+                    continue
+                print(f"✅ Table found for date {date}")
+                remember_good_date(bank.name, date)
+                if on_page is not None:
+                    on_page(html)
+                return await _parse(extraction_pool, bank.target.select, html)
+        if error is not None:
+            raise error
+        raise ElementNotFound(f"No records for the last {len(dates)} days")
+
+    print(f"Fetching {forex_page}")
+    html = await fetch_text(session, forex_page)
+
+    # e.g. Himalayan lists dates, the rates are behind the latest one
+    if isinstance(bank.target, LinkTarget):
+        html = await fetch_text(session, await _parse(extraction_pool, bank.target.find_link, html, forex_page))
+
+    if on_page is not None:
+        on_page(html)
+    return await _parse(extraction_pool, bank.target.select, html)
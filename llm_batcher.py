@@ -0,0 +1,215 @@
+import asyncio
+import contextvars
+from typing import Optional, Dict, Any, List, Callable
+
+from llm_cache import LLMResponseCache
+from run_report import span, record_value
+from scrape_scheduler import queue_wait, LLM_TIMEOUT_MS
+
+DATA_PLACEHOLDER = "{PASTE_THE_BANK_DATA_HERE}"
+
+# Rough size estimate, good enough to keep requests well under the model limit
+CHARS_PER_TOKEN = 4
+BATCH_TOKEN_BUDGET = 30_000
+BATCH_MAX_BANKS = 8
+# How long the first bank in a batch waits for others to join it
+BATCH_WINDOW_SECONDS = 1.5
+# A batch gets the single-request timeout plus this for every other bank in it
+BATCH_TIMEOUT_PER_BANK_SECONDS = 15
+
+BATCH_INSTRUCTIONS = """
+The data above contains forex data for {count} different banks. Each bank's data is wrapped in its own <bank id="..."></bank> element. Extract every bank separately, following all of the rules above, and respond with only one JSON object of this form:
+
+{{"banks": {{"<bank id>": <the JSON object for that bank>}}}}
+
+There must be exactly one key for each of these bank ids: {ids}.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def batch_timeout_seconds(bank_count: int) -> float:
+    return LLM_TIMEOUT_MS / 1000 + BATCH_TIMEOUT_PER_BANK_SECONDS * max(0, bank_count - 1)
+
+
+def is_valid_extraction(result: Any) -> bool:
+    """Checks a single bank's extraction has the shape prompt.txt asks for."""
+    if not isinstance(result, dict) or not isinstance(result.get('rates'), list):
+        return False
+    for entry in result['rates']:
+        if not isinstance(entry, dict):
+            return False
+        currency = entry.get('currency')
+        if not isinstance(currency, dict) or not isinstance(currency.get('iso_code'), str):
+            return False
+        if not isinstance(entry.get('rates'), dict):
+            return False
+    return True
+
+
+def build_batch_prompt(template: str, payloads: Dict[str, str]) -> str:
+    """Packs several banks' payloads, tagged by id, into one prompt."""
+    blocks = "\n".join(f'<bank id="{bank_id}">\n{payload}\n</bank>' for bank_id, payload in payloads.items())
+    ids = ", ".join(payloads)
+    return template.replace(DATA_PLACEHOLDER, blocks) + BATCH_INSTRUCTIONS.format(count=len(payloads), ids=ids)
+
+
+def split_batch_response(response: Any, bank_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Maps each bank id to its extraction, or None if the model left it out
+    or returned something that doesn't match the schema.
+    """
+    banks = response.get('banks') if isinstance(response, dict) else None
+    if not isinstance(banks, dict):
+        banks = {}
+    return {
+        bank_id: banks.get(bank_id) if is_valid_extraction(banks.get(bank_id)) else None
+        for bank_id in bank_ids
+    }
+
+
+class LLMBatcher:
+    """
+    Collects the banks that need the LLM during a run and sends them to
+    Gemini in a few combined requests instead of one request each.
+
+    The first bank to arrive opens a batch. The batch is sent when it fills
+    up (by bank count or estimated tokens) or after `window_seconds`, with a
+    timeout that grows with its size. The response is split back per bank
+    and validated. Banks the model skipped or got wrong, every bank of a
+    batch that failed or timed out, and banks left alone in a batch send a
+    request of their own, from their own task, so it counts as their work.
+    Results are cached per bank, with the same keys as single-bank requests.
+
+    `send_prompt(prompt, timeout_seconds)` makes one blocking request.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        send_prompt: Callable[[str], Optional[Dict[str, Any]]],
+        template: str,
+        llm_cache: Optional[LLMResponseCache] = None,
+        token_budget: int = BATCH_TOKEN_BUDGET,
+        max_banks: int = BATCH_MAX_BANKS,
+        window_seconds: float = BATCH_WINDOW_SECONDS,
+    ):
+        self.scheduler = scheduler
+        self.send_prompt = send_prompt
+        self.template = template
+        self.llm_cache = llm_cache
+        self.token_budget = token_budget
+        self.max_banks = max(1, max_banks)
+        self.window_seconds = window_seconds
+        self.requests = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_tokens = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._next_id = 0
+        # Keeps in-flight batch tasks referenced until they finish
+        self._tasks = set()
+
+    async def extract(self, bank_data: str) -> Optional[Dict[str, Any]]:
+        """Returns the extraction for one bank's cleaned payload, or None."""
+        cache_key = None
+        if self.llm_cache is not None:
+            cache_key = self.llm_cache.make_key(self.template, bank_data)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                print("Using cached Gemini response")
+                return cached
+
+        # A cache miss: this bank's extraction reaches Gemini, in a batch or alone
+        record_value('llm_requested', True)
+        tokens = estimate_tokens(bank_data)
+        if self._pending and self._pending_tokens + tokens > self.token_budget:
+            self._flush()
+
+        self._next_id += 1
+        item = {
+            'id': f"b{self._next_id}",
+            'payload': bank_data,
+            'cache_key': cache_key,
+            # Resolved once the batch's request has an LLM slot
+            'started': asyncio.get_running_loop().create_future(),
+            'future': asyncio.get_running_loop().create_future(),
+        }
+        self._pending.append(item)
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_banks or self._pending_tokens >= self.token_budget:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+
+        # A shared request isn't this bank's own work, nor is waiting for it
+        # to fill and get a slot; the batch timeout bounds it instead
+        with queue_wait():
+            await item['started']
+            with span('llm_request'):
+                result = await item['future']
+        if result is not None:
+            return result
+
+        result = await self._send_one(bank_data)
+        if not is_valid_extraction(result):
+            return None
+        if cache_key is not None:
+            self.llm_cache.set(cache_key, result)
+        return result
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            # A fresh context, so the batch isn't timed as whichever bank happened to flush it
+            task = contextvars.Context().run(asyncio.create_task, self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send_one(self, payload: str) -> Optional[Dict[str, Any]]:
+        self.requests += 1
+        prompt = self.template.replace(DATA_PLACEHOLDER, payload)
+        timeout = LLM_TIMEOUT_MS / 1000
+        return await self.scheduler.run_llm(self.send_prompt, prompt, timeout, timeout_seconds=timeout)
+
+    async def _send(self, batch: List[Dict[str, Any]]):
+        """Resolves each bank's future with its extraction, or None for it to send alone."""
+        def started():
+            for item in batch:
+                if not item['started'].done():
+                    item['started'].set_result(None)
+
+        results = {}
+        # A bank alone in its batch sends its own request
+        if len(batch) > 1:
+            try:
+                print(f"Sending {len(batch)} banks to Gemini in one request")
+                self.requests += 1
+                prompt = build_batch_prompt(self.template, {item['id']: item['payload'] for item in batch})
+                timeout = batch_timeout_seconds(len(batch))
+                response = await self.scheduler.run_llm(self.send_prompt, prompt, timeout, timeout_seconds=timeout, on_start=started)
+                results = split_batch_response(response, [item['id'] for item in batch])
+                missing = sum(1 for result in results.values() if result is None)
+                if missing:
+                    print(f"Gemini batch left out {missing} bank(s), retrying them one by one")
+            except asyncio.CancelledError:
+                for item in batch:
+                    item['started'].cancel()
+                    item['future'].cancel()
+                raise
+            except Exception as e:
+                # e.g. a timeout: retrying the same batch would likely time out again
+                print(f"Gemini batch of {len(batch)} banks failed ({type(e).__name__}: {e}), retrying them one by one")
+
+        started()
+        for item in batch:
+            result = results.get(item['id'])
+            if result is not None and item['cache_key'] is not None:
+                self.llm_cache.set(item['cache_key'], result)
+            if not item['future'].done():
+                item['future'].set_result(result)
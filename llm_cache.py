@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import time
+import hashlib
+import tempfile
+from typing import Optional, Dict, Any, Tuple
+
+
+def normalise_payload(payload: str) -> str:
+    """
+    Collapses whitespace so that re-indented HTML/JSON for the same rates
+    maps to the same cache key.
+    """
+    return re.sub(r'\s+', ' ', payload).strip()
+
+
+class LLMResponseCache:
+    """
+    On-disk cache of parsed Gemini responses, keyed by a hash of the prompt
+    template plus the normalised bank payload.
+
+    Entries expire after `ttl_seconds`. When the cache grows past
+    `max_entries` or `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".cache/llm",
+        ttl_seconds: int = 12 * 60 * 60,
+        max_entries: int = 1000,
+        max_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # path -> (inode, created_at), so eviction reads each entry at most
+        # once; a rewritten entry gets a new inode from os.replace
+        self._created: Dict[str, Tuple[int, float]] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(template: str, payload: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(template.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(normalise_payload(payload).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+                inode = os.fstat(f.fileno()).st_ino
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self._created[path] = (inode, entry.get('created_at', 0))
+
+        if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Bump the mtime so eviction is least-recently-used
+        os.utime(path)
+        self.hits += 1
+        return entry['response']
+
+    def set(self, key: str, response: Dict[str, Any]):
+        path = self._path(key)
+        created_at = time.time()
+        # A temp file of its own, so concurrent writers of one key don't interleave
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"created_at": created_at, "response": response}, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._created[path] = (os.stat(path).st_ino, created_at)
+        self.evict()
+
+    def discard(self, key: str):
+        """Drops an entry, e.g. a response that failed validation."""
+        self._remove(self._path(key))
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used ones until the
+        cache fits. Expiry goes by each entry's `created_at`, like `get()`;
+        mtime only orders entries by last use, since hits bump it.
+        """
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # mtime is never older than created_at, so an old mtime settles it without reading the file
+            if now - stat.st_mtime > self.ttl_seconds or now - self._created_at(path, stat.st_ino) > self.ttl_seconds:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        # Least recently used first
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        remaining = len(entries)
+        for mtime, size, path in entries:
+            if remaining <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            remaining -= 1
+            total_bytes -= size
+
+    def _created_at(self, path: str, inode: int) -> float:
+        """When the entry was stored; 0 (expired) for unreadable entries, which get() can't use either."""
+        cached_inode, created_at = self._created.get(path, (None, None))
+        if cached_inode != inode:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    created_at = float(json.load(f).get('created_at', 0))
+            except (OSError, ValueError, AttributeError, TypeError):
+                created_at = 0
+            self._created[path] = (inode, created_at)
+        return created_at
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._created.pop(path, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
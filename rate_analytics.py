@@ -0,0 +1,325 @@
+import argparse
+import sys
+import time
+import warnings
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple, Sequence
+
+import numpy as np
+
+from history_store import HistoryStore, HISTORY_DB_PATH, format_utc_timestamp, parse_utc_timestamp
+from rate_index import BEST_IS_HIGHEST
+from rate_validator import RATE_FIELDS, per_unit_rates
+from snapshot_writer import load_snapshot, CURRENT_RATE_PATH
+
+HOME_CURRENCY = 'NPR'
+BUY_CASH, BUY_NON_CASH, SELL = (RATE_FIELDS.index(field) for field in ('buy_cash', 'buy_non_cash', 'sell'))
+
+DAY_SECONDS = 24 * 60 * 60
+# Rates are only stored when they change, so a bank's last rates stay
+# current for as long as it keeps being fetched, but no longer than this
+# after its last fetch. A currency the bank stops quoting is closed by a
+# tombstone row of NULLs, which reads as NaN
+MAX_QUOTE_AGE_SECONDS = 3 * DAY_SECONDS
+
+
+def _usual_unit(units: Sequence[float]) -> int:
+    """The unit most banks quote in, ties going to the larger one (e.g. JPY per 10), like the UI index."""
+    counts = Counter(units)
+    if not counts:
+        return 1
+    return int(max(counts.items(), key=lambda item: (item[1], item[0]))[0])
+
+
+def _latest_at(groups: np.ndarray, times: np.ndarray, group_count: int, sample_times: np.ndarray) -> np.ndarray:
+    """
+    Index of each group's last event at or before each sample time, shape
+    (samples, groups), -1 where there is none. Events must be sorted by
+    group, then time. One searchsorted over combined (group, time) keys
+    replaces a forward-fill loop per bank and currency.
+    """
+    if not len(times) or not len(sample_times):
+        return np.full((len(sample_times), group_count), -1)
+    base = min(int(times.min()), int(sample_times.min()))
+    span = max(int(times.max()), int(sample_times.max())) - base + 1
+    keys = groups.astype(np.int64) * span + (times - base)
+    all_groups = np.arange(group_count, dtype=np.int64)
+    queries = all_groups[None, :] * span + (sample_times[:, None] - base)
+    found = np.searchsorted(keys, queries, side='right') - 1
+    same_group = groups[np.maximum(found, 0)] == all_groups[None, :]
+    return np.where((found >= 0) & same_group, found, -1)
+
+
+class RateCube:
+    """
+    Rates as one float array indexed [time, bank, currency, field], in NPR
+    per single unit of the currency, so JPY quoted per 10 and INR per 100
+    compare directly. Missing quotes are NaN. Queries reduce over the bank
+    axis for every time and currency at once.
+    """
+
+    def __init__(self, times: Sequence[int], banks: List[str], currencies: List[str], values: np.ndarray, units: Sequence[int]):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.banks = banks
+        self.currencies = currencies
+        self.values = values
+        # The unit most banks quote each currency in, for display
+        self.units = np.asarray(units, dtype=float)
+        self._currency_index = {iso_code: index for index, iso_code in enumerate(currencies)}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> 'RateCube':
+        """One time step: current_rate.json's valid rows, first row per currency."""
+        per_bank: Dict[str, Dict[str, Dict[str, float]]] = {}
+        quoted_units: Dict[str, List[int]] = {}
+        for bank in snapshot.get('all_banks', []):
+            if not bank or not bank.get('bank_name'):
+                continue
+            rates = per_unit_rates(bank)
+            if not rates:
+                continue
+            per_bank[bank['bank_name']] = rates
+            seen = set()
+            for entry in bank.get('rates') or []:
+                iso_code = entry['currency'].get('iso_code') if isinstance(entry, dict) and isinstance(entry.get('currency'), dict) else None
+                if iso_code in rates and iso_code not in seen:
+                    seen.add(iso_code)
+                    quoted_units.setdefault(iso_code, []).append(entry['currency'].get('unit') or 1)
+
+        banks = sorted(per_bank)
+        currencies = sorted(quoted_units)
+        column = {iso_code: index for index, iso_code in enumerate(currencies)}
+        values = np.full((1, len(banks), len(currencies), len(RATE_FIELDS)), np.nan)
+        for row, name in enumerate(banks):
+            for iso_code, fields in per_bank[name].items():
+                for index, field in enumerate(RATE_FIELDS):
+                    values[0, row, column[iso_code], index] = fields.get(field, np.nan)
+
+        updated = parse_utc_timestamp(snapshot.get('last_updated_utc')) or int(time.time())
+        return cls([updated], banks, currencies, values, [_usual_unit(quoted_units[iso_code]) for iso_code in currencies])
+
+    @classmethod
+    def from_history(cls, store: HistoryStore, start: Optional[int] = None, end: Optional[int] = None,
+                     step_seconds: int = DAY_SECONDS, max_age_seconds: Optional[int] = MAX_QUOTE_AGE_SECONDS) -> 'RateCube':
+        """
+        Samples the history every `step_seconds` from `start` to `end`
+        (default: the first change to the last fetch), each sample holding
+        every bank's latest rates at that time. A bank not fetched within
+        `max_age_seconds` before a sample is left out of it.
+        """
+        changes = store.rate_changes(end)
+        if not changes:
+            return cls([], [], [], np.empty((0, 0, 0, len(RATE_FIELDS))), [])
+
+        rows = np.array(changes, dtype=float)
+        bank_ids, bank_rows = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+        currency_ids, currency_columns = np.unique(rows[:, 1].astype(np.int64), return_inverse=True)
+        change_times = rows[:, 2].astype(np.int64)
+        quoted = ~np.isnan(rows[:, 3:]).all(axis=1)
+        quoted_units = np.where(rows[:, 3] > 0, rows[:, 3], 1)
+        rates = rows[:, 4:] / quoted_units[:, None]
+        rates[rates <= 0] = np.nan
+
+        if end is None:
+            last_fetches = [parse_utc_timestamp(fetched_at) for fetched_at in store.last_fetches().values()]
+            end = int(max(change_times.max(), *last_fetches))
+        if start is None:
+            start = int(change_times.min())
+        samples = np.arange(end, start - 1, -step_seconds, dtype=np.int64)[::-1]
+
+        bank_count, currency_count = len(bank_ids), len(currency_ids)
+        groups = bank_rows * currency_count + currency_columns
+        order = np.lexsort((change_times, groups))
+        latest = _latest_at(groups[order], change_times[order], bank_count * currency_count, samples)
+        values = np.where((latest >= 0)[..., None], rates[order][np.maximum(latest, 0)], np.nan)
+        values = values.reshape(len(samples), bank_count, currency_count, len(RATE_FIELDS))
+
+        if max_age_seconds is not None and len(samples):
+            fetches = np.array(store.last_fetch_by_step(end, step_seconds, len(samples)), dtype=np.int64).reshape(-1, 3)
+            positions = np.minimum(np.searchsorted(bank_ids, fetches[:, 0]), bank_count - 1)
+            known = bank_ids[positions] == fetches[:, 0]
+            last_fetch = np.full((len(samples), bank_count), -np.inf)
+            last_fetch[len(samples) - 1 - fetches[known, 1], positions[known]] = fetches[known, 2]
+            last_fetch = np.maximum.accumulate(last_fetch, axis=0)
+            values[samples[:, None] - last_fetch > max_age_seconds] = np.nan
+
+        bank_names, currency_codes = store.ids()
+        units = [_usual_unit(quoted_units[quoted & (currency_columns == column)].tolist()) for column in range(currency_count)]
+        return cls(
+            samples,
+            [bank_names[bank_id] for bank_id in bank_ids.tolist()],
+            [currency_codes[currency_id] for currency_id in currency_ids.tolist()],
+            values,
+            units,
+        )
+
+    def currency(self, iso_code: str) -> int:
+        try:
+            return self._currency_index[iso_code.upper()]
+        except KeyError:
+            raise KeyError(f"No bank quotes {iso_code.upper()}") from None
+
+    def rates(self, field: str) -> np.ndarray:
+        """(time, bank, currency) per unit for a RATE_FIELDS field or 'spread'."""
+        if field == 'spread':
+            return self.spreads()[0]
+        return self.values[..., RATE_FIELDS.index(field)]
+
+    def buy_rates(self, cash: bool = False) -> np.ndarray:
+        """What each bank pays per unit, (time, bank, currency), falling back to the other buying rate."""
+        primary, fallback = (BUY_CASH, BUY_NON_CASH) if cash else (BUY_NON_CASH, BUY_CASH)
+        rates = self.values[..., primary]
+        return np.where(np.isnan(rates), self.values[..., fallback], rates)
+
+    def spreads(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Selling minus non-cash buying per unit, and as a percent of the mid rate, each (time, bank, currency)."""
+        buy = self.buy_rates()
+        sell = self.values[..., SELL]
+        spread = sell - buy
+        return spread, spread / ((sell + buy) / 2) * 100
+
+    def best(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The best `field` across banks (highest buying, lowest selling and
+        spread) and the bank index offering it, each (time, currency).
+        Currencies nobody quotes get NaN and bank -1.
+        """
+        rates = self.rates(field)
+        highest = BEST_IS_HIGHEST[field]
+        missing = np.isnan(rates)
+        filled = np.where(missing, -np.inf if highest else np.inf, rates)
+        bank = filled.argmax(axis=1) if highest else filled.argmin(axis=1)
+        value = np.take_along_axis(rates, bank[:, None, :], axis=1)[:, 0, :]
+        quoted = ~missing.all(axis=1)
+        return np.where(quoted, value, np.nan), np.where(quoted, bank, -1)
+
+    def deviation_from_median(self, field: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The median of all banks quoting `field`, (time, currency), and each
+        bank's distance from it per unit and in percent, (time, bank, currency).
+        """
+        rates = self.rates(field)
+        with warnings.catch_warnings():
+            # A currency nobody quotes at some time is an all-NaN slice
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(rates, axis=1)
+        deviation = rates - median[:, None, :]
+        return median, deviation, deviation / median[:, None, :] * 100
+
+    def convert(self, amounts: Sequence[float], from_code: str, to_code: str = HOME_CURRENCY, cash: bool = False, at: int = -1) -> np.ndarray:
+        """
+        What each amount of `from_code` comes to in `to_code` at every bank,
+        (amount, bank), at time index `at`. Banks buy at their buying rate
+        and sell at their selling rate, so AUD to USD goes through NPR.
+        NaN where a bank doesn't quote a currency.
+        """
+        from_code, to_code = from_code.upper(), to_code.upper()
+        if from_code == to_code:
+            raise ValueError("Nothing to convert between the same currency")
+        receive = np.ones(len(self.banks)) if from_code == HOME_CURRENCY else self.buy_rates(cash)[at, :, self.currency(from_code)]
+        pay = np.ones(len(self.banks)) if to_code == HOME_CURRENCY else self.values[at, :, self.currency(to_code), SELL]
+        return np.asarray(amounts, dtype=float)[:, None] * (receive / pay)[None, :]
+
+
+def print_best(cube: RateCube, iso_codes: List[str], fields: List[str]):
+    columns = [cube.currency(iso_code) for iso_code in iso_codes] if iso_codes else range(len(cube.currencies))
+    best = {field: cube.best(field) for field in fields}
+    for step, timestamp in enumerate(cube.times):
+        print(format_utc_timestamp(int(timestamp)))
+        for column in columns:
+            unit = int(cube.units[column])
+            for field in fields:
+                value, bank = best[field][0][step, column], best[field][1][step, column]
+                if bank >= 0:
+                    print(f"  {cube.currencies[column]:4} {field:13}{value * unit:>11.4f} per {unit:<5} {cube.banks[bank]}")
+
+
+def print_ranking(title: str, cube: RateCube, rows: List[Tuple[str, str]]):
+    print(f"{title} at {format_utc_timestamp(int(cube.times[-1]))}")
+    for text, bank in rows:
+        print(f"  {text}  {bank}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare rates across banks: best rates, spreads, outliers and conversions")
+    parser.add_argument('--snapshot', default=CURRENT_RATE_PATH, help="current_rate.json to analyse")
+    parser.add_argument('--history', action='store_true', help="Analyse the rate history instead of the snapshot")
+    parser.add_argument('--db', default=HISTORY_DB_PATH)
+    parser.add_argument('--start', help="With --history, first UTC time to sample (default: the first record)")
+    parser.add_argument('--end', help="With --history, last UTC time to sample (default: the last fetch)")
+    parser.add_argument('--step-hours', type=float, default=24, help="With --history, hours between samples")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    best_parser = subparsers.add_parser('best', help="Best rates per currency and the banks offering them")
+    best_parser.add_argument('iso_codes', nargs='*', help="Defaults to every currency")
+    best_parser.add_argument('--field', choices=list(BEST_IS_HIGHEST), help="Defaults to every rate and the spread")
+
+    spread_parser = subparsers.add_parser('spread', help="Each bank's spread for a currency, narrowest first")
+    spread_parser.add_argument('iso_code')
+
+    deviation_parser = subparsers.add_parser('deviation', help="Each bank's distance from the median rate, furthest first")
+    deviation_parser.add_argument('iso_code')
+    deviation_parser.add_argument('--field', choices=RATE_FIELDS, default='sell')
+
+    convert_parser = subparsers.add_parser('convert', help="Convert amounts at every bank, best first")
+    convert_parser.add_argument('from_code')
+    convert_parser.add_argument('amounts', type=float, nargs='+')
+    convert_parser.add_argument('--to', default=HOME_CURRENCY, help="Currency to convert to (default: %(default)s)")
+    convert_parser.add_argument('--cash', action='store_true', help="Use cash buying rates")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.history:
+        with HistoryStore(args.db) as store:
+            cube = RateCube.from_history(
+                store,
+                start=parse_utc_timestamp(args.start),
+                end=parse_utc_timestamp(args.end),
+                step_seconds=max(1, int(args.step_hours * 3600)),
+            )
+    else:
+        cube = RateCube.from_snapshot(load_snapshot(args.snapshot))
+    if not len(cube.times) or not cube.banks:
+        print(f"No rates in {args.db if args.history else args.snapshot}")
+        return 1
+
+    try:
+        if args.command == 'best':
+            print_best(cube, args.iso_codes, [args.field] if args.field else list(BEST_IS_HIGHEST))
+
+        elif args.command == 'spread':
+            column = cube.currency(args.iso_code)
+            unit = int(cube.units[column])
+            spread, percent = (values[-1, :, column] for values in cube.spreads())
+            order = [bank for bank in np.argsort(percent) if not np.isnan(percent[bank])]
+            print_ranking(f"{cube.currencies[column]} spread per {unit}", cube, [
+                (f"{spread[bank] * unit:>10.4f} {percent[bank]:>6.2f}%", cube.banks[bank]) for bank in order
+            ])
+
+        elif args.command == 'deviation':
+            column = cube.currency(args.iso_code)
+            unit = int(cube.units[column])
+            median, deviation, percent = cube.deviation_from_median(args.field)
+            deviation, percent = deviation[-1, :, column], percent[-1, :, column]
+            order = [bank for bank in np.argsort(-np.abs(percent)) if not np.isnan(percent[bank])]
+            print_ranking(f"{cube.currencies[column]} {args.field} per {unit}, median {median[-1, column] * unit:.4f},", cube, [
+                (f"{deviation[bank] * unit:>+10.4f} {percent[bank]:>+7.2f}%", cube.banks[bank]) for bank in order
+            ])
+
+        elif args.command == 'convert':
+            results = cube.convert(args.amounts, args.from_code, args.to, cash=args.cash)
+            for amount, row in zip(args.amounts, results):
+                order = [bank for bank in np.argsort(-row) if not np.isnan(row[bank])]
+                print_ranking(f"{amount:g} {args.from_code.upper()} to {args.to.upper()}", cube, [
+                    (f"{row[bank]:>14,.2f}", cube.banks[bank]) for bank in order
+                ])
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+
+from rate_validator import ISO_CURRENCY_CODES
+from snapshot_writer import write_json_atomic, load_snapshot, CURRENT_RATE_PATH
+
+RATE_INDEX_DIR = 'ui/data'
+CURRENCY_LIST_FILE = 'currencies.json'
+CURRENCY_DIR = 'currency'
+
+RATE_FIELDS = ('buy_cash', 'buy_non_cash', 'sell')
+# Row layout of the per-currency files, kept as arrays to stay small
+COLUMNS = ['bank', 'source_url', 'buy_cash', 'buy_non_cash', 'sell', 'spread', 'published_date']
+# Higher buying rates and lower selling rates are better for the customer
+BEST_IS_HIGHEST = {'buy_cash': True, 'buy_non_cash': True, 'sell': False, 'spread': False}
+
+
+def _scale(value: Optional[float], factor: float) -> Optional[float]:
+    return round(value * factor, 4) if isinstance(value, (int, float)) else None
+
+
+def _common_unit(entries: List[Dict[str, Any]]) -> int:
+    units = Counter(entry['currency'].get('unit') or 1 for entry in entries)
+    # Most banks agree; ties go to the larger unit (e.g. JPY per 10)
+    return max(units.items(), key=lambda item: (item[1], item[0]))[0]
+
+
+def _sort_order(rows: List[List[Any]], column: int, numeric: bool) -> List[int]:
+    """Row indices sorted ascending by `column`, rows without a value left out."""
+    present = [index for index, row in enumerate(rows) if row[column] is not None]
+    if numeric:
+        return sorted(present, key=lambda index: rows[index][column])
+    return sorted(present, key=lambda index: rows[index][column].lower())
+
+
+def build_currency_index(snapshot: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Turns current_rate.json into a small currency list plus one file per
+    ISO code. Each currency file has one row per bank, with rates converted
+    to the unit most banks quote, the best rates and sort orders for every
+    column, so the UI doesn't scan or sort anything itself.
+    """
+    by_currency: Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]] = {}
+    for bank in snapshot.get('all_banks', []):
+        if not bank:
+            continue
+        seen = set()
+        for entry in bank.get('rates') or []:
+            iso_code = (entry.get('currency') or {}).get('iso_code')
+            # The first row wins if a bank lists a currency twice (e.g. AUD cash)
+            if not iso_code or iso_code in seen or not isinstance(entry.get('rates'), dict):
+                continue
+            # Snapshots from before scrape-time validation may still hold non-ISO rows (e.g. "KRWR")
+            if iso_code not in ISO_CURRENCY_CODES:
+                continue
+            seen.add(iso_code)
+            by_currency.setdefault(iso_code, []).append((bank, entry))
+
+    generated = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    currencies = {}
+    summary = []
+    for iso_code, pairs in by_currency.items():
+        unit = _common_unit([entry for _, entry in pairs])
+        rows = []
+        for bank, entry in pairs:
+            factor = unit / (entry['currency'].get('unit') or 1)
+            values = [_scale(entry['rates'].get(field), factor) for field in RATE_FIELDS]
+            if all(value is None for value in values):
+                continue
+            buy = values[1] if values[1] is not None else values[0]
+            spread = round(values[2] - buy, 4) if values[2] is not None and buy is not None else None
+            rows.append([bank.get('bank_name'), bank.get('source_url'), *values, spread, bank.get('published_date')])
+        if not rows:
+            continue
+
+        order = {'bank': _sort_order(rows, 0, numeric=False)}
+        best = {}
+        for field, highest in BEST_IS_HIGHEST.items():
+            column = COLUMNS.index(field)
+            order[field] = _sort_order(rows, column, numeric=True)
+            if order[field]:
+                index = order[field][-1] if highest else order[field][0]
+                best[field] = {'value': rows[index][column], 'row': index}
+
+        names = Counter(entry['currency'].get('name') for _, entry in pairs if entry['currency'].get('name'))
+        name = names.most_common(1)[0][0] if names else iso_code
+        currencies[iso_code] = {
+            'iso_code': iso_code,
+            'name': name,
+            'unit': unit,
+            'generated_utc': generated,
+            'columns': COLUMNS,
+            'rows': rows,
+            'order': order,
+            'best': best,
+        }
+        summary.append({
+            'iso_code': iso_code,
+            'name': name,
+            'unit': unit,
+            'banks': len(rows),
+            'best': {field: value['value'] for field, value in best.items()},
+        })
+
+    # USD first, the rest alphabetical, matching the dropdown
+    summary.sort(key=lambda item: (item['iso_code'] != 'USD', item['iso_code']))
+    return {'generated_utc': generated, 'currencies': summary}, currencies
+
+
+def _write_if_changed(path: str, data: Dict[str, Any]) -> bool:
+    """Skips the write when only generated_utc would change, so file mtimes/ETags stay put."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        existing = None
+
+    strip = lambda value: {key: item for key, item in value.items() if key != 'generated_utc'}
+    if existing is not None and strip(existing) == strip(data):
+        return False
+    write_json_atomic(path, data, ensure_ascii=False, separators=(',', ':'))
+    return True
+
+
+def write_rate_index(snapshot: Dict[str, Any], directory: str = RATE_INDEX_DIR) -> int:
+    """Writes currencies.json and currency/<ISO>.json. Returns how many files changed."""
+    summary, currencies = build_currency_index(snapshot)
+    currency_dir = os.path.join(directory, CURRENCY_DIR)
+    changed = 0
+    for iso_code, data in currencies.items():
+        changed += _write_if_changed(os.path.join(currency_dir, f"{iso_code}.json"), data)
+    changed += _write_if_changed(os.path.join(directory, CURRENCY_LIST_FILE), summary)
+
+    # Currencies no bank quotes any more
+    for filename in os.listdir(currency_dir) if os.path.isdir(currency_dir) else []:
+        if filename.endswith('.json') and filename[:-len('.json')] not in currencies:
+            os.remove(os.path.join(currency_dir, filename))
+            changed += 1
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the UI's per-currency index from current_rate.json")
+    parser.add_argument('--snapshot', default=CURRENT_RATE_PATH)
+    parser.add_argument('--out', default=RATE_INDEX_DIR)
+    args = parser.parse_args()
+
+    changed = write_rate_index(load_snapshot(args.snapshot), args.out)
+    print(f"Updated {changed} index file(s) in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import Optional, Dict, Any
+
+from aiohttp import web
+
+from snapshot_writer import load_snapshot, CURRENT_RATE_PATH
+from rate_index import build_currency_index, COLUMNS
+
+# brotli is smaller than gzip for JSON; use it when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_PORT = 8080
+# Rates change a few times a day at most
+CACHE_MAX_AGE_SECONDS = 60
+SNAPSHOT_POLL_SECONDS = 1.0
+
+
+class EncodedBody:
+    """A response body serialised once, with its compressed forms and ETag."""
+
+    __slots__ = ('identity', 'gzip', 'br', 'etag')
+
+    def __init__(self, data: Any):
+        self.identity = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.gzip = gzip.compress(self.identity, compresslevel=9, mtime=0)
+        self.br = brotli.compress(self.identity, quality=11) if brotli is not None else None
+        # Weak: the gzip and brotli forms are the same representation
+        self.etag = f'W/"{hashlib.sha256(self.identity).hexdigest()[:32]}"'
+
+
+def bank_key(name: str) -> str:
+    """'Nabil Bank Limited' and 'nabil-bank-limited' both map to 'nabil-bank-limited'."""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+class RateSnapshot:
+    """Every endpoint's body for one current_rate.json, built up front."""
+
+    def __init__(self, snapshot: Dict[str, Any], mtime: float):
+        self.mtime = mtime
+        banks = [bank for bank in snapshot.get('all_banks', []) if bank and bank.get('bank_name')]
+        summary, currencies = build_currency_index(snapshot)
+
+        self.rates = EncodedBody({'last_updated_utc': snapshot.get('last_updated_utc'), 'all_banks': banks})
+        self.banks = {bank_key(bank['bank_name']): EncodedBody(bank) for bank in banks}
+        self.currencies = {iso_code: EncodedBody(data) for iso_code, data in currencies.items()}
+        self.best = {iso_code: EncodedBody(self.best_rates(data)) for iso_code, data in currencies.items()}
+        self.currency_list = EncodedBody(summary)
+
+    @staticmethod
+    def best_rates(currency: Dict[str, Any]) -> Dict[str, Any]:
+        bank_column, url_column = COLUMNS.index('bank'), COLUMNS.index('source_url')
+        best = {}
+        for field, value in currency['best'].items():
+            row = currency['rows'][value['row']]
+            best[field] = {'value': value['value'], 'bank': row[bank_column], 'source_url': row[url_column]}
+        return {'iso_code': currency['iso_code'], 'name': currency['name'], 'unit': currency['unit'], 'best': best}
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip().lower() == coding:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses weak comparison
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+
+class RateServer:
+    """
+    Serves the latest snapshot from memory. Bodies are precomputed per
+    snapshot, so a request is a dict lookup plus headers, and a background
+    task swaps in a new RateSnapshot whenever the scraper replaces
+    current_rate.json.
+    """
+
+    def __init__(self, snapshot_path: str = CURRENT_RATE_PATH, max_age: int = CACHE_MAX_AGE_SECONDS, poll_seconds: float = SNAPSHOT_POLL_SECONDS):
+        self.snapshot_path = snapshot_path
+        self.cache_control = f'public, max-age={max_age}'
+        self.poll_seconds = poll_seconds
+        self.current: Optional[RateSnapshot] = None
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.snapshot_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    async def reload_if_changed(self) -> bool:
+        mtime = self._mtime()
+        if mtime is None or (self.current is not None and self.current.mtime == mtime):
+            return False
+        # Building bodies and compressing is CPU work; keep it off the loop
+        snapshot = await asyncio.to_thread(lambda: RateSnapshot(load_snapshot(self.snapshot_path), mtime))
+        self.current = snapshot
+        print(f"Loaded {self.snapshot_path}: {len(snapshot.banks)} banks, {len(snapshot.currencies)} currencies")
+        return True
+
+    async def watch(self):
+        # SnapshotWriter replaces the file atomically, so a new mtime means a complete file
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                print(f"Could not reload {self.snapshot_path}, still serving the previous snapshot: {e}")
+
+    def respond(self, request: web.Request, body: Optional[EncodedBody]) -> web.Response:
+        if body is None:
+            return web.json_response({'error': 'not found'}, status=404)
+
+        headers = {
+            'ETag': body.etag,
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if _etag_matches(request.headers.get('If-None-Match', ''), body.etag):
+            return web.Response(status=304, headers=headers)
+
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        payload = body.identity
+        if body.br is not None and _accepts(accept_encoding, 'br'):
+            payload = body.br
+            headers['Content-Encoding'] = 'br'
+        elif _accepts(accept_encoding, 'gzip'):
+            payload = body.gzip
+            headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=payload, headers=headers, content_type='application/json', charset='utf-8')
+
+    def _snapshot(self) -> RateSnapshot:
+        if self.current is None:
+            raise web.HTTPServiceUnavailable(text='{"error":"no snapshot yet"}', content_type='application/json')
+        return self.current
+
+    async def handle_rates(self, request: web.Request) -> web.Response:
+        return self.respond(request, self._snapshot().rates)
+
+    async def handle_currencies(self, request: web.Request) -> web.Response:
+        return self.respond(request, self._snapshot().currency_list)
+
+    async def handle_currency(self, request: web.Request) -> web.Response:
+        return self.respond(request, self._snapshot().currencies.get(request.match_info['iso_code'].upper()))
+
+    async def handle_bank(self, request: web.Request) -> web.Response:
+        return self.respond(request, self._snapshot().banks.get(bank_key(request.match_info['name'])))
+
+    async def handle_best(self, request: web.Request) -> web.Response:
+        return self.respond(request, self._snapshot().best.get(request.match_info['iso_code'].upper()))
+
+    async def _start_watching(self, app: web.Application):
+        await self.reload_if_changed()
+        watcher = asyncio.create_task(self.watch())
+        yield
+        watcher.cancel()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/rates', self.handle_rates)
+        app.router.add_get('/rates/{iso_code}', self.handle_currency)
+        app.router.add_get('/currencies', self.handle_currencies)
+        app.router.add_get('/banks/{name}', self.handle_bank)
+        app.router.add_get('/best/{iso_code}', self.handle_best)
+        app.cleanup_ctx.append(self._start_watching)
+        return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the latest forex rates over HTTP")
+    parser.add_argument('--snapshot', default=CURRENT_RATE_PATH, help="current_rate.json to serve and watch")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-age', type=int, default=CACHE_MAX_AGE_SECONDS, help="Cache-Control max-age in seconds")
+    parser.add_argument('--poll-interval', type=float, default=SNAPSHOT_POLL_SECONDS, help="Seconds between checks for a new snapshot")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = RateServer(args.snapshot, max_age=args.max_age, poll_seconds=args.poll_interval)
+    if brotli is None:
+        print("brotli isn't installed, serving gzip only")
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import statistics
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+from snapshot_writer import write_json_atomic, load_snapshot, CURRENT_RATE_PATH
+
+QUARANTINE_PATH = '.cache/quarantine.json'
+
+RATE_FIELDS = ('buy_cash', 'buy_non_cash', 'sell')
+VALID_UNITS = {1, 10, 100, 1000}
+
+# Relative difference, per unit, that marks a rate as an anomaly. Day to day
+# moves are well under this; a misplaced unit or decimal point (JPY per 1
+# vs per 10) is far over it.
+MAX_CHANGE_FROM_PREVIOUS = 0.2
+MAX_DEVIATION_FROM_MEDIAN = 0.3
+# The median is only meaningful with a few other banks quoting the currency
+MEDIAN_MIN_BANKS = 3
+# Buying above selling, beyond rounding, means the columns were mixed up
+BUY_ABOVE_SELL_TOLERANCE = 0.01
+
+# ISO 4217 currency codes
+ISO_CURRENCY_CODES = frozenset("""
+    AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND
+    BOB BRL BSD BTN BWP BYN BZD CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF
+    DKK DOP DZD EGP ERN ETB EUR FJD FKP GBP GEL GHS GIP GMD GNF GTQ GYD HKD
+    HNL HTG HUF IDR ILS INR IQD IRR ISK JMD JOD JPY KES KGS KHR KMF KPW KRW
+    KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR
+    MVR MWK MXN MYR MZN NAD NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN
+    PYG QAR RON RSD RUB RWF SAR SBD SCR SDG SEK SGD SHP SLE SOS SRD SSP STN
+    SVC SYP SZL THB TJS TMT TND TOP TRY TTD TWD TZS UAH UGX USD UYU UZS VES
+    VND VUV WST XAF XCD XOF XPF YER ZAR ZMW ZWL
+""".split())
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_schema(output: Any) -> List[str]:
+    """
+    Checks an extraction against the prompt.txt schema and unit sanity.
+    Returns one message per problem, empty if it's valid. Rows may have
+    every rate null; banks list currencies they don't deal in that day.
+    """
+    if not isinstance(output, dict):
+        return ['result is not an object']
+    if not isinstance(output.get('rates'), list):
+        return ['"rates" is not a list']
+
+    issues = []
+    for index, entry in enumerate(output['rates']):
+        currency = entry.get('currency') if isinstance(entry, dict) else None
+        rates = entry.get('rates') if isinstance(entry, dict) else None
+        if not isinstance(currency, dict) or not isinstance(rates, dict):
+            issues.append(f'rates[{index}]: missing "currency" or "rates" object')
+            continue
+
+        iso_code = currency.get('iso_code')
+        label = iso_code if isinstance(iso_code, str) else f'rates[{index}]'
+        if not isinstance(iso_code, str) or len(iso_code) != 3 or not iso_code.isupper():
+            issues.append(f'{label}: not a 3-letter currency code')
+        if not isinstance(currency.get('name'), str):
+            issues.append(f'{label}: missing currency name')
+        unit = currency.get('unit')
+        if not _is_number(unit) or unit not in VALID_UNITS:
+            issues.append(f'{label}: unit {unit!r} is not one of {sorted(VALID_UNITS)}')
+
+        values = {field: rates.get(field) for field in RATE_FIELDS}
+        for field, value in values.items():
+            if value is not None and (not _is_number(value) or value <= 0):
+                issues.append(f'{label}: {field} {value!r} is not a positive number')
+
+        sell = values['sell']
+        for field in ('buy_cash', 'buy_non_cash'):
+            buy = values[field]
+            if _is_number(buy) and _is_number(sell) and sell > 0 and buy > sell * (1 + BUY_ABOVE_SELL_TOLERANCE):
+                issues.append(f'{label}: {field} {buy} is above sell {sell}')
+    return issues
+
+
+def drop_unknown_currencies(output: Dict[str, Any]) -> List[str]:
+    """
+    Removes rows whose code isn't in ISO 4217 (e.g. a bank's own "KRWR"
+    remittance row), so they don't show up as currencies of their own.
+    Returns the dropped codes.
+    """
+    if not isinstance(output, dict) or not isinstance(output.get('rates'), list):
+        return []
+    kept, dropped = [], []
+    for entry in output['rates']:
+        iso_code = (entry.get('currency') or {}).get('iso_code') if isinstance(entry, dict) else None
+        if isinstance(iso_code, str) and iso_code not in ISO_CURRENCY_CODES:
+            dropped.append(iso_code)
+        else:
+            kept.append(entry)
+    output['rates'] = kept
+    return dropped
+
+
+def per_unit_rates(bank: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """{iso_code: {field: rate for one unit}}, first row per currency, valid rows only."""
+    result = {}
+    for entry in bank.get('rates') or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get('currency'), dict) or not isinstance(entry.get('rates'), dict):
+            continue
+        iso_code = entry['currency'].get('iso_code')
+        unit = entry['currency'].get('unit') or 1
+        if iso_code in result or not _is_number(unit) or unit <= 0:
+            continue
+        result[iso_code] = {
+            field: value / unit
+            for field, value in entry['rates'].items()
+            if field in RATE_FIELDS and _is_number(value) and value > 0
+        }
+    return result
+
+
+def _relative_difference(value: float, reference: float) -> float:
+    return abs(value - reference) / reference
+
+
+class RateValidator:
+    """
+    Guards current_rate.json against bad extractions. A bank's result must
+    match the schema and stay close to the other banks' median, or to its
+    own previous rates for currencies too few banks quote, both taken from
+    the snapshot the run started with.
+    Failing banks are quarantined in `quarantine_path` with their issues,
+    and their last good entry in the snapshot stays published.
+    """
+
+    def __init__(self, reference: Dict[str, Any], quarantine_path: str = QUARANTINE_PATH):
+        self.quarantine_path = quarantine_path
+        self.previous = {}
+        quotes: Dict[str, Dict[str, List[tuple]]] = {}
+        for bank in reference.get('all_banks', []):
+            if not bank or not bank.get('bank_name'):
+                continue
+            rates = per_unit_rates(bank)
+            self.previous[bank['bank_name']] = rates
+            for iso_code, fields in rates.items():
+                for field, value in fields.items():
+                    quotes.setdefault(iso_code, {}).setdefault(field, []).append((bank['bank_name'], value))
+        self._quotes = quotes
+        self.quarantined = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.quarantine_path, 'r', encoding='utf-8') as f:
+                banks = json.load(f).get('banks')
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return {}
+        return banks if isinstance(banks, dict) else {}
+
+    def _median(self, iso_code: str, field: str, exclude_bank: str) -> Optional[float]:
+        others = [value for name, value in self._quotes.get(iso_code, {}).get(field, []) if name != exclude_bank]
+        if len(others) < MEDIAN_MIN_BANKS:
+            return None
+        return statistics.median(others)
+
+    def check_anomalies(self, bank_name: str, output: Dict[str, Any]) -> List[str]:
+        issues = []
+        previous = self.previous.get(bank_name, {})
+        current = per_unit_rates(output)
+        if not current and previous:
+            issues.append(f'no rates, previously {len(previous)} currencies')
+
+        for iso_code, fields in current.items():
+            for field, value in fields.items():
+                median = self._median(iso_code, field, bank_name)
+                if median and _relative_difference(value, median) > MAX_DEVIATION_FROM_MEDIAN:
+                    issues.append(f'{iso_code}: {field} {value:g}/unit vs other banks\' median {median:g}')
+                    continue
+                # With a median to go by, a jump from last time that lands on it is a correction
+                before = previous.get(iso_code, {}).get(field)
+                if before and not median and _relative_difference(value, before) > MAX_CHANGE_FROM_PREVIOUS:
+                    issues.append(f'{iso_code}: {field} {value:g}/unit vs {before:g} last time')
+        return issues
+
+    def check(self, bank_name: str, output: Any) -> List[str]:
+        """All problems with `output`; call drop_unknown_currencies() first."""
+        issues = check_schema(output)
+        if issues:
+            return issues
+        return self.check_anomalies(bank_name, output)
+
+    def quarantine(self, bank_name: str, output: Any, issues: List[str]):
+        self.quarantined[bank_name] = {
+            'quarantined_utc': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'issues': issues,
+            'output': output,
+        }
+
+    def release(self, bank_name: str):
+        self.quarantined.pop(bank_name, None)
+
+    def save(self):
+        write_json_atomic(self.quarantine_path, {'banks': self.quarantined}, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check every bank in a snapshot against the rate validator")
+    parser.add_argument('--snapshot', default=CURRENT_RATE_PATH)
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.snapshot)
+    validator = RateValidator(snapshot, quarantine_path=os.devnull)
+    failed = 0
+    for bank in snapshot['all_banks']:
+        if not bank:
+            continue
+        dropped = drop_unknown_currencies(bank)
+        issues = validator.check(bank.get('bank_name'), bank)
+        if dropped:
+            print(f"{bank.get('bank_name')}: would drop non-ISO rows {', '.join(dropped)}")
+        # Compared with itself the previous-rate check always passes; the median check still applies
+        if issues:
+            failed += 1
+            print(f"{bank.get('bank_name')}:")
+            for issue in issues:
+                print(f"  - {issue}")
+    print(f"{failed} bank(s) with issues")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
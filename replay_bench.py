@@ -0,0 +1,471 @@
+import argparse
+import ast
+import asyncio
+import contextlib
+import json
+import os
+import re
+import secrets
+import socket
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, Any, List, Callable
+
+from aiohttp import web
+
+from fingerprint import fingerprint_content
+from history_store import HistoryStore
+from html_compactor import compact_json
+from bank_registry import compile_bank, ElementNotFound, FETCH_API, FETCH_HTTP, FETCH_BROWSER
+from browser_pool import domain_of
+from http_fetcher import create_http_session, fetch_api_json, fetch_html_content
+from llm_batcher import LLMBatcher, build_batch_prompt
+from rate_validator import RateValidator
+from rule_parser import extract_rates
+from scrape_scheduler import ScrapeScheduler
+from snapshot_writer import SnapshotWriter, load_snapshot
+from send_to_llm import (
+    clean_html_for_llm,
+    create_browser_pool,
+    create_prompt_from_template,
+    fetch_bank_content,
+    get_nepali_date,
+    get_utc_now_iso_string,
+    load_banks,
+    load_prompt_template,
+    scrape_banks,
+)
+
+FIXTURES_DIR = '.cache/replay'
+BASELINE_PATH = os.path.join(FIXTURES_DIR, 'baseline.json')
+# A stage regresses when its p50 is this much slower than the baseline
+REGRESSION_TOLERANCE = 0.25
+
+# The stand-in anti-robot challenge: a page whose script sets this cookie
+# after a delay and reloads, like the JS challenges bank sites put up
+CHALLENGE_COOKIE = 'fx_challenge'
+CHALLENGE_DELAY_MS = 2000
+CHALLENGE_PAGE = """<html><body><p>Checking your browser...</p><script>
+setTimeout(function () {{
+  document.cookie = '{cookie}={token}; path=/; max-age=86400';
+  location.reload();
+}}, {delay_ms});
+</script></body></html>"""
+
+STUB_EXTRACTION = {
+    "published_date": None,
+    "rates": [
+        {
+            "currency": {"name": "US Dollar", "iso_code": "USD", "unit": 1},
+            "rates": {"buy_cash": 136.7, "buy_non_cash": 136.7, "sell": 137.3},
+        }
+    ],
+}
+
+
+def slugify(name: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def save_fixture(fixtures_dir: str, name: str, html: Optional[str] = None, json_data: Any = None):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    fixture = {'name': name, 'html': html, 'json': json_data, 'recorded_at': time.time()}
+    with open(os.path.join(fixtures_dir, f"{slugify(name)}.json"), 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, ensure_ascii=False)
+
+
+def load_fixtures(fixtures_dir: str) -> List[Dict[str, Any]]:
+    fixtures = []
+    for filename in sorted(os.listdir(fixtures_dir)) if os.path.isdir(fixtures_dir) else []:
+        if not filename.endswith('.json') or filename == os.path.basename(BASELINE_PATH):
+            continue
+        with open(os.path.join(fixtures_dir, filename), 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+        if fixture.get('html') is not None or fixture.get('json') is not None:
+            fixtures.append(fixture)
+    return fixtures
+
+
+def seed_from_output_log(log_path: str, fixtures_dir: str) -> int:
+    """
+    Splits a saved elements_fetcher.py log (like output.txt) into fixtures,
+    one per bank that printed a table or API response.
+    """
+    with open(log_path, 'r', encoding='utf-8') as f:
+        lines = f.read().split('\n')
+
+    payloads: Dict[str, List[str]] = {}
+    current = None
+    for line in lines:
+        match = re.match(r'Opening (.+?) - ', line)
+        if match:
+            current = match.group(1)
+            payloads[current] = []
+        elif line.startswith(('Successfully opened', 'Error opening')):
+            current = None
+        elif current and not line.startswith(('Trying URL', 'Searching for', '❌', '✅')):
+            payloads[current].append(line)
+
+    count = 0
+    for name, buffer in payloads.items():
+        text = '\n'.join(buffer).strip()
+        if not text:
+            continue
+        if text.startswith('{'):
+            # elements_fetcher prints the API response as a Python dict
+            save_fixture(fixtures_dir, name, json_data=ast.literal_eval(text))
+        else:
+            save_fixture(fixtures_dir, name, html=text)
+        count += 1
+    return count
+
+
+async def record_fixtures(json_file_path: str, fixtures_dir: str, headless: bool = True) -> int:
+    """Fetches every bank once over the network and saves its raw table HTML or API JSON."""
+    banks = load_banks(json_file_path) or []
+    browser = create_browser_pool(headless=headless)
+    http_session = create_http_session()
+    count = 0
+    try:
+        for bank in banks:
+            try:
+                html, json_data = None, None
+                strategy = bank.fetch
+                if strategy == FETCH_API:
+                    json_data = (await fetch_api_json(http_session, bank, get_nepali_date()))['data']
+                elif strategy == FETCH_HTTP:
+                    try:
+                        html = await fetch_html_content(http_session, bank, [get_nepali_date(i) for i in range(5)])
+                    except ElementNotFound:
+                        strategy = FETCH_BROWSER
+                if strategy == FETCH_BROWSER:
+                    async with browser.page(bank.forex_page, warm_session=bank.anti_robot) as page:
+                        html, json_data = await fetch_bank_content(bank, page)
+                save_fixture(fixtures_dir, bank.name, html=html, json_data=json_data)
+                count += 1
+                print(f"Recorded {bank.name}")
+            except Exception as e:
+                print(f"Could not record {bank.name}: {e}")
+    finally:
+        await http_session.close()
+        await browser.close()
+    return count
+
+
+def stub_send_prompt(latency_seconds: float = 0.0) -> Callable[..., Dict[str, Any]]:
+    """A stand-in for send_prompt_to_gemini that answers single and batched prompts."""
+    def send_prompt(prompt: str, timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        if latency_seconds:
+            time.sleep(latency_seconds)
+        bank_ids = re.findall(r'<bank id="([^"]+)">', prompt)
+        if bank_ids:
+            return {"banks": {bank_id: json.loads(json.dumps(STUB_EXTRACTION)) for bank_id in bank_ids}}
+        return json.loads(json.dumps(STUB_EXTRACTION))
+    return send_prompt
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def start_replay_server(fixtures: List[Dict[str, Any]], port: int):
+    """
+    Serves each fixture at /<slug>: HTML fixtures wrapped in a page, JSON
+    fixtures as the API response. Returns the runner and compiled banks
+    pointing at it.
+    """
+    app = web.Application()
+    banks = []
+    base_url = f"http://127.0.0.1:{port}"
+    for fixture in fixtures:
+        slug = slugify(fixture['name'])
+        if fixture.get('json') is not None:
+            body = json.dumps(fixture['json'])
+            app.router.add_get(f"/{slug}/api", lambda request, body=body: web.Response(text=body, content_type='application/json'))
+            banks.append(compile_bank({'name': fixture['name'], 'forex_page': f"{base_url}/{slug}", 'fetch': FETCH_API, 'api': f"{base_url}/{slug}/api?date=yyyy-mm-dd"}))
+        else:
+            body = f"<html><body>{fixture['html']}</body></html>"
+            app.router.add_get(f"/{slug}", lambda request, body=body: web.Response(text=body, content_type='text/html'))
+            banks.append(compile_bank({'name': fixture['name'], 'forex_page': f"{base_url}/{slug}", 'fetch': FETCH_HTTP, 'query_selector': 'body > *'}))
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner, banks
+
+
+async def start_challenge_server(fixtures: List[Dict[str, Any]], port: int, delay_ms: int = CHALLENGE_DELAY_MS):
+    """
+    Serves each HTML fixture at /<slug> behind a stand-in anti-robot
+    challenge: a request without the challenge cookie gets CHALLENGE_PAGE
+    instead. Returns the runner, anti_robot banks pointing at it and a
+    dict counting the challenges and pages served.
+    """
+    app = web.Application()
+    banks = []
+    counts = {'challenges': 0, 'pages': 0}
+    token = secrets.token_hex(16)
+    challenge = CHALLENGE_PAGE.format(cookie=CHALLENGE_COOKIE, token=token, delay_ms=delay_ms)
+    base_url = f"http://127.0.0.1:{port}"
+
+    async def handle(request, body):
+        if request.cookies.get(CHALLENGE_COOKIE) != token:
+            counts['challenges'] += 1
+            return web.Response(text=challenge, content_type='text/html')
+        counts['pages'] += 1
+        return web.Response(text=body, content_type='text/html')
+
+    for fixture in fixtures:
+        if fixture.get('html') is None:
+            continue
+        slug = slugify(fixture['name'])
+        body = f"<html><body><div id=\"rates\">{fixture['html']}</div></body></html>"
+        app.router.add_get(f"/{slug}", lambda request, body=body: handle(request, body))
+        banks.append(compile_bank({'name': fixture['name'], 'forex_page': f"{base_url}/{slug}", 'fetch': FETCH_BROWSER, 'anti_robot': True, 'query_selector': '#rates'}))
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner, banks, counts
+
+
+async def run_challenge_check(fixtures: List[Dict[str, Any]], delay_ms: int = CHALLENGE_DELAY_MS, min_domain_interval: float = 0.5, headless: bool = True) -> int:
+    """
+    Loads every HTML fixture through the anti-robot path twice, each time
+    in a newly launched browser sharing one session directory. The cold
+    round should pay for the challenge once, the warm round, like a later
+    poll, not at all. Returns the exit code.
+    """
+    port = free_port()
+    runner, banks, counts = await start_challenge_server(fixtures, port, delay_ms)
+    state_dir = tempfile.mkdtemp(prefix='replay_sessions_')
+    results = []
+    devnull = open(os.devnull, 'w')
+    try:
+        for round_name in ('cold', 'warm'):
+            browser = create_browser_pool(headless=headless, state_dir=state_dir, min_domain_interval=min_domain_interval)
+            challenges = counts['challenges']
+            loaded = 0
+            started = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(devnull):
+                    for bank in banks:
+                        async with browser.page(bank.forex_page, warm_session=True) as page:
+                            html, _ = await fetch_bank_content(bank, page)
+                        loaded += html is not None
+            finally:
+                await browser.close()
+            results.append((round_name, loaded, counts['challenges'] - challenges, time.perf_counter() - started))
+    finally:
+        devnull.close()
+        await runner.cleanup()
+
+    print(f"Anti-robot session check against {len(banks)} page(s) on {domain_of(banks[0].forex_page) if banks else 'no domain'}")
+    for round_name, loaded, challenges, seconds in results:
+        print(f"  {round_name:5} {loaded:>3} loaded, {challenges} challenge(s), {seconds:.2f}s")
+    passed = all(loaded == len(banks) for _, loaded, _, _ in results) and results[-1][2] == 0
+    if not passed:
+        print("The warm round should load every page without a challenge")
+    return 0 if passed else 1
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise(samples: Dict[str, List[float]], items_per_sample: Dict[str, int]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for stage, durations in samples.items():
+        total = sum(durations)
+        items = len(durations) * items_per_sample.get(stage, 1)
+        summary[stage] = {
+            'samples': len(durations),
+            'p50_ms': round(percentile(durations, 50) * 1000, 3),
+            'p95_ms': round(percentile(durations, 95) * 1000, 3),
+            'per_second': round(items / total, 1) if total else 0.0,
+        }
+    return summary
+
+
+async def run_benchmark(fixtures: List[Dict[str, Any]], iterations: int = 5, llm_latency_seconds: float = 0.0) -> Dict[str, Dict[str, float]]:
+    """
+    Replays the fixtures through each pipeline stage `iterations` times.
+    Per-bank stages take one sample per bank; batch and end-to-end stages
+    take one sample per iteration.
+    """
+    samples: Dict[str, List[float]] = {}
+    items_per_sample: Dict[str, int] = {}
+
+    def timed(stage, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        samples.setdefault(stage, []).append(time.perf_counter() - started)
+        return result
+
+    template = load_prompt_template()
+    send_prompt = stub_send_prompt(llm_latency_seconds)
+    port = free_port()
+    runner, banks = await start_replay_server(fixtures, port)
+    http_session = create_http_session()
+    work_dir = tempfile.mkdtemp(prefix='replay_bench_')
+    # The pipeline logs every step; keep that out of the timings and the report
+    devnull = open(os.devnull, 'w')
+
+    try:
+        with contextlib.redirect_stdout(devnull):
+            for iteration in range(iterations):
+                payloads = []
+                outputs = []
+                for bank in banks:
+                    started = time.perf_counter()
+                    if bank.fetch == FETCH_API:
+                        html, json_data = None, (await fetch_api_json(http_session, bank, get_nepali_date()))['data']
+                    else:
+                        html, json_data = await fetch_html_content(http_session, bank, []), None
+                    samples.setdefault('fetch', []).append(time.perf_counter() - started)
+
+                    timed('fingerprint', fingerprint_content, html, json_data)
+                    payload = timed('clean', clean_html_for_llm, html) if html is not None else timed('clean', compact_json, json_data)
+                    payloads.append(payload)
+                    timed('prompt', create_prompt_from_template, payload)
+                    output, _ = timed('extract', extract_rates, html, json_data)
+                    output = output or json.loads(json.dumps(STUB_EXTRACTION))
+                    output['bank_name'] = bank.name
+                    output['fetch_datetime_utc'] = get_utc_now_iso_string()
+                    outputs.append(output)
+
+                timed('batch_prompt', build_batch_prompt, template, {f"b{i}": payload for i, payload in enumerate(payloads)})
+                items_per_sample['batch_prompt'] = len(payloads)
+
+                scheduler = ScrapeScheduler(workers=8)
+                batcher = LLMBatcher(scheduler, send_prompt, template, window_seconds=0)
+                started = time.perf_counter()
+                await asyncio.gather(*(batcher.extract(payload) for payload in payloads))
+                samples.setdefault('llm_stub', []).append(time.perf_counter() - started)
+                items_per_sample['llm_stub'] = len(payloads)
+
+                writer = SnapshotWriter(os.path.join(work_dir, 'current_rate.json'))
+                for output in outputs:
+                    started = time.perf_counter()
+                    await writer.publish_bank(output)
+                    samples.setdefault('snapshot', []).append(time.perf_counter() - started)
+
+                with HistoryStore(os.path.join(work_dir, 'history.sqlite3')) as store:
+                    timed('history', store.record_outputs, outputs)
+                items_per_sample['history'] = len(outputs)
+
+                # The whole cycle as the daemon runs it
+                writer = SnapshotWriter(os.path.join(work_dir, f'e2e_{iteration}.json'))
+                # Fixtures carry real bank names, so keep them off the production quarantine list
+                validator = RateValidator(load_snapshot(writer.path), quarantine_path=os.path.join(work_dir, 'quarantine.json'))
+                started = time.perf_counter()
+                await scrape_banks(banks, None, http_session, ScrapeScheduler(workers=8), None, validator=validator, snapshot_writer=writer, send_prompt=send_prompt)
+                samples.setdefault('end_to_end', []).append(time.perf_counter() - started)
+                items_per_sample['end_to_end'] = len(banks)
+    finally:
+        devnull.close()
+        await http_session.close()
+        await runner.cleanup()
+
+    return summarise(samples, items_per_sample)
+
+
+def compare_to_baseline(summary: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Returns the stages whose p50 is more than `tolerance` slower than the baseline."""
+    regressions = []
+    for stage, result in summary.items():
+        previous = baseline.get(stage)
+        if not previous or not previous.get('p50_ms'):
+            continue
+        if result['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(stage)
+    return regressions
+
+
+def print_summary(summary: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None):
+    print("\n" + "=" * 72)
+    print("REPLAY BENCHMARK")
+    print("=" * 72)
+    print(f"  {'stage':14}{'samples':>8}{'p50 ms':>12}{'p95 ms':>12}{'items/s':>12}{'vs base':>12}")
+    for stage, result in summary.items():
+        change = ''
+        previous = (baseline or {}).get(stage)
+        if previous and previous.get('p50_ms'):
+            change = f"{(result['p50_ms'] / previous['p50_ms'] - 1) * 100:+.0f}%"
+        print(f"  {stage:14}{result['samples']:>8}{result['p50_ms']:>12.3f}{result['p95_ms']:>12.3f}{result['per_second']:>12.1f}{change:>12}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record bank pages once, then benchmark the pipeline offline against them")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Directory holding the recorded fixtures")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Fetch every bank once and save its raw payload")
+    record_parser.add_argument('--banks', default="nepal_banks.json", help="Path to the bank config")
+
+    seed_parser = subparsers.add_parser('seed', help="Create fixtures from a saved elements_fetcher.py log")
+    seed_parser.add_argument('log', nargs='?', default='output.txt')
+
+    run_parser = subparsers.add_parser('run', help="Benchmark the pipeline against the fixtures")
+    run_parser.add_argument('--iterations', type=int, default=5)
+    run_parser.add_argument('--llm-latency-ms', type=float, default=0, help="Simulated latency of each stub LLM call")
+    run_parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline to compare against")
+    run_parser.add_argument('--save-baseline', action='store_true', help="Save this run as the new baseline")
+    run_parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help="Allowed p50 slowdown before failing")
+
+    challenge_parser = subparsers.add_parser('challenge', help="Check anti-robot session reuse against a stand-in challenge server")
+    challenge_parser.add_argument('--delay-ms', type=int, default=CHALLENGE_DELAY_MS, help="How long the stand-in challenge takes")
+    challenge_parser.add_argument('--interval', type=float, default=0.5, help="Seconds between page loads to the stand-in's domain")
+    challenge_parser.add_argument('--headed', action='store_true', help="Show the browser")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if args.command == 'record':
+        count = await record_fixtures(args.banks, args.fixtures)
+        print(f"Recorded {count} fixture(s) in {args.fixtures}")
+        return 0
+    if args.command == 'seed':
+        count = seed_from_output_log(args.log, args.fixtures)
+        print(f"Seeded {count} fixture(s) in {args.fixtures}")
+        return 0
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No fixtures in {args.fixtures}, run 'record' or 'seed' first")
+        return 1
+    if args.command == 'challenge':
+        return await run_challenge_check(fixtures, args.delay_ms, args.interval, headless=not args.headed)
+
+    summary = await run_benchmark(fixtures, iterations=args.iterations, llm_latency_seconds=args.llm_latency_ms / 1000)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(summary, baseline or {}, args.tolerance)
+    if regressions:
+        print(f"\nRegressed more than {args.tolerance:.0%} against the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
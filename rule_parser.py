@@ -0,0 +1,554 @@
+import re
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import pytz
+from bs4 import BeautifulSoup
+
+# lxml is several times faster than the stdlib parser; use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Below this confidence the caller should hand the payload to Gemini instead
+RULE_PARSER_MIN_CONFIDENCE = 0.9
+
+# Rates are quoted against NPR, so NPR itself is never a valid row
+KNOWN_ISO_CODES = {
+    'USD', 'EUR', 'GBP', 'CHF', 'AUD', 'CAD', 'SGD', 'JPY', 'CNY', 'SAR',
+    'QAR', 'THB', 'AED', 'MYR', 'KRW', 'SEK', 'DKK', 'HKD', 'KWD', 'BHD',
+    'OMR', 'INR', 'NZD', 'NOK', 'ILS', 'BDT', 'LKR', 'PKR', 'RUB', 'ZAR',
+    'TRY', 'MOP', 'BND', 'IDR', 'PHP', 'VND', 'TWD',
+}
+
+# Checked in order against a lower-cased currency name
+CURRENCY_NAME_PATTERNS = [
+    # Only Indian rupees are INR; a bare "Rupee" could be any of these
+    (r'sri ?lanka', 'LKR'),
+    (r'pakistan', 'PKR'),
+    (r'\bindian\b', 'INR'),
+    (r'\bu ?s\b.*dollar|american dollar', 'USD'),
+    (r'\beuro', 'EUR'),
+    (r'pound|sterling', 'GBP'),
+    (r'swiss|franc', 'CHF'),
+    (r'australian', 'AUD'),
+    (r'canadian', 'CAD'),
+    (r'singapore', 'SGD'),
+    (r'japanese|\byen\b', 'JPY'),
+    (r'chinese|yuan|renminbi', 'CNY'),
+    (r'saudi', 'SAR'),
+    (r'qatar', 'QAR'),
+    (r'thai|baht', 'THB'),
+    (r'emirates|dirham|\buae\b', 'AED'),
+    (r'malaysia|ringgit', 'MYR'),
+    (r'korea|\bwon\b', 'KRW'),
+    (r'swedish|sweden', 'SEK'),
+    (r'danish|denmark', 'DKK'),
+    (r'hong ?kong', 'HKD'),
+    (r'kuwait', 'KWD'),
+    (r'bahrain', 'BHD'),
+    (r'oman', 'OMR'),
+    (r'new zealand', 'NZD'),
+    (r'norw', 'NOK'),
+]
+
+# Header/key hints for the two kinds of buying rate. Non-cash is checked
+# first because labels like "Cash 50 and above Deno" mention cash too.
+NON_CASH_PATTERN = re.compile(
+    r'non[\s_-]?cash|\bncb\b|above|≥|>=|\bdoc|\btc\b|other|draft|transfer|prime|expo'
+)
+CASH_PATTERN = re.compile(r'cash|notes?\b|below|<|\bcsb\b')
+BUYING_PATTERN = re.compile(r'buy|\bcsb\b|\bncb\b|notes?\b|prime|other')
+SELLING_PATTERN = re.compile(r'sell')
+
+
+def normalise_iso_code(text: Any) -> Optional[str]:
+    """
+    Resolves a cell like 'USD', 'US Dollar (USD)', 'Pound Sterling GBP' or
+    'Us Dollar' to its ISO 4217 code. Returns None for non-currency rows.
+    """
+    if not isinstance(text, str):
+        return None
+    text = text.strip()
+    if not text:
+        return None
+
+    if re.fullmatch(r'[A-Za-z]{3}', text) and text.upper() in KNOWN_ISO_CODES:
+        return text.upper()
+
+    # A standalone code inside a longer label, e.g. "US Dollar (USD)"
+    for code in re.findall(r'(?:^|[\s(])([A-Z]{3})(?=$|[\s)])', text):
+        if code in KNOWN_ISO_CODES:
+            return code
+
+    # Labels like "USD-CASH" or "Fine Gold" are deliberately left unresolved
+    if re.search(r'[A-Z]{3}-', text):
+        return None
+
+    name = re.sub(r'[^a-z ]', ' ', text.lower())
+    name = re.sub(r'\s+', ' ', name).strip()
+    for pattern, code in CURRENCY_NAME_PATTERNS:
+        if re.search(pattern, name):
+            return code
+
+    return None
+
+
+def parse_unit(text: Any) -> Optional[int]:
+    """Parses a unit cell such as '1', '100' or a label like 'JPY (10)'."""
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return int(text) if text > 0 else None
+    if not isinstance(text, str):
+        return None
+
+    text = text.strip()
+    match = re.fullmatch(r'(\d+)(?:\.0+)?', text)
+    if not match:
+        match = re.search(r'\((\d+)\)', text)
+    if not match:
+        return None
+
+    unit = int(match.group(1))
+    return unit if unit > 0 else None
+
+
+def parse_rate(text: Any) -> Optional[float]:
+    """Parses a rate cell. Hyphens, blanks and zeros become None."""
+    if isinstance(text, bool) or text is None:
+        return None
+    if isinstance(text, (int, float)):
+        value = float(text)
+    else:
+        text = str(text).strip().replace(',', '')
+        if not re.fullmatch(r'\d+(?:\.\d+)?', text):
+            return None
+        value = float(text)
+
+    return value if value > 0 else None
+
+
+def make_rate_entry(name, iso_code, unit, buy_cash, buy_non_cash, sell) -> Dict[str, Any]:
+    return {
+        "currency": {
+            "name": name,
+            "iso_code": iso_code,
+            "unit": unit,
+        },
+        "rates": {
+            "buy_cash": buy_cash,
+            "buy_non_cash": buy_non_cash,
+            "sell": sell,
+        }
+    }
+
+
+def expand_table_grid(html_content: str) -> List[List[str]]:
+    """
+    Flattens an HTML table (or a div based "table-row"/"table-cell" grid) into
+    a list of rows, repeating cells across their rowspan/colspan.
+    """
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+
+    rows = soup.find_all('tr')
+    if rows:
+        cells_of = lambda row: row.find_all(['td', 'th'], recursive=False)
+    else:
+        # Div based layouts such as Global IME's div.table-grid
+        rows = [tag for tag in soup.find_all(True) if any('row' in c for c in tag.get('class', []))]
+        cells_of = lambda row: row.find_all(True, recursive=False)
+
+    grid = []
+    pending = {}  # column index -> (remaining rows, text)
+    for row in rows:
+        current = []
+        column = 0
+
+        def fill_pending():
+            nonlocal column
+            while column in pending:
+                remaining, text = pending[column]
+                current.append(text)
+                if remaining <= 1:
+                    del pending[column]
+                else:
+                    pending[column] = (remaining - 1, text)
+                column += 1
+
+        for cell in cells_of(row):
+            fill_pending()
+            text = cell.get_text(' ', strip=True)
+            text = re.sub(r'\s+', ' ', text)
+            colspan = _span(cell.get('colspan'))
+            rowspan = _span(cell.get('rowspan'))
+            for _ in range(colspan):
+                current.append(text)
+                if rowspan > 1:
+                    pending[column] = (rowspan - 1, text)
+                column += 1
+        fill_pending()
+
+        grid.append(current)
+
+    return grid
+
+
+def _span(value) -> int:
+    try:
+        return max(1, min(int(value), 50))
+    except (TypeError, ValueError):
+        return 1
+
+
+def classify_label(label: str) -> Optional[str]:
+    """
+    Maps a header label or JSON key to one of 'sell', 'buy_cash',
+    'buy_non_cash', 'buy', 'code', 'unit', 'currency', or None.
+    """
+    text = re.sub(r'[_\s]+', ' ', label.lower()).strip()
+    if not text:
+        return None
+
+    if SELLING_PATTERN.search(text):
+        return 'sell'
+    if BUYING_PATTERN.search(text):
+        if NON_CASH_PATTERN.search(text):
+            return 'buy_non_cash'
+        if CASH_PATTERN.search(text):
+            return 'buy_cash'
+        return 'buy'
+    if 'unit' in text:
+        return 'unit'
+    if 'iso' in text or text == 'code' or text.endswith(' code'):
+        return 'code'
+    if 'currency' in text or 'ccy' in text or 'crncy' in text or 'name' in text:
+        return 'currency'
+    return None
+
+
+def _order_sell_columns(labels: List[str], columns: List[int]) -> List[int]:
+    # Prefer the non-cash selling rate when a bank publishes both (e.g. Himalayan)
+    def is_cash_only(index):
+        text = labels[index].lower()
+        return 'cash' in text and not NON_CASH_PATTERN.search(text)
+    return sorted(columns, key=is_cash_only)
+
+
+def _first_rate(row: List[str], columns: List[int]) -> Optional[float]:
+    for column in columns:
+        if column < len(row):
+            value = parse_rate(row[column])
+            if value is not None:
+                return value
+    return None
+
+
+def _resolve_buy_columns(roles: Dict[str, List[int]]) -> Tuple[List[int], List[int]]:
+    cash = roles.get('buy_cash', []) + roles.get('buy', [])
+    non_cash = roles.get('buy_non_cash', []) + roles.get('buy', [])
+
+    # A single buying rate is used for both cash and non-cash
+    if not roles.get('buy_cash'):
+        cash = non_cash
+    if not roles.get('buy_non_cash') and not roles.get('buy'):
+        non_cash = cash
+
+    return cash, non_cash
+
+
+def _sanity_ratio(entries: List[Dict[str, Any]]) -> float:
+    """Fraction of rows whose buying rates don't exceed the selling rate by much."""
+    checked = 0
+    sane = 0
+    for entry in entries:
+        rates = entry['rates']
+        sell = rates['sell']
+        buys = [v for v in (rates['buy_cash'], rates['buy_non_cash']) if v is not None]
+        if sell is None or not buys:
+            continue
+        checked += 1
+        if max(buys) <= sell * 1.05:
+            sane += 1
+    return sane / checked if checked else 0.0
+
+
+def parse_rate_table(html_content: str) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Parses a bank's forex table into the prompt.txt schema.
+    Returns (result, confidence) where confidence is between 0 and 1.
+    """
+    grid = expand_table_grid(html_content)
+    if not grid:
+        return None, 0.0
+
+    def numeric_cells(row):
+        return sum(1 for cell in row if parse_rate(cell) is not None)
+
+    first_data = next((i for i, row in enumerate(grid) if numeric_cells(row) >= 2), len(grid))
+    header_rows = grid[:first_data]
+    width = max(len(row) for row in grid)
+
+    # Combine stacked header rows, e.g. "Buying Rate" over "Denomination < 50"
+    labels = []
+    for column in range(width):
+        parts = []
+        for row in header_rows:
+            if column < len(row) and row[column] and row[column] not in parts:
+                parts.append(row[column])
+        labels.append(' '.join(parts))
+
+    roles: Dict[str, List[int]] = {}
+    for column, label in enumerate(labels):
+        role = classify_label(label)
+        if role:
+            roles.setdefault(role, []).append(column)
+
+    has_buy = any(role in roles for role in ('buy', 'buy_cash', 'buy_non_cash'))
+    if 'sell' not in roles or not has_buy:
+        return None, 0.0
+    if 'currency' not in roles and 'code' not in roles:
+        return None, 0.0
+
+    sell_columns = _order_sell_columns(labels, roles['sell'])
+    cash_columns, non_cash_columns = _resolve_buy_columns(roles)
+    identity_columns = roles.get('code', []) + roles.get('currency', [])
+    name_columns = roles.get('currency', []) + roles.get('code', [])
+
+    rates = []
+    seen = set()
+    candidate_rows = 0
+    for row in grid[first_data:]:
+        if numeric_cells(row) == 0:
+            continue
+        candidate_rows += 1
+
+        iso_code = None
+        for column in identity_columns:
+            if column < len(row):
+                iso_code = normalise_iso_code(row[column])
+                if iso_code:
+                    break
+        if not iso_code or iso_code in seen:
+            continue
+
+        name = next((row[c] for c in name_columns if c < len(row) and row[c]), iso_code)
+        name = re.sub(r'\s*\(?\b' + iso_code + r'\b\)?\s*$', '', name).strip() or iso_code
+
+        unit = None
+        for column in roles.get('unit', []):
+            if column < len(row):
+                unit = parse_unit(row[column])
+        if unit is None:
+            unit = parse_unit(name) or 1
+        name = re.sub(r'\s*\(\d+\)\s*$', '', name).strip() or iso_code
+
+        entry = make_rate_entry(
+            name, iso_code, unit,
+            _first_rate(row, cash_columns),
+            _first_rate(row, non_cash_columns),
+            _first_rate(row, sell_columns),
+        )
+        if all(value is None for value in entry['rates'].values()):
+            continue
+
+        seen.add(iso_code)
+        rates.append(entry)
+
+    result = {"published_date": None, "rates": rates}
+
+    # A recognised header with no rows (e.g. ADBL on some days) has nothing
+    # to publish, so let Gemini look at the page rather than trust it
+    if candidate_rows == 0:
+        return result, 0.0
+
+    coverage = len(rates) / candidate_rows
+    # Rows that aren't currencies (e.g. "Fine Gold") shouldn't sink the score
+    coverage = min(1.0, coverage + 2 / candidate_rows) if len(rates) >= 3 else coverage * 0.5
+    confidence = min(coverage, _sanity_ratio(rates))
+    return result, confidence
+
+
+def _flatten_record(record: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(_flatten_record(value, f'{prefix}{key}.'))
+        elif not isinstance(value, list):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def _looks_like_record(value: Any) -> bool:
+    if not isinstance(value, dict):
+        return False
+    keys = [key.split('.')[-1] for key in _flatten_record(value)]
+    return any(classify_label(key) == 'sell' for key in keys) \
+        and any(classify_label(key) in ('buy', 'buy_cash', 'buy_non_cash') for key in keys)
+
+
+def _find_record_groups(node: Any, context: Dict[str, Any], groups: List[Tuple[List[Dict], Dict]]):
+    if isinstance(node, dict):
+        context = dict(context)
+        context.update({k.lower(): v for k, v in node.items() if isinstance(v, (str, int, float))})
+        values = list(node.values())
+        # Records keyed by ISO code, e.g. {"USD": {...}, "EUR": {...}}
+        if values and all(_looks_like_record(v) for v in values):
+            groups.append((values, context))
+            return
+        for value in values:
+            _find_record_groups(value, context, groups)
+    elif isinstance(node, list):
+        records = [item for item in node if _looks_like_record(item)]
+        if records:
+            groups.append((records, context))
+            return
+        for item in node:
+            _find_record_groups(item, context, groups)
+
+
+def _parse_context_datetime(context: Dict[str, Any]) -> Optional[datetime]:
+    date_value = None
+    for key, value in context.items():
+        if not isinstance(value, str) or not (key.endswith('date') or key == 'published_on'):
+            continue
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d-%b-%y', '%b %d, %Y'):
+            try:
+                date_value = datetime.strptime(value.strip().title() if '%b' in fmt else value.strip(), fmt)
+                break
+            except ValueError:
+                continue
+        if date_value:
+            break
+    if not date_value:
+        return None
+
+    time_value = context.get('time')
+    if isinstance(time_value, str):
+        for fmt in ('%I:%M %p', '%H:%M:%S', '%H:%M'):
+            try:
+                parsed = datetime.strptime(time_value.strip(), fmt)
+                date_value = date_value.replace(hour=parsed.hour, minute=parsed.minute, second=parsed.second)
+                break
+            except ValueError:
+                continue
+
+    return date_value
+
+
+def _format_published_date(local_datetime: Optional[datetime]) -> Optional[str]:
+    if local_datetime is None:
+        return None
+    nepal_tz = pytz.timezone('Asia/Kathmandu')
+    utc_datetime = nepal_tz.localize(local_datetime).astimezone(pytz.utc)
+    return utc_datetime.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _parse_api_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    flat = _flatten_record(record)
+    if str(flat.get('Disabled', '0')) == '1':
+        return None
+
+    roles: Dict[str, List[str]] = {}
+    for key in flat:
+        leaf = key.split('.')[-1]
+        # VAR_CRNCY_CODE / var_currency_code is the quote currency (NPR)
+        if leaf.lower().startswith('var'):
+            continue
+        role = classify_label(leaf)
+        if role:
+            roles.setdefault(role, []).append(key)
+
+    identity_keys = sorted(roles.get('code', []), key=lambda k: 'iso' not in k.lower()) + roles.get('currency', [])
+    iso_code = None
+    for key in identity_keys:
+        iso_code = normalise_iso_code(flat[key])
+        if iso_code:
+            break
+    if not iso_code:
+        return None
+
+    name = iso_code
+    for key in roles.get('currency', []) + roles.get('code', []):
+        value = flat[key]
+        if isinstance(value, str) and len(value.strip()) > 3:
+            name = value.strip()
+            break
+
+    unit = None
+    for key in roles.get('unit', []):
+        unit = parse_unit(flat[key])
+        if unit:
+            break
+
+    def first(keys):
+        for key in keys:
+            value = parse_rate(flat[key])
+            if value is not None:
+                return value
+        return None
+
+    cash_keys, non_cash_keys = _resolve_buy_columns(roles)
+    entry = make_rate_entry(
+        name, iso_code, unit or 1,
+        first(cash_keys), first(non_cash_keys), first(roles.get('sell', [])),
+    )
+    if all(value is None for value in entry['rates'].values()):
+        return None
+    return entry
+
+
+def parse_api_rates(json_data: Any) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Parses a bank's API payload into the prompt.txt schema.
+    When the payload holds several publications (e.g. a morning and an
+    afternoon list), the most recent one is used.
+    """
+    groups: List[Tuple[List[Dict], Dict]] = []
+    _find_record_groups(json_data, {}, groups)
+    if not groups:
+        return None, 0.0
+
+    def group_time(group):
+        records, context = group
+        merged = dict(context)
+        merged.update({k.lower(): v for k, v in records[0].items() if isinstance(v, (str, int, float))})
+        return _parse_context_datetime(merged)
+
+    timed = [(group_time(group), index, group) for index, group in enumerate(groups)]
+    latest = max(timed, key=lambda item: (item[0] or datetime.min, -item[1]))
+    published, _, (records, _) = latest
+
+    rates = []
+    seen = set()
+    for record in records:
+        entry = _parse_api_record(record)
+        if entry and entry['currency']['iso_code'] not in seen:
+            seen.add(entry['currency']['iso_code'])
+            rates.append(entry)
+
+    result = {"published_date": _format_published_date(published), "rates": rates}
+    if not rates:
+        return result, 0.0
+
+    coverage = len(rates) / len(records)
+    if len(rates) < 3:
+        coverage *= 0.5
+    confidence = min(coverage, _sanity_ratio(rates))
+    return result, confidence
+
+
+def extract_rates(html: Optional[str] = None, json_data: Any = None) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Deterministically extracts rates from a bank's table HTML or API JSON.
+    Returns (result, confidence); callers should fall back to the LLM when
+    confidence is below RULE_PARSER_MIN_CONFIDENCE.
+    """
+    try:
+        if html is not None:
+            return parse_rate_table(html)
+        if json_data is not None:
+            return parse_api_rates(json_data)
+    except Exception as e:
+        print(f"Rule parser failed: {e}")
+    return None, 0.0
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+RUN_REPORT_PATH = 'run_report.jsonl'
+
+# The bank being scraped by the current task. Set per attempt by
+# RunReport.bank() and inherited by child tasks and to_thread() calls.
+_current_trace: ContextVar[Optional['BankTrace']] = ContextVar('bank_trace', default=None)
+
+
+class BankTrace:
+    """Spans and payload sizes for one bank, across all of its attempts."""
+
+    def __init__(self, bank_name: str):
+        self.bank_name = bank_name
+        self.attempt = 0
+        self.spans: List[Dict[str, Any]] = []
+        self.values: Dict[str, Any] = {}
+
+    def add_span(self, stage: str, seconds: float, error: Optional[str] = None):
+        span = {'stage': stage, 'attempt': self.attempt, 'seconds': round(seconds, 4)}
+        if error:
+            span['error'] = error
+        self.spans.append(span)
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span['stage']] = round(totals.get(span['stage'], 0) + span['seconds'], 4)
+        return totals
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a pipeline stage for the bank being scraped. Does nothing when no
+    run report is active, so instrumented code works without one.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        trace.add_span(stage, time.perf_counter() - started, error=type(e).__name__)
+        raise
+    trace.add_span(stage, time.perf_counter() - started)
+
+
+def record_span(stage: str, seconds: float):
+    """For stages that can't be wrapped in span(), e.g. waiting on `async with`."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, seconds)
+
+
+def record_value(key: str, value: Any):
+    """Attaches a value (payload size, fetch strategy...) to the current bank."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.values[key] = value
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class RunReport:
+    """
+    Collects per-bank spans for one scrape run and writes them as JSON lines
+    (one line per bank plus a run summary, appended to `path`) and,
+    optionally, as a Prometheus textfile at `metrics_path`.
+    """
+
+    def __init__(self, path: Optional[str] = RUN_REPORT_PATH, metrics_path: Optional[str] = None):
+        self.path = path
+        self.metrics_path = metrics_path
+        self.run_id = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        self.started = time.time()
+        self.traces: Dict[str, BankTrace] = {}
+
+    @contextmanager
+    def bank(self, bank_name: str):
+        """Makes `bank_name` the current bank for one scrape attempt."""
+        trace = self.traces.setdefault(bank_name, BankTrace(bank_name))
+        trace.attempt += 1
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+    def bank_records(self, statuses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        records = []
+        for status in statuses:
+            trace = self.traces.get(status['bank']) or BankTrace(status['bank'])
+            records.append({
+                'type': 'bank',
+                'run_id': self.run_id,
+                'bank': status['bank'],
+                'status': status['status'],
+                'attempts': status['attempts'],
+                'elapsed_seconds': status.get('elapsed_seconds'),
+                'reason': status.get('reason'),
+                'stages': trace.stage_totals(),
+                'spans': trace.spans,
+                **trace.values,
+            })
+        return records
+
+    def write(self, statuses: List[Dict[str, Any]]):
+        records = self.bank_records(statuses)
+        duration = round(time.time() - self.started, 3)
+        counts: Dict[str, int] = {}
+        for status in statuses:
+            counts[status['status']] = counts.get(status['status'], 0) + 1
+        summary = {'type': 'run', 'run_id': self.run_id, 'duration_seconds': duration, 'banks': len(statuses), 'statuses': counts}
+
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for record in records + [summary]:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            print(f"Run report appended to {self.path}")
+
+        if self.metrics_path:
+            self.write_metrics(records, summary)
+
+    def write_metrics(self, records: List[Dict[str, Any]], summary: Dict[str, Any]):
+        """Writes the node_exporter textfile format, replacing the previous run's file."""
+        lines = [
+            '# HELP forex_bank_stage_seconds Time spent in each pipeline stage in the last run.',
+            '# TYPE forex_bank_stage_seconds gauge',
+        ]
+        for record in records:
+            bank = _escape_label(record['bank'])
+            for stage, seconds in record['stages'].items():
+                lines.append(f'forex_bank_stage_seconds{{bank="{bank}",stage="{stage}"}} {seconds}')
+
+        lines += ['# HELP forex_bank_attempts Scrape attempts in the last run.', '# TYPE forex_bank_attempts gauge']
+        lines += [f'forex_bank_attempts{{bank="{_escape_label(record["bank"])}"}} {record["attempts"]}' for record in records]
+
+        lines += ['# HELP forex_bank_up Whether the bank has usable rates after the last run.', '# TYPE forex_bank_up gauge']
+        lines += [
+            f'forex_bank_up{{bank="{_escape_label(record["bank"])}"}} {1 if record["status"] in ("ok", "unchanged") else 0}'
+            for record in records
+        ]
+
+        lines += ['# HELP forex_bank_payload_bytes Size of the raw and LLM-ready payload.', '# TYPE forex_bank_payload_bytes gauge']
+        for record in records:
+            for kind in ('raw', 'prompt'):
+                if f'{kind}_bytes' in record:
+                    lines.append(f'forex_bank_payload_bytes{{bank="{_escape_label(record["bank"])}",kind="{kind}"}} {record[f"{kind}_bytes"]}')
+
+        lines += [
+            '# HELP forex_run_duration_seconds Wall time of the last run.',
+            '# TYPE forex_run_duration_seconds gauge',
+            f'forex_run_duration_seconds {summary["duration_seconds"]}',
+            '# HELP forex_run_banks Banks per status in the last run.',
+            '# TYPE forex_run_banks gauge',
+        ]
+        lines += [f'forex_run_banks{{status="{status}"}} {count}' for status, count in summary['statuses'].items()]
+        lines += [
+            '# HELP forex_run_last_timestamp_seconds When the last run finished.',
+            '# TYPE forex_run_last_timestamp_seconds gauge',
+            f'forex_run_last_timestamp_seconds {int(time.time())}',
+        ]
+
+        directory = os.path.dirname(self.metrics_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f'.{os.path.basename(self.metrics_path)}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.metrics_path)
@@ -0,0 +1,240 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+# Existing Playwright timeouts, reused as per-bank deadlines
+NAVIGATION_TIMEOUT_MS = 60_000
+API_RESPONSE_TIMEOUT_MS = 100_000
+LLM_TIMEOUT_MS = 90_000
+# Upper bound for a date-fallback page to show its table or "No record found."
+DATE_PROBE_TIMEOUT_MS = 15_000
+# How long an anti-robot challenge page gets to reload into the real page
+CHALLENGE_TIMEOUT_MS = 30_000
+# Anti-robot sites flag bursts, so page loads to one of their domains
+# (retries included) are spaced at least this far apart
+DOMAIN_MIN_INTERVAL_SECONDS = 10.0
+
+
+class BankUnchanged(Exception):
+    """Raised by a scrape when the bank's source hasn't changed since `since`."""
+
+    def __init__(self, since: str):
+        super().__init__(f'unchanged since {since}')
+        self.since = since
+
+
+class BankQuarantined(Exception):
+    """Raised by a scrape whose result failed validation; the last good rates stay published."""
+
+    def __init__(self, issues: List[str]):
+        super().__init__(f"failed validation: {'; '.join(issues[:3])}" + (f" (+{len(issues) - 3} more)" if len(issues) > 3 else ''))
+        self.issues = issues
+
+
+class _AttemptClock:
+    """How long one bank attempt has spent waiting its turn for a shared slot or a batch."""
+
+    __slots__ = ('queued', '_waiting', '_since')
+
+    def __init__(self):
+        self.queued = 0.0
+        self._waiting = 0
+        self._since = 0.0
+
+    def queued_now(self) -> float:
+        return self.queued + (time.monotonic() - self._since if self._waiting else 0.0)
+
+
+# The attempt being run by the current task, inherited by its child tasks
+_attempt_clock: ContextVar[Optional[_AttemptClock]] = ContextVar('attempt_clock', default=None)
+
+
+@contextmanager
+def queue_wait():
+    """
+    Marks a wait for a browser/LLM slot, a batch or a domain's turn. It doesn't
+    count against the bank's deadline, which only covers its own work.
+    """
+    clock = _attempt_clock.get()
+    if clock is None:
+        yield
+        return
+
+    if not clock._waiting:
+        clock._since = time.monotonic()
+    clock._waiting += 1
+    try:
+        yield
+    finally:
+        clock._waiting -= 1
+        if not clock._waiting:
+            clock.queued += time.monotonic() - clock._since
+
+
+def bank_deadline_seconds(bank) -> float:
+    """
+    Upper bound for the work of one attempt at a BankSource: page/API wait
+    plus one LLM call, and for anti-robot banks the challenge. Time queued
+    for a slot, a batch or an anti-robot domain's turn isn't counted.
+    """
+    fetch_timeout = API_RESPONSE_TIMEOUT_MS if bank.api else NAVIGATION_TIMEOUT_MS
+    if bank.anti_robot:
+        fetch_timeout += CHALLENGE_TIMEOUT_MS
+    return (fetch_timeout + LLM_TIMEOUT_MS) / 1000
+
+
+class ScrapeScheduler:
+    """
+    Runs one coroutine per bank on a bounded worker pool.
+
+    Browser navigation and LLM extraction have their own concurrency limits,
+    each attempt has a deadline, and failed attempts are retried with
+    exponential backoff. The blocking Gemini client is run off the event loop.
+    """
+
+    def __init__(
+        self,
+        workers: int = 8,
+        browser_concurrency: int = 4,
+        llm_concurrency: int = 2,
+        max_retries: int = 2,
+        backoff_seconds: float = 2.0,
+    ):
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._browser_slots = asyncio.Semaphore(max(1, browser_concurrency))
+        self._llm_slots = asyncio.Semaphore(max(1, llm_concurrency))
+
+    @asynccontextmanager
+    async def browser_slot(self):
+        with queue_wait():
+            await self._browser_slots.acquire()
+        try:
+            yield
+        finally:
+            self._browser_slots.release()
+
+    async def run_llm(self, func: Callable, *args, timeout_seconds: float = LLM_TIMEOUT_MS / 1000, on_start: Optional[Callable[[], None]] = None):
+        """
+        Runs a blocking LLM call in a worker thread under the LLM limit,
+        calling `on_start` once it has a slot. A thread can't be stopped, so
+        on timeout the caller gets TimeoutError but the slot stays taken
+        until the call returns; `func` should bound its own request too.
+        """
+        with queue_wait():
+            await self._llm_slots.acquire()
+        if on_start is not None:
+            on_start()
+        call = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        call.add_done_callback(self._release_llm_slot)
+        return await asyncio.wait_for(asyncio.shield(call), timeout=timeout_seconds)
+
+    def _release_llm_slot(self, call: asyncio.Future):
+        self._llm_slots.release()
+        # Nobody awaits a call that timed out, so retrieve its result here
+        if not call.cancelled():
+            call.exception()
+
+    async def _attempt(self, bank, scrape_bank: Callable[[Any], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """
+        Runs one attempt, raising asyncio.TimeoutError once it has spent
+        bank_deadline_seconds() on its own work, not counting queue_wait()s.
+        """
+        deadline = bank_deadline_seconds(bank)
+        clock = _AttemptClock()
+        token = _attempt_clock.set(clock)
+        try:
+            # The task copies the current context, clock included
+            task = asyncio.ensure_future(scrape_bank(bank))
+        finally:
+            _attempt_clock.reset(token)
+
+        started = time.monotonic()
+        try:
+            while not task.done():
+                remaining = deadline - (time.monotonic() - started - clock.queued_now())
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait({task}, timeout=remaining)
+        except BaseException:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        return task.result()
+
+    async def _run_bank(self, bank, scrape_bank: Callable[[Any], Awaitable[Optional[Dict[str, Any]]]]) -> Dict[str, Any]:
+        status = {'bank': bank.name, 'status': 'failed', 'attempts': 0, 'output': None}
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            status['attempts'] = attempt + 1
+            try:
+                output = await self._attempt(bank, scrape_bank)
+                status['output'] = output
+                status['status'] = 'ok' if output is not None else 'skipped'
+                status.pop('reason', None)
+                break
+            except BankUnchanged as e:
+                # Not a failure: the previous extraction still stands
+                status['status'] = 'unchanged'
+                status['reason'] = str(e)
+                break
+            except BankQuarantined as e:
+                # Retrying would reparse the same source; the next cycle tries again
+                status['status'] = 'quarantined'
+                status['reason'] = str(e)
+                break
+            except asyncio.TimeoutError:
+                status['reason'] = f'Timed out after {bank_deadline_seconds(bank):.0f}s of work'
+            except Exception as e:
+                status['reason'] = str(e)
+
+            print(f"Attempt {attempt + 1} for {bank.name} failed: {status['reason']}")
+            if attempt < self.max_retries:
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() / 2)
+                await asyncio.sleep(delay)
+
+        status['elapsed_seconds'] = round(time.monotonic() - started, 2)
+        return status
+
+    async def run(self, banks: List[Any], scrape_bank: Callable[[Any], Awaitable[Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """
+        Scrapes every bank (BankSource) and returns one status dict per
+        bank, in the same order as `banks`.
+        """
+        queue = asyncio.Queue()
+        for index, bank in enumerate(banks):
+            queue.put_nowait((index, bank))
+
+        statuses: List[Optional[Dict[str, Any]]] = [None] * len(banks)
+
+        async def worker():
+            while True:
+                try:
+                    index, bank = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                statuses[index] = await self._run_bank(bank, scrape_bank)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(banks)))))
+        return statuses
+
+
+def print_status_report(statuses: List[Dict[str, Any]]):
+    print("\n" + "=" * 50)
+    print("SCRAPE REPORT")
+    print("=" * 50)
+    for status in statuses:
+        line = f"  {status['status']:11} {status['bank']} ({status['attempts']} attempt(s), {status['elapsed_seconds']}s)"
+        if status.get('reason'):
+            line += f" - {status['reason']}"
+        print(line)
+
+    ok = sum(1 for status in statuses if status['status'] == 'ok')
+    unchanged = sum(1 for status in statuses if status['status'] == 'unchanged')
+    quarantined = sum(1 for status in statuses if status['status'] == 'quarantined')
+    print(f"\n{ok}/{len(statuses)} banks scraped successfully, {unchanged} unchanged and skipped, {quarantined} quarantined")
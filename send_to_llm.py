@@ -1,18 +1,39 @@
 import json
 import asyncio
-from playwright.async_api import async_playwright
+import argparse
 import time
 
-import pytz
-from datetime import datetime, timedelta, timezone
-import re
-
-from bs4 import BeautifulSoup
-
-def get_nepali_date(offset_days=0):
-    nepal_tz = pytz.timezone('Asia/Kathmandu')
-    today = datetime.now(nepal_tz) - timedelta(days=offset_days)
-    return today.strftime('%Y-%m-%d')
+from datetime import datetime, timezone
+
+from llm_cache import LLMResponseCache
+from llm_batcher import LLMBatcher
+from html_compactor import compact_html, format_payload_report
+from extraction_pool import ExtractionPool, extract_payload
+from page_profile import apply_scraping_profile, SCRAPING_LAUNCH_ARGS, SCRAPING_CONTEXT_OPTIONS
+from run_report import RunReport, RUN_REPORT_PATH, span, record_span, record_value
+from scrape_scheduler import (
+    ScrapeScheduler,
+    BankUnchanged,
+    BankQuarantined,
+    print_status_report,
+    LLM_TIMEOUT_MS,
+)
+from snapshot_writer import SnapshotWriter, load_snapshot, CURRENT_RATE_PATH
+from rate_validator import RateValidator, drop_unknown_currencies
+from rate_index import write_rate_index
+from history_store import HistoryStore, HISTORY_DB_PATH
+from adaptive_poll import PollPlanner
+from bank_registry import load_banks, FETCH_API, FETCH_HTTP, FETCH_BROWSER
+from browser_pool import BrowserPool, fetch_bank_content
+from fingerprint import SourceFingerprints, fingerprint_content, FINGERPRINT_MAX_AGE_SECONDS
+from http_fetcher import (
+    create_http_session,
+    fetch_api_json,
+    fetch_html_content,
+    get_nepali_date,
+    substitute_date,
+    ElementNotFound,
+)
 
 def get_utc_now_iso_string() -> str:
     """
@@ -22,241 +43,406 @@ def get_utc_now_iso_string() -> str:
     return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
 def clean_html_for_llm(html_content: str) -> str:
-    attributes_to_keep = ['href', 'src', 'colspan', 'rowspan']
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Iterate through all tags in the document
-    for tag in soup.find_all(True):
-        # Create a new dictionary of attributes, keeping only the safe ones
-        safe_attrs = {}
-        for attr, value in tag.attrs.items():
-            if attr in attributes_to_keep:
-                safe_attrs[attr] = value
-
-        # Replace the tag's attributes with the filtered ones
-        tag.attrs = safe_attrs
-
-    # Return the "prettified" HTML, which is nicely indented
-    return soup.prettify()
-
-async def load_with_nepali_date(base_url, page):
-    max_attempts = 5
-    for i in range(max_attempts):
-        nepali_date = get_nepali_date(i)
-        url = re.sub(r"yyyy-mm-dd", nepali_date, base_url)
-        print(f"Trying URL: {url}")
-        await page.goto(url, wait_until='domcontentloaded')
+    """
+    Flattens the table into compact '|' separated rows, falling back to
+    attribute-stripped, whitespace-free HTML for non-table elements.
+    """
+    return compact_html(html_content)
 
-        try:
-            print("Searching for 'No record found' to see if we need to go back'")
-            await page.get_by_text('No record found.').wait_for(timeout=3_000)
-            print(f"❌ No table for date {nepali_date}, trying previous day...")
-        except:
-            print(f"✅ Table found for date {nepali_date}")
-            return
+def load_prompt_template(prompt_filepath: str = "prompt.txt") -> str:
+    try:
+        with open(prompt_filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Error: The prompt file was not found at '{prompt_filepath}'")
+        raise
 
 def create_prompt_from_template(
     data_to_insert: str,
     prompt_filepath: str = "prompt.txt",
     placeholder: str = "{PASTE_THE_BANK_DATA_HERE}"
 ) -> str:
-    try:
-        with open(prompt_filepath, 'r', encoding='utf-8') as f:
-            template_string = f.read()
-    except FileNotFoundError:
-        print(f"Error: The prompt file was not found at '{prompt_filepath}'")
-        raise
+    template_string = load_prompt_template(prompt_filepath)
 
     final_prompt = template_string.replace(placeholder, data_to_insert)
     return final_prompt
 
 import os
+import threading
 from typing import Optional, Dict, Any
 
-import google.generativeai as genai
-from dotenv import load_dotenv
+# The model client is built once and shared by every bank and worker thread
+_gemini_model = None
+_gemini_model_lock = threading.Lock()
 
-def send_prompt_to_gemini(prompt: str) -> Optional[Dict[str, Any]]:
-    # Load environment variables from the .env file
-    load_dotenv()
+def get_gemini_model():
+    """
+    Configures the Gemini client and builds the model on first use.
+    Returns None if GEMINI_API_KEY isn't set.
+    """
+    global _gemini_model
+    with _gemini_model_lock:
+        if _gemini_model is not None:
+            return _gemini_model
 
-    # 1. Get the API key from environment variables
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("Error: GEMINI_API_KEY not found in .env file or environment variables.")
-        return None
+        # Imported here: the Gemini SDK is slow to import and most runs never call it
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+
+        # Load environment variables from the .env file
+        load_dotenv()
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            print("Error: GEMINI_API_KEY not found in .env file or environment variables.")
+            return None
 
-    try:
-        # 2. Configure the generative AI client
         genai.configure(api_key=api_key)
 
-        # 3. Set up the model configuration
         # Crucially, we instruct the model to return its response as JSON.
         generation_config = {
             "response_mime_type": "application/json",
         }
 
-        model = genai.GenerativeModel(
+        _gemini_model = genai.GenerativeModel(
             model_name="gemini-2.5-flash",
             generation_config=generation_config
         )
+        return _gemini_model
 
-        # 4. Send the prompt and get the response
+def send_prompt_to_gemini(prompt: str, timeout_seconds: float = LLM_TIMEOUT_MS / 1000) -> Optional[Dict[str, Any]]:
+    model = get_gemini_model()
+    if model is None:
+        return None
+
+    try:
         print("Sending prompt to Gemini...")
-        response = model.generate_content(prompt)
+        with span('llm_request'):
+            # run_llm can only stop waiting, so the request has to time out itself
+            response = model.generate_content(prompt, request_options={'timeout': timeout_seconds})
 
-        # 5. The response.text will be a JSON string, so we parse it
-        return json.loads(response.text)
+        # The response.text will be a JSON string, so we parse it
+        with span('json_parse'):
+            return json.loads(response.text)
 
     except Exception as e:
         print(f"An error occurred while communicating with the Gemini API: {e}")
         return None
 
-async def open_bank_pages(json_file_path, concurrent=False):
+def send_bank_data_to_gemini(bank_data: str, llm_cache: Optional[LLMResponseCache] = None) -> Optional[Dict[str, Any]]:
     """
-    Opens all bank forex pages from nepal_banks.json in separate tabs
+    Sends a bank's cleaned payload to Gemini, reusing the cached response
+    when the same payload was already extracted with the same prompt.
     """
+    cache_key = None
+    if llm_cache is not None:
+        cache_key = llm_cache.make_key(load_prompt_template(), bank_data)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            print("Using cached Gemini response")
+            return cached
+
+    # A cache miss: this bank's extraction reaches Gemini and counts against its budget
+    record_value('llm_requested', True)
+    prompt = create_prompt_from_template(bank_data)
+    print(f"Prompt is {len(prompt):,} characters")
+
+    output = send_prompt_to_gemini(prompt)
+    if output is not None and cache_key is not None:
+        llm_cache.set(cache_key, output)
+    return output
+
+def create_browser_pool(headless=False, **pool_options):
+    """A BrowserPool with the lightweight scraping profile from page_profile."""
+    return BrowserPool(
+        headless=headless,
+        launch_options={'args': SCRAPING_LAUNCH_ARGS},
+        context_options=SCRAPING_CONTEXT_OPTIONS,
+        **pool_options,
+    )
+
+async def scrape_bank(bank, browser, http_session, scheduler, llm_cache, fingerprints=None, llm_batcher=None, extraction_pool=None, validator=None):
+    """
+    Scrape a single bank. Errors propagate so the scheduler can retry.
+    Raises BankUnchanged if the source is the same as at the last
+    successful extraction, before any cleaning, parsing or LLM call, and
+    BankQuarantined if `validator` rejects the result.
 
-    # Load the JSON file
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-    except FileNotFoundError:
-        print(f"Error: File '{json_file_path}' not found.")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: Invalid JSON in file '{json_file_path}'.")
-        return
+    Returns (output, fingerprint): the fingerprints.update() arguments for
+    the source, to record once the output is published, or None.
+    """
+    html = None
+    json_data = None
+    api_response = {}
+    page_hashes = []
+    strategy = bank.fetch
+    if strategy == FETCH_API:
+        date = get_nepali_date()
+        validators = fingerprints.validators(bank.name, substitute_date(bank.api, date)) if fingerprints else None
+        with span('http_fetch'):
+            api_response = await fetch_api_json(http_session, bank, date, validators)
+        if api_response['not_modified']:
+            since = fingerprints.unchanged_since(bank.name)
+            if since:
+                raise BankUnchanged(since)
+            # We only send validators for a fresh entry, so this is unexpected: refetch in full
+            with span('http_fetch'):
+                api_response = await fetch_api_json(http_session, bank, date)
+        json_data = api_response['data']
+    elif strategy == FETCH_HTTP:
+        def skip_unchanged_page(page_html):
+            # A byte-identical page needs no parsing at all
+            page_hashes.append(fingerprint_content(html=page_html))
+            since = fingerprints.unchanged_page_since(bank.name, page_hashes[-1]) if fingerprints else None
+            if since:
+                raise BankUnchanged(since)
 
-    banks = data.get('banks', [])
+        try:
+            dates = [get_nepali_date(i) for i in range(5)]
+            with span('http_fetch'):
+                html = await fetch_html_content(http_session, bank, dates, on_page=skip_unchanged_page, extraction_pool=extraction_pool)
+        except ElementNotFound as e:
+            print(f"Plain HTTP failed for {bank.name} ({e}), falling back to browser")
+            strategy = FETCH_BROWSER
+
+    if strategy == FETCH_BROWSER:
+        if bank.anti_robot:
+            # Waiting for the domain's turn mustn't hold a browser slot other banks could use
+            await browser.take_domain_turn(bank.forex_page)
+        # Only the navigation holds a browser slot, extraction runs outside it
+        slot_requested = time.perf_counter()
+        async with scheduler.browser_slot():
+            record_span('browser_slot_wait', time.perf_counter() - slot_requested)
+            if not bank.anti_robot:
+                with span('browser_launch'):
+                    await browser.get_context()
+            # Anti-robot banks reuse the session that last got past their challenge
+            async with browser.page(bank.forex_page, warm_session=bank.anti_robot, domain_turn_taken=bank.anti_robot) as page:
+                request_counts = await apply_scraping_profile(page, bank)
+                html, json_data = await fetch_bank_content(bank, page)
+            record_value('blocked_requests', request_counts['blocked'])
+            record_value('allowed_requests', request_counts['allowed'])
+    record_value('strategy', strategy)
+
+    if html == None and json_data == None:
+        raise Exception('Neither html nor json found')
+    record_value('raw_bytes', len((html if html != None else json.dumps(json_data)).encode('utf-8')))
+
+    fingerprint = fingerprint_content(html=html, json_data=json_data)
+    if fingerprints:
+        since = fingerprints.unchanged_since(bank.name, fingerprint)
+        if since:
+            raise BankUnchanged(since)
+
+    # Known layouts are parsed locally, Gemini is only the fallback. Parsing
+    # and cleaning are CPU-bound, so they run in the extraction pool if given.
+    if extraction_pool is not None:
+        extracted = await extraction_pool.extract(html, json_data)
+    else:
+        extracted = extract_payload(html, json_data)
+    for stage, seconds in extracted['timings'].items():
+        record_span(stage, seconds)
+    output, confidence = extracted['output'], extracted['confidence']
+    bank_data = extracted['bank_data']
+    record_value('rule_confidence', round(confidence, 3))
+    if output != None:
+        print(f"Parsed {bank.name} with rule parser (confidence {confidence:.2f})")
+    else:
+        print(f"Rule parser confidence {confidence:.2f} for {bank.name}, falling back to Gemini")
+        record_value('prompt_bytes', len(bank_data.encode('utf-8')))
+        print(f"Prompt payload for {bank.name}: {format_payload_report(extracted['payload'])}")
+
+        # Includes waiting for a batch to fill and for an LLM slot
+        with span('llm'):
+            if llm_batcher is not None:
+                output = await llm_batcher.extract(bank_data)
+            else:
+                output = await scheduler.run_llm(send_bank_data_to_gemini, bank_data, llm_cache)
+        if output == None:
+            raise Exception('Gemini returned no data')
+
+    if validator is not None:
+        dropped = drop_unknown_currencies(output)
+        if dropped:
+            print(f"Dropped non-ISO currency rows for {bank.name}: {', '.join(dropped)}")
+        issues = validator.check(bank.name, output)
+        record_value('validation_issues', len(issues))
+        if issues:
+            validator.quarantine(bank.name, output, issues)
+            if bank_data is not None and llm_cache is not None:
+                # Don't serve the same bad extraction from the cache next time
+                llm_cache.discard(llm_cache.make_key(load_prompt_template(), bank_data))
+            raise BankQuarantined(issues)
+        validator.release(bank.name)
+
+    output['bank_name'] = bank.name
+    output['source_url'] = bank.forex_page
+    output['fetch_datetime_utc'] = get_utc_now_iso_string()
+
+    source = None
+    if fingerprints:
+        source = {
+            'fingerprint': fingerprint,
+            'url': api_response.get('url'),
+            'etag': api_response.get('etag'),
+            'last_modified': api_response.get('last_modified'),
+            'page_hash': page_hashes[-1] if page_hashes else None,
+        }
 
-    if not banks:
-        print("No banks found in the JSON file.")
-        return
+    print(f"Successfully opened {bank.name}")
 
-    print(f"Found {len(banks)} banks. Opening forex pages...")
+    return output, source
 
-    async with async_playwright() as p:
-        # Launch Chromium browser
-        browser = await p.chromium.launch(
-            headless=False,  # Keep browser visible
-        )
+def live_validator(snapshot_path=CURRENT_RATE_PATH):
+    """Checks results against the published snapshot as it is now, quarantining into the production list."""
+    return RateValidator(load_snapshot(snapshot_path))
 
-        # Create a new browser context
-        context = await browser.new_context()
-
-        async def open_page(bank):
-            """Open a single bank's forex page with developer tools"""
-            try:
-                # TODO: Handle anti_robot
-                if bank.get('anti_robot', False):
-                    return
-
-                # Create a new page (tab)
-                page = await context.new_page()
-
-                # Navigate to the forex page
-                forex_page = bank['forex_page']
-                print(f"Opening {bank['name']} - {forex_page}")
-                if bank.get('handle_date', False):
-                    await load_with_nepali_date(forex_page, page)
-                else:
-                    await page.goto(forex_page, wait_until='domcontentloaded', timeout=60_000)
-
-                # Access content in different way
-                html = None
-                json_data = None
-                if 'table' in bank and bank['table'] == True:
-                    table = page.locator('css=table')
-                    if 'table_index' in bank:
-                        table = table.nth(bank['table_index'])
-                    else:
-                        table = table.nth(0)
-                    html = await table.evaluate('el => el.outerHTML')
-
-                elif 'query_selector' in bank:
-                    element = await page.wait_for_selector(bank['query_selector'], state='attached')
-                    if not element:
-                        raise Exception(f'Could not find {bank['query_selector']} in {forex_page}')
-                    html = (await element.evaluate('el => el.outerHTML'))
-
-                elif 'api' in bank:
-                    api = bank['api']
-                    api = api.replace('yyyy-mm-dd', '')
-                    response = await page.wait_for_event("response", lambda r: api in r.url, timeout=100_000)
-                    json_data = await response.json()
-                elif 'select_link' in bank:
-                    # Only made for Himalayan
-                    link = await page.query_selector('a[href^="getRate.php"]')
-                    if not link:
-                        raise Exception('Could not find link')
-                    await link.click()
-                    await page.wait_for_load_state('domcontentloaded')
-
-                    table = page.locator('css=table').nth(3)
-                    html = await table.evaluate('el => el.outerHTML')
-
-                bank_data = None
-                if html != None:
-                    cleaned_html = clean_html_for_llm(html)
-                    bank_data = cleaned_html
-                elif json_data != None:
-                    bank_data = json.dumps(json_data, indent=2)
-                else:
-                    raise Exception('Neither html nor json found')
-
-                prompt = create_prompt_from_template(bank_data)
-                print(prompt)
-
-                output = send_prompt_to_gemini(prompt)
-                output['bank_name'] = bank['name']
-                output['source_url'] = bank['forex_page']
-                output['fetch_datetime_utc'] = get_utc_now_iso_string()
-
-                print(json.dumps(output, indent=2))
-
-                print(f"Successfully opened {bank['name']}")
-
-                return output
-
-            except Exception as e:
-                print(f"Error opening {bank['name']}: {str(e)}")
-
-        # Create tasks for all banks
-        if concurrent:
-            tasks = []
-            for bank in banks:
-                tasks.append(open_page(bank))
-
-            outputs = await asyncio.gather(*tasks)
+async def scrape_banks(banks, browser, http_session, scheduler, llm_cache, *, validator, snapshot_writer=None, fingerprints=None, batch_llm=True, send_prompt=None, run_report=None, extraction_pool=None):
+    """
+    Runs one scrape cycle over all banks and returns the per-bank statuses.
+    The browser, HTTP session, cache and fingerprints are owned by the
+    caller so they can be reused across cycles. Each bank is published to
+    current_rate.json, and the UI's per-currency index, as soon as it
+    completes; unchanged banks are left as they are. With `batch_llm`,
+    banks that need Gemini share requests, sent through `send_prompt`
+    (send_prompt_to_gemini unless a stub is given).
+    Per-stage timings go to `run_report` if one is given. Parsing and
+    cleaning run on `extraction_pool`'s worker processes if one is given,
+    otherwise on the event loop. Results are checked by `validator`, which
+    also saves the quarantine list, so callers must pick its file (see
+    live_validator() for the production one).
+    """
+    snapshot_writer = snapshot_writer or SnapshotWriter(on_write=write_rate_index)
+    llm_batcher = None
+    if batch_llm:
+        llm_batcher = LLMBatcher(scheduler, send_prompt or send_prompt_to_gemini, load_prompt_template(), llm_cache)
+
+    async def open_page(bank):
+        if run_report is None:
+            output, source = await scrape_bank(bank, browser, http_session, scheduler, llm_cache, fingerprints, llm_batcher, extraction_pool, validator)
         else:
-            outputs = []
-            for bank in banks:
-                output = await open_page(bank)
-                outputs.append(output)
+            with run_report.bank(bank.name):
+                output, source = await scrape_bank(bank, browser, http_session, scheduler, llm_cache, fingerprints, llm_batcher, extraction_pool, validator)
+        await snapshot_writer.publish_bank(output)
+        # Only once the rates are out may the next poll skip this source as unchanged
+        if source is not None:
+            fingerprints.update(bank.name, **source)
+        return output
+
+    statuses = await scheduler.run(banks, open_page)
+    if llm_batcher is not None and llm_batcher.requests:
+        print(f"Gemini requests this run: {llm_batcher.requests}")
+    if fingerprints:
+        fingerprints.save()
+    validator.save()
+    print_status_report(statuses)
+    if run_report is not None:
+        run_report.write(statuses)
+    return statuses
+
+def write_snapshot(outputs, history_db_path=HISTORY_DB_PATH):
+    """
+    Appends this run's results to the rate history store. current_rate.json
+    is already up to date, since scrape_banks merges each bank as it finishes.
+    """
+    with HistoryStore(history_db_path) as store:
+        changed = store.record_outputs(outputs)
+    print(f"Recorded run in {history_db_path} ({changed} changed rate(s))")
 
-        final_data = {
-            "all_banks": outputs
-        }
+async def open_bank_pages(json_file_path, workers=8, browser_concurrency=4, llm_concurrency=2, headless=False, interactive=True, force=False, batch_llm=True, report_path=RUN_REPORT_PATH, metrics_path=None, extract_workers=None, adaptive=False):
+    """
+    Opens all bank forex pages from nepal_banks.json in separate tabs,
+    scheduling them on a bounded worker pool. With `adaptive`, only the
+    banks the PollPlanner says are due are opened, e.g. for a frequent cron.
+    """
+    banks = load_banks(json_file_path)
+    if not banks:
+        return
+
+    planner = None
+    if adaptive and not force:
+        planner = PollPlanner.from_history()
+        banks = planner.plan(banks)
+        if not banks:
+            planner.save()
+            return
 
-        utc_time = get_utc_now_iso_string()
-        with open(f'rate_{utc_time}.json', 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, indent=4)
+    print(f"Found {len(banks)} banks. Opening forex pages...")
 
-        with open(f'ui/data/current_rate.json', 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, indent=4)
+    llm_cache = LLMResponseCache()
+    # With force, every bank is re-extracted but the fingerprints are still refreshed
+    fingerprints = SourceFingerprints(max_age_seconds=0 if force else FINGERPRINT_MAX_AGE_SECONDS)
+    scheduler = ScrapeScheduler(
+        workers=workers,
+        browser_concurrency=browser_concurrency,
+        llm_concurrency=llm_concurrency,
+    )
+
+    # Chromium is only started if a bank actually needs it
+    browser = create_browser_pool(headless=headless)
+    http_session = create_http_session()
+    extraction_pool = ExtractionPool(workers=extract_workers)
+    run_report = RunReport(report_path, metrics_path)
 
-        print("Press Enter to close the browser...")
-        input()  # Wait for user input before closing
+    try:
+        statuses = await scrape_banks(
+            banks,
+            browser,
+            http_session,
+            scheduler,
+            llm_cache,
+            fingerprints=fingerprints,
+            batch_llm=batch_llm,
+            run_report=run_report,
+            extraction_pool=extraction_pool,
+            validator=live_validator(),
+        )
+        write_snapshot([status['output'] for status in statuses])
+        if planner is not None:
+            planner.record(statuses, run_report)
+            planner.save()
 
+        print(f"LLM cache: {llm_cache.stats()}")
+
+        if interactive and browser.launched:
+            print("Press Enter to close the browser...")
+            input()  # Wait for user input before closing
+
+    finally:
+        extraction_pool.close()
+        await http_session.close()
         # Close the browser
         await browser.close()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape forex rates from Nepali banks")
+    parser.add_argument('--banks', default="nepal_banks.json", help="Path to the bank config")
+    parser.add_argument('--headless', action='store_true', help="Run the browser without a window")
+    parser.add_argument('--non-interactive', action='store_true', help="Don't wait for Enter before closing")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--force', action='store_true', help="Re-extract banks even if their source is unchanged")
+    parser.add_argument('--no-llm-batch', action='store_true', help="Send each bank to Gemini in its own request")
+    parser.add_argument('--report', default=RUN_REPORT_PATH, help="JSON-lines file the per-bank stage timings are appended to")
+    parser.add_argument('--metrics', help="Also write Prometheus textfile metrics to this path")
+    parser.add_argument('--extract-workers', type=int, help="Processes for parsing and cleaning pages (default: up to 4, 0 runs them in-process)")
+    parser.add_argument('--adaptive', action='store_true', help="Only scrape the banks due by their publish history (ignored with --force)")
+    return parser.parse_args()
+
 async def main():
     """Main function to run the program"""
-    json_file_path = "nepal_banks.json"
-    await open_bank_pages(json_file_path, concurrent=False)
+    args = parse_args()
+    await open_bank_pages(
+        args.banks,
+        workers=args.workers,
+        headless=args.headless,
+        interactive=not args.non_interactive,
+        force=args.force,
+        batch_llm=not args.no_llm_batch,
+        report_path=args.report,
+        metrics_path=args.metrics,
+        extract_workers=args.extract_workers,
+        adaptive=args.adaptive,
+    )
 
 if __name__ == "__main__":
     # Run the async function
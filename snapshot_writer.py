@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Callable
+
+CURRENT_RATE_PATH = 'ui/data/current_rate.json'
+
+
+def write_json_atomic(path: str, data: Any, mode: int = 0o644, **dump_kwargs):
+    """
+    Writes JSON to a temp file in the same directory and renames it over
+    `path`, so readers never see a half-written file.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; the UI's web server needs to read them
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def load_snapshot(path: str = CURRENT_RATE_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"all_banks": []}
+
+    if not isinstance(data.get('all_banks'), list):
+        data['all_banks'] = []
+    return data
+
+
+def merge_bank_output(data: Dict[str, Any], output: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replaces the entry for output['bank_name'] in a snapshot, keeping its
+    position, or appends it if the bank is new. Other banks are untouched.
+    """
+    banks = [bank for bank in data.get('all_banks', []) if bank is not None]
+    for index, bank in enumerate(banks):
+        if bank.get('bank_name') == output['bank_name']:
+            banks[index] = output
+            break
+    else:
+        banks.append(output)
+
+    data['all_banks'] = banks
+    data['last_updated_utc'] = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    return data
+
+
+class SnapshotWriter:
+    """
+    Publishes each bank's result into current_rate.json as soon as it is
+    scraped. Each write merges a single bank and is atomic, so a slow or
+    crashing bank never holds back or wipes out the others.
+    """
+
+    def __init__(self, path: str = CURRENT_RATE_PATH, on_write: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.path = path
+        # Called with the merged snapshot after each write, e.g. to rebuild derived files
+        self.on_write = on_write
+        self._lock = asyncio.Lock()
+        self.published = 0
+
+    def _merge_and_write(self, output: Dict[str, Any]):
+        data = merge_bank_output(load_snapshot(self.path), output)
+        write_json_atomic(self.path, data, indent=4)
+        if self.on_write is not None:
+            self.on_write(data)
+
+    async def publish_bank(self, output: Optional[Dict[str, Any]]):
+        if output is None:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._merge_and_write, output)
+            self.published += 1